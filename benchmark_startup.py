@@ -0,0 +1,95 @@
+"""
+Startup benchmark for the chickens agent.
+
+Measures, in fresh interpreters:
+  * the time to import `chickens_app.agent` (what `adk web` and `run_agent` pay up front), and
+  * the time to initialise the toolsets sequentially versus concurrently via `warm_up`.
+
+Usage:
+    python benchmark_startup.py [--runs 5] [--connect]
+
+`--connect` also opens the MCP sessions (requires network access and credentials).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import chickens_app.agent
+print(time.perf_counter() - started)
+"""
+
+WARM_UP_SNIPPET = """
+import asyncio, json, time
+import chickens_app.agent as agent
+from mcp_server.toolsets import LazyToolset, warm_up_toolsets
+
+async def main():
+    connect = {connect}
+    fresh = lambda: [LazyToolset(t.name, t._factory) for t in agent.agent_toolsets]
+
+    sequential = fresh()
+    started = time.perf_counter()
+    for toolset in sequential:
+        await warm_up_toolsets([toolset], connect=connect)
+    sequential_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    report = await agent.warm_up(connect=connect)
+    concurrent_seconds = time.perf_counter() - started
+    print(json.dumps({{"sequential": sequential_seconds, "concurrent": concurrent_seconds, "readiness": report}}))
+
+asyncio.run(main())
+"""
+
+
+def run_snippet(snippet: str) -> str:
+    env = {**os.environ}
+    # The agent refuses to import without a project; any value works for timing.
+    env.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark-project")
+    result = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=PROJECT_ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def summarise(samples: list) -> dict:
+    return {
+        "min_ms": round(min(samples) * 1000, 1),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chickens agent startup.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement.")
+    parser.add_argument("--connect", action="store_true", help="Also open MCP sessions during warm-up.")
+    args = parser.parse_args()
+
+    print(f"⏱️  Importing chickens_app.agent ({args.runs} runs)...")
+    imports = [float(run_snippet(IMPORT_SNIPPET)) for _ in range(args.runs)]
+
+    print(f"⏱️  Initialising toolsets ({args.runs} runs, connect={args.connect})...")
+    warm_ups = [json.loads(run_snippet(WARM_UP_SNIPPET.format(connect=args.connect))) for _ in range(args.runs)]
+
+    results = {
+        "import": summarise(imports),
+        "toolsets_sequential": summarise([w["sequential"] for w in warm_ups]),
+        "toolsets_concurrent": summarise([w["concurrent"] for w in warm_ups]),
+        "readiness": warm_ups[-1]["readiness"],
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
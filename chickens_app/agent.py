@@ -1,42 +1,18 @@
 from google.adk.agents import Agent
-from google.adk.plugins.bigquery_agent_analytics_plugin import BigQueryAgentAnalyticsPlugin
 
 import logging
 import os
-from mcp.client.session import ClientSession
-
-# --- Monkey Patch Start ---
-# PROBLEM: The BigQuery MCP server currently returns a "400 Bad Request" error when the client 
-# attempts to call `resources/list` and `prompts/list` during initialization.
-# This causes the ADK agent to crash before it can even list the available tools.
-#
-# SOLUTION: We monkey-patch the `ClientSession` methods to intercept these specific calls.
-# Instead of sending a request to the server, we immediately return an empty result.
-# This allows the initialization to proceed to `tools/list`, which IS supported.
-print("🔧 Applying MCP ClientSession monkey patch...")
-async def mock_list_resources(self, *args, **kwargs):
-    print("⚠️ Monkey-patched list_resources called - bypassing unsupported server endpoint")
-    class ResourceResult:
-        resources = []
-        nextCursor = None
-    return ResourceResult()
-
-async def mock_list_prompts(self, *args, **kwargs):
-    print("⚠️ Monkey-patched list_prompts called - bypassing unsupported server endpoint")
-    class PromptResult:
-        prompts = []
-        nextCursor = None
-    return PromptResult()
-
-# Apply the patches to the class definition
-ClientSession.list_resources = mock_list_resources
-ClientSession.list_prompts = mock_list_prompts
-print("✅ MCP ClientSession monkey patch applied.")
-# --- Monkey Patch End ---
+# MCP capabilities are negotiated per server (mcp_server/tool_cache.py): optional
+# listings such as resources/list and prompts/list, which the BigQuery MCP server
+# rejects with 400 Bad Request, are only requested if the server advertises them.
 
+import asyncio
 import dotenv
+import functools
+import json
 import os # Import os for better path handling (optional, but good practice)
 import sys # Import sys for exiting the application (critical for Uvicorn stability)
+import time
 from pathlib import Path
 import logging
 
@@ -85,74 +61,233 @@ Note: Your detailed analysis protocol file was not found. Please operate based o
 # -------------------------------------------------------------
 
 
+from mcp_server.schema import get_schema_snapshot, schema_summary
+
 # 1. Define the path to your instructions file
 INSTRUCTION_FILE_PATH = Path(__file__).parent / "instructions.txt"
 
-# 2. Load the instructions from the file with improved error handling
-try:
-    with open(INSTRUCTION_FILE_PATH, 'r') as f:
-        # Load the entire content as a single string
-        comprehensive_instructions = f.read()
-        print(f"✅ Successfully loaded instructions from {INSTRUCTION_FILE_PATH}")
-        # Combine the base and comprehensive instructions
-        agent_instruction_content_template = (
-            """
-            You are a BigQuery data analysis agent for chicken product retail operations.
-            You are able to answer questions on data stored in project-id: '{PROJECT_ID}' on the `{DATASET_NAME}` dataset.
-            
-            ---
-            
-            # Comprehensive Data Analysis Protocol:
-            
-            """
-            + comprehensive_instructions
-            + """
-            
-            # Maps Integration
-            You also have access to Maps tools. Use these for real-world location analysis, finding competition/places and calculating necessary travel routes.
-            Include a hyperlink to an interactive map in your response where appropriate.
-            """
-        )
-        # Replace placeholders with actual values from environment
-        agent_instruction_content = replace_instruction_placeholders(agent_instruction_content_template)
-
-except FileNotFoundError:
-    # CRITICAL FIX: If the file is not found, log the error and use the defined fallback.
-    print(f"❌ CRITICAL ERROR: Instruction file not found at {INSTRUCTION_FILE_PATH}.")
-    print("⚠️ Defining agent with FALLBACK INSTRUCTION. Execution may be limited.")
-    agent_instruction_content = replace_instruction_placeholders(FALLBACK_INSTRUCTION_TEMPLATE)
+# 2. Load the instructions lazily, on the first model call, and cache them.
+# The rendered text contains no ADK state placeholders, so an instruction
+# provider (which skips state injection) is equivalent to passing the string.
+@functools.lru_cache(maxsize=1)
+def load_agent_instruction() -> str:
+    """Reads instructions.txt (or the fallback) and renders the placeholders."""
+    try:
+        with open(INSTRUCTION_FILE_PATH, 'r') as f:
+            # Load the entire content as a single string
+            comprehensive_instructions = f.read()
+            print(f"✅ Successfully loaded instructions from {INSTRUCTION_FILE_PATH}")
+    except FileNotFoundError:
+        # CRITICAL FIX: If the file is not found, log the error and use the defined fallback.
+        print(f"❌ CRITICAL ERROR: Instruction file not found at {INSTRUCTION_FILE_PATH}.")
+        print("⚠️ Defining agent with FALLBACK INSTRUCTION. Execution may be limited.")
+        return replace_instruction_placeholders(FALLBACK_INSTRUCTION_TEMPLATE)
+
+    # Combine the base and comprehensive instructions
+    agent_instruction_content_template = (
+        """
+        You are a BigQuery data analysis agent for chicken product retail operations.
+        You are able to answer questions on data stored in project-id: '{PROJECT_ID}' on the `{DATASET_NAME}` dataset.
+        
+        ---
+        
+        # Comprehensive Data Analysis Protocol:
+        
+        """
+        + comprehensive_instructions
+        + """
+        
+        # Maps Integration
+        You also have access to Maps tools. Use these for real-world location analysis, finding competition/places and calculating necessary travel routes.
+        Include a hyperlink to an interactive map in your response where appropriate.
+        """
+    )
+    # Replace placeholders with actual values from environment
+    return replace_instruction_placeholders(agent_instruction_content_template)
+
+
+# The dataset schema snapshot is appended so the first useful query can run on
+# turn one, without list_table_ids / get_table_info discovery calls.
+# SCHEMA_INJECTION: "instruction" (default) or "tool" (get_dataset_schema only).
+SCHEMA_INJECTION = os.getenv("SCHEMA_INJECTION", "instruction").lower()
+
+@functools.lru_cache(maxsize=2)
+def render_schema_section(version: str, summary: str) -> str:
+    return f"""
+        # Dataset Schema (snapshot {version})
+        All tables and views of `{GOOGLE_CLOUD_PROJECT}.{BIGQUERY_DATASET}` with their columns
+        (columns without a type are computed by the view).
+        Do NOT call list_table_ids or get_table_info for the tables listed with columns; write the query directly.
+{summary}
+        """
+
+
+def agent_instruction_provider(context) -> str:
+    instruction = load_agent_instruction()
+    if SCHEMA_INJECTION == "instruction":
+        try:
+            snapshot = get_schema_snapshot()
+            instruction += render_schema_section(snapshot["version"], schema_summary(snapshot))
+        except Exception as e:
+            logging.warning(f"Schema snapshot unavailable, agent will discover tables itself: {e}")
+    return instruction
 
 
 # 3. Initialize Tools
+# Toolsets are built on first use (or concurrently by the warm-up plugin on the
+# first run), so importing this module does no credential or network work.
 from mcp_server.tools import (
+    MCP_GATEWAY_URL,
     get_maps_mcp_toolset,
     get_bigquery_mcp_toolset,
-    get_local_mcp_toolset
+    get_local_mcp_toolset,
+    get_gateway_mcp_toolset
+)
+from mcp_server.maps_cache import MapsCachingToolset, MapsResultCache
+from mcp_server.sql_cache import SqlCachingToolset, SqlResultCache, bigquery_table_versions
+from mcp_server.toolsets import ConcurrencyLimitedToolset, LazyToolset, toolset_readiness
+from chickens_app.result_shaping import ResultShapingPlugin, get_result_page
+from chickens_app.plugins import LazyPlugin, ToolsetWarmupPlugin
+from chickens_app.cassette import (
+    CASSETTE_MODE, CASSETTE_PATH, Cassette, CassettePlugin, RecordingToolset, ReplayToolset, cassette_latency,
 )
 
-maps_toolset = get_maps_mcp_toolset()
-bigquery_toolset = get_bigquery_mcp_toolset()
-local_toolset = get_local_mcp_toolset()
+# Results of repeated BigQuery SQL and schema calls are served from memory,
+# keyed by normalized SQL and table last-modified times. Built with the
+# BigQuery toolset. Stats: sql_cache.stats()
+sql_cache = None
+
+def get_cached_bigquery_mcp_toolset():
+    global sql_cache
+    sql_cache = sql_cache or SqlResultCache(
+        max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", "512")),
+        version_provider=bigquery_table_versions(GOOGLE_CLOUD_PROJECT, BIGQUERY_DATASET),
+        version_ttl=float(os.getenv("SQL_CACHE_VERSION_TTL", "60")),
+        spill_dir=os.getenv("SQL_CACHE_SPILL_DIR") or None,
+    )
+    return SqlCachingToolset(get_bigquery_mcp_toolset(), sql_cache)
+
+# Maps results persist in SQLite (MAPS_CACHE_PATH), keyed by normalized text and
+# quantized coordinates. Pre-warm routes with `python -m mcp_server.maps_cache --prewarm`.
+# The database is opened on first use. Stats: maps_cache.stats()
+maps_cache = None
+
+def get_cached_maps_mcp_toolset():
+    global maps_cache
+    maps_cache = maps_cache or MapsResultCache()
+    return MapsCachingToolset(get_maps_mcp_toolset(), maps_cache)
+
+maps_toolset = LazyToolset("maps", get_cached_maps_mcp_toolset)
+bigquery_toolset = LazyToolset("bigquery", get_cached_bigquery_mcp_toolset)
+local_toolset = LazyToolset("local", get_local_mcp_toolset)
 
 # ADK Agent accepts a list of callables as tools
 # MCPToolset is likely an object that needs to be passed directly or its tools extracted.
 # Based on user example: tools=[maps_toolset, bigquery_toolset]
 # We also want to keep consult_marketing_expert and get_store_temperature.
-agent_tools = [
+agent_toolsets = [
      maps_toolset, 
      bigquery_toolset, 
      local_toolset
 ]
+# With MCP_GATEWAY_URL set, one connection to the MCP gateway (python -m mcp_server.gateway)
+# replaces the three toolsets; caching and upstream limits then live in the gateway.
+if MCP_GATEWAY_URL:
+    agent_toolsets = [LazyToolset("gateway", get_gateway_mcp_toolset)]
+# Parallel function calls from one model response run concurrently (ADK gathers
+# them and returns the responses in request order); each toolset caps how many
+# of its calls are in flight at once. TOOLSET_CONCURRENCY overrides, e.g. '{"bigquery": 2}'.
+TOOLSET_CONCURRENCY = {"maps": 4, "bigquery": 4, "local": 8, "gateway": 16, **json.loads(os.getenv("TOOLSET_CONCURRENCY", "{}"))}
+
+# Record/replay of model and tool traffic (CASSETTE_MODE=record|replay, see cassette.py).
+# On replay the real toolsets are never built: tools are served from the cassette.
+cassette = Cassette(CASSETTE_PATH, cassette_latency()) if CASSETTE_MODE != "off" else None
+
+
+def with_cassette(toolset: LazyToolset):
+    if CASSETTE_MODE == "record":
+        return RecordingToolset(toolset, cassette)
+    if CASSETTE_MODE == "replay":
+        return ReplayToolset(toolset.name, cassette)
+    return toolset
+
+
+limited_toolsets = [
+    ConcurrencyLimitedToolset(with_cassette(toolset), TOOLSET_CONCURRENCY.get(toolset.name, 4))
+    for toolset in agent_toolsets
+]
+# Toolsets that need building and connecting before the first turn.
+live_toolsets = [] if CASSETTE_MODE == "replay" else agent_toolsets
+# Owns the toolset warm-up: its first-run hook and warm_up() below share one task.
+toolset_warmup_plugin = ToolsetWarmupPlugin(live_toolsets)
+# get_result_page pages through large results that ResultShapingPlugin truncated.
+agent_tools = limited_toolsets + [get_result_page]
+
+
+def tool_timings() -> list:
+    """Recent per-call timings (queued and run time) across all toolsets, oldest first."""
+    return sorted((t for toolset in limited_toolsets for t in toolset.timings), key=lambda t: t["finished_at"])
+
+
+async def _warm_up_step(build, failure: str) -> dict:
+    """Runs a blocking build step in a thread; failures are reported, not raised."""
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(build)
+        status, error = "ready", None
+    except Exception as e:
+        logging.warning(f"{failure}: {e}")
+        status, error = "failed", str(e)
+    return {"status": status, "build_ms": round((time.perf_counter() - started) * 1000, 1), "error": error}
+
+
+async def warm_up(connect: bool = True) -> dict:
+    """
+    Builds (and connects) all toolsets, the schema snapshot and the analytics
+    plugin concurrently. Returns the readiness report.
+    """
+    report, schema, analytics = await asyncio.gather(
+        toolset_warmup_plugin.warm_up(connect=connect),
+        # The instruction provider falls back to discovery calls, so this is not fatal.
+        _warm_up_step(get_schema_snapshot, "Schema snapshot unavailable, agent will discover tables itself"),
+        _warm_up_step(bq_logging_plugin.resolve, "Analytics plugin unavailable"),
+    )
+    return {**report, "schema": schema, "analytics": analytics}
+
+
+def readiness() -> dict:
+    """Returns the status and init timings of each toolset."""
+    return toolset_readiness(live_toolsets)
 
 
 # --- Initialize the Plugin ---
-# The BigQueryAgentAnalyticsPlugin logs all agent interactions (prompts, tool calls, responses)
-# to a BigQuery table. This is crucial for auditing, debugging, and analyzing agent performance.
-bq_logging_plugin = BigQueryAgentAnalyticsPlugin(
-    project_id=GOOGLE_CLOUD_PROJECT, # project_id is required input from user
-    dataset_id=BIGQUERY_DATASET, # dataset_id is required input from user
-    table_id="agent_events" # Optional: defaults to "agent_events". The plugin automatically creates this table if it doesn't exist.
-)
+# The analytics plugin logs all agent interactions (prompts, tool calls, responses) to the
+# BigQuery table of ADK's BigQueryAgentAnalyticsPlugin. This is crucial for auditing, debugging,
+# and analyzing agent performance. BatchedAnalyticsPlugin buffers the events and writes them in bulk off the request path,
+# spooling to disk while BigQuery is slow or unreachable.
+# The plugin (and pyarrow / BigQuery Storage) is built on warm-up or its first callback, not at import.
+ANALYTICS_SINK = os.getenv("ANALYTICS_SINK", "bigquery").lower()
+
+def build_analytics_plugin():
+    from chickens_app.analytics import ANALYTICS_SPOOL_DIR, BatchedAnalyticsPlugin, FileAnalyticsSink
+
+    return BatchedAnalyticsPlugin(
+        project_id=GOOGLE_CLOUD_PROJECT, # project_id is required input from user
+        dataset_id=BIGQUERY_DATASET, # dataset_id is required input from user
+        table_id="agent_events", # Optional: defaults to "agent_events". The plugin automatically creates this table if it doesn't exist.
+        max_queue=int(os.getenv("ANALYTICS_MAX_QUEUE", "10000")),
+        batch_size=int(os.getenv("ANALYTICS_BATCH_SIZE", "500")),
+        flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2")),
+        # Only applied while the buffer is above its high-water mark (80% of max_queue);
+        # below that every event is kept. User messages, invocation events and errors are never sampled.
+        sample_rate=float(os.getenv("ANALYTICS_SAMPLE_RATE", "0.1")),
+        spool_dir=ANALYTICS_SPOOL_DIR or None,
+        # ANALYTICS_SINK: "bigquery" (default), or "jsonl" / "parquet" for rotating local
+        # files in ANALYTICS_FILE_DIR (load them later with load_analytics.py).
+        sink=FileAnalyticsSink(file_format=ANALYTICS_SINK) if ANALYTICS_SINK != "bigquery" else None,
+    )
+
+bq_logging_plugin = LazyPlugin("bigquery_agent_analytics", build_analytics_plugin)
 
 # 4. Define the Agent object
 # This is the main "Brain" of the application.
@@ -160,8 +295,8 @@ root_agent = Agent(
     model=os.getenv("MODEL_NAME", "gemini-2.5-flash"),
     name="chickens_agent",
     description="Agent that answers questions about chicken product retail data, waste optimization, and stock management by executing SQL queries.",
-    # Use the content determined in the try/except block (either from file or fallback)
-    instruction=agent_instruction_content, 
+    # Instructions are loaded on the first model call (either from file or fallback)
+    instruction=agent_instruction_provider, 
     tools=agent_tools
 )
 
@@ -170,11 +305,44 @@ root_agent = Agent(
 # 5. Define the Agent Getter Function
 # 5. Define the App object
 from google.adk.apps import App
+from chickens_app.context_cache import InstructionCache, LocalCachedContentClient
+from chickens_app.compaction import SessionCompactionPlugin
+from chickens_app.latency import LatencyPlugin
+from chickens_app.memo import ToolMemoPlugin
+from chickens_app.plugins import InstructionCachePlugin
+
+# Provider-side caching of the instruction + tool declarations.
+# CONTEXT_CACHE: "gemini" (default), "local" (in-process stand-in, for offline runs such as load_test.py) or "off".
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "gemini").lower()
+# Per-turn latency breakdown (model / tool / queue / A2A). Observe-only, so it goes first.
+latency_plugin = LatencyPlugin()
+for toolset in limited_toolsets:
+    toolset.listeners.append(latency_plugin.record_tool_timing)
+app_plugins = [latency_plugin, bq_logging_plugin, toolset_warmup_plugin]
+# Must precede the instruction cache: replayed responses short-circuit the model call.
+if cassette is not None:
+    app_plugins.append(CassettePlugin(cassette, CASSETTE_MODE))
+if CONTEXT_CACHE != "off":
+    instruction_cache = InstructionCache(
+        client=LocalCachedContentClient(os.getenv("CONTEXT_CACHE_LOCAL_PATH")) if CONTEXT_CACHE == "local" else None,
+        ttl_seconds=int(os.getenv("CONTEXT_CACHE_TTL", "3600")),
+    )
+    app_plugins.append(InstructionCachePlugin(instruction_cache))
+# Per-session memoization of repeat tool calls (MEMO_TOOL_TTLS overrides per-tool staleness).
+tool_memo_plugin = ToolMemoPlugin()
+app_plugins.append(tool_memo_plugin)
+# Token-triggered compaction of long sessions (COMPACTION_TRIGGER_TOKENS, "off" via COMPACTION).
+if os.getenv("COMPACTION", "on").lower() != "off":
+    compaction_plugin = SessionCompactionPlugin()
+    app_plugins.append(compaction_plugin)
+# Result shaping replaces tool results, and the first plugin returning a value
+# wins, so it must stay last.
+app_plugins.append(ResultShapingPlugin())
 
 app = App(
     name="chickens_app",
     root_agent=root_agent,
-    plugins=[bq_logging_plugin]
+    plugins=app_plugins
 )
 
 # 6. Define the Agent Getter Function
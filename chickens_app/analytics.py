@@ -0,0 +1,509 @@
+import asyncio
+import atexit
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.plugins.bigquery_agent_analytics_plugin import BigQueryLoggerConfig
+from google.cloud.bigquery_storage_v1 import types as bq_storage_types
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# Where batches go while the sink is slow or unavailable ("" disables spooling).
+ANALYTICS_SPOOL_DIR = os.getenv("ANALYTICS_SPOOL_DIR", str(PROJECT_ROOT / ".cache" / "analytics_spool"))
+# Events that are never sampled away under load.
+ALWAYS_KEEP = {"USER_MESSAGE_RECEIVED", "INVOCATION_STARTING", "INVOCATION_COMPLETED", "LLM_ERROR", "TOOL_ERROR"}
+ROW_FIELDS = (
+    "timestamp", "event_type", "agent", "session_id", "invocation_id",
+    "user_id", "content", "error_message", "is_truncated",
+)
+# Longer event content is cut to this many characters (the row is marked `is_truncated`).
+MAX_CONTENT_LENGTH = 500
+# Same columns and types as the `agent_events` table of ADK's BigQueryAgentAnalyticsPlugin.
+AGENT_EVENTS_SCHEMA = pa.schema(
+    [pa.field("timestamp", pa.timestamp("us", tz="UTC"), nullable=False)]
+    + [pa.field(name, pa.string()) for name in ROW_FIELDS[1:-1]]
+    + [pa.field("is_truncated", pa.bool_())]
+)
+# Where FileAnalyticsSink writes event files.
+ANALYTICS_FILE_DIR = os.getenv("ANALYTICS_FILE_DIR", str(PROJECT_ROOT / ".cache" / "analytics"))
+FILE_SUFFIXES = {"jsonl": ".jsonl.gz", "parquet": ".parquet"}
+
+
+def agent_events_schema() -> list:
+    """The `agent_events` table schema as BigQuery schema fields."""
+    from google.cloud import bigquery
+
+    return (
+        [bigquery.SchemaField("timestamp", "TIMESTAMP", mode="REQUIRED")]
+        + [bigquery.SchemaField(name, "STRING") for name in ROW_FIELDS[1:-1]]
+        + [bigquery.SchemaField("is_truncated", "BOOLEAN")]
+    )
+
+
+def _encode_row(row: dict) -> dict:
+    return {**row, "timestamp": row["timestamp"].isoformat()}
+
+
+def _decode_row(row: dict) -> dict:
+    return {**row, "timestamp": datetime.fromisoformat(row["timestamp"])}
+
+
+class AnalyticsSpool:
+    """
+    Local disk spool for event batches the sink could not take.
+
+    Each batch is one JSONL file; files are replayed oldest first. When the
+    spool exceeds `max_bytes` the oldest files are dropped.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def write(self, rows: list) -> int:
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            name = f"{time.time_ns()}-{uuid.uuid4().hex[:6]}.jsonl"
+            tmp = self.path / f".{name}"
+            with tmp.open("w") as f:
+                for row in rows:
+                    f.write(json.dumps(_encode_row(row), default=str) + "\n")
+            os.replace(tmp, self.path / name)
+            return self._trim()
+
+    def _trim(self) -> int:
+        files = self.files()
+        total, dropped = sum(path.stat().st_size for path in files), 0
+        while files and total > self.max_bytes:
+            oldest = files.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
+            dropped += 1
+        return dropped
+
+    def files(self) -> list:
+        return sorted(self.path.glob("*.jsonl")) if self.path.exists() else []
+
+    def read(self, path: Path) -> list:
+        with path.open() as f:
+            return [_decode_row(json.loads(line)) for line in f if line.strip()]
+
+
+class BigQueryAppendSink:
+    """
+    Appends batches to the `agent_events` table with the BigQuery Storage Write API, one append per batch.
+
+    The table (day-partitioned on `timestamp`) and the write client are
+    created on the first write, so building the sink does no I/O.
+    """
+
+    def __init__(self, project_id: str, dataset_id: str, table_id: str = "agent_events"):
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self._write_client = None
+        self._init_lock: asyncio.Lock | None = None
+
+    def _create_table(self):
+        from google.cloud import bigquery
+
+        table = bigquery.Table(f"{self.project_id}.{self.dataset_id}.{self.table_id}", schema=agent_events_schema())
+        table.time_partitioning = bigquery.TimePartitioning(type_="DAY", field="timestamp")
+        bigquery.Client(project=self.project_id).create_table(table, exists_ok=True)
+
+    async def _client(self):
+        if self._write_client is None:
+            self._init_lock = self._init_lock or asyncio.Lock()
+            async with self._init_lock:
+                if self._write_client is None:
+                    from google.cloud.bigquery_storage_v1.services.big_query_write import BigQueryWriteAsyncClient
+
+                    await asyncio.to_thread(self._create_table)
+                    self._write_client = BigQueryWriteAsyncClient()
+        return self._write_client
+
+    async def write(self, rows: list):
+        client = await self._client()
+        batch = pa.RecordBatch.from_pylist([{name: row.get(name) for name in ROW_FIELDS} for row in rows], schema=AGENT_EVENTS_SCHEMA)
+        request = bq_storage_types.AppendRowsRequest(
+            write_stream=f"projects/{self.project_id}/datasets/{self.dataset_id}/tables/{self.table_id}/_default"
+        )
+        request.arrow_rows.writer_schema.serialized_schema = AGENT_EVENTS_SCHEMA.serialize().to_pybytes()
+        request.arrow_rows.rows.serialized_record_batch = batch.serialize().to_pybytes()
+        async for response in await client.append_rows(iter([request])):
+            if response.error.code != 0:
+                raise RuntimeError(f"BigQuery append failed: {response.error.message}")
+
+    async def close(self):
+        if self._write_client is not None:
+            await self._write_client.transport.close()
+            self._write_client = None
+
+
+class FileAnalyticsSink:
+    """
+    Writes event batches to rotating local files instead of BigQuery.
+
+    Files hold the `agent_events` columns as gzip-compressed JSONL or
+    zstd-compressed Parquet (one row group per batch). A file is rotated after
+    `max_file_bytes` or `max_file_seconds`; until then it carries an
+    `.inprogress` suffix, so readers and `load_analytics.py` only see complete
+    files. Writes run in a worker thread, off the event loop.
+
+    Args:
+        directory: Where the files go.
+        file_format: "jsonl" or "parquet".
+    """
+
+    def __init__(self, directory: str = ANALYTICS_FILE_DIR, file_format: str = "jsonl",
+                 max_file_bytes: int = 64 * 1024 * 1024, max_file_seconds: float = 300.0):
+        if file_format not in FILE_SUFFIXES:
+            raise ValueError(f"Unsupported analytics file format '{file_format}' (use jsonl or parquet)")
+        self.directory = Path(directory)
+        self.file_format = file_format
+        self.max_file_bytes = max_file_bytes
+        self.max_file_seconds = max_file_seconds
+        self._path: Path | None = None
+        self._opened_at = 0.0
+        self._writer = None
+        self._lock = threading.Lock()
+        # An unclosed Parquet file has no footer; finish the current file at exit.
+        atexit.register(self._close)
+
+    async def write(self, rows: list):
+        await asyncio.to_thread(self._write, rows)
+
+    def _write(self, rows: list):
+        with self._lock:
+            if self._path is not None and (
+                self._path.stat().st_size >= self.max_file_bytes
+                or time.monotonic() - self._opened_at >= self.max_file_seconds
+            ):
+                self._rotate()
+            if self._path is None:
+                self._open()
+            if self.file_format == "parquet":
+                table = pa.Table.from_pylist([{name: row.get(name) for name in ROW_FIELDS} for row in rows], schema=AGENT_EVENTS_SCHEMA)
+                self._writer.write_table(table)
+            else:
+                lines = "".join(json.dumps(_encode_row({name: row.get(name) for name in ROW_FIELDS}), default=str) + "\n" for row in rows)
+                self._writer.write(lines.encode())
+                self._writer.flush()
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        name = f"agent_events-{stamp}-{uuid.uuid4().hex[:6]}{FILE_SUFFIXES[self.file_format]}"
+        self._path = self.directory / f"{name}.inprogress"
+        self._opened_at = time.monotonic()
+        if self.file_format == "parquet":
+            self._writer = pq.ParquetWriter(self._path, AGENT_EVENTS_SCHEMA, compression="zstd")
+        else:
+            self._writer = gzip.open(self._path, "ab")
+
+    def _rotate(self):
+        if self._path is None:
+            return
+        self._writer.close()
+        os.replace(self._path, self._path.with_suffix(""))
+        logger.info(f"Rotated analytics file {self._path.with_suffix('').name}")
+        self._path, self._writer = None, None
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+    def _close(self):
+        with self._lock:
+            self._rotate()
+
+
+def event_files(directory: str = ANALYTICS_FILE_DIR) -> list:
+    """Completed event files in `directory`, oldest first."""
+    path = Path(directory)
+    if not path.exists():
+        return []
+    return sorted(file for suffix in FILE_SUFFIXES.values() for file in path.glob(f"*{suffix}"))
+
+
+def read_event_files(files: list) -> pa.Table:
+    """Reads event files of either format into one Arrow table with the `agent_events` schema."""
+    tables = []
+    for file in files:
+        if str(file).endswith(FILE_SUFFIXES["parquet"]):
+            tables.append(pq.read_table(file, schema=AGENT_EVENTS_SCHEMA))
+        else:
+            with gzip.open(file, "rt") as f:
+                rows = [_decode_row(json.loads(line)) for line in f if line.strip()]
+            tables.append(pa.Table.from_pylist(rows, schema=AGENT_EVENTS_SCHEMA))
+    return pa.concat_tables(tables) if tables else AGENT_EVENTS_SCHEMA.empty_table()
+
+
+def _text(content) -> str:
+    """The text and function-call parts of a `types.Content`, joined on one line."""
+    if content is None or not content.parts:
+        return ""
+    texts = []
+    for part in content.parts:
+        if part.text:
+            texts.append(part.text)
+        elif part.function_call:
+            texts.append(f"call {part.function_call.name}({_json(part.function_call.args)})")
+        elif part.function_response:
+            texts.append(f"response {part.function_response.name}")
+    return " ".join(texts)
+
+
+def _json(value) -> str:
+    return json.dumps(value, default=str) if not isinstance(value, str) else value
+
+
+class BatchedAnalyticsPlugin(BasePlugin):
+    """
+    Logs agent events to the `agent_events` table with a buffered, batched write path.
+
+    Records the same event types and columns as ADK's `BigQueryAgentAnalyticsPlugin`
+    and honours its `BigQueryLoggerConfig` (enabled, allow/deny lists,
+    `content_formatter`), but instead of one write task per event, events go
+    into a bounded in-memory buffer and a background flusher writes them to
+    the sink in bulk, when `batch_size` rows are waiting or every
+    `flush_interval` seconds. Logging an event is a non-blocking append, so
+    analytics never adds latency to a turn:
+
+    * above `high_water` of the buffer, events outside ALWAYS_KEEP are
+      sampled at `sample_rate` (below it every event is kept); a full buffer
+      drops new events (counted);
+    * batches the sink rejects or does not take within `write_timeout` are
+      spooled to `spool_dir` and replayed once the sink accepts writes again;
+      while it is unavailable, batches go straight to the spool.
+
+    Args:
+        sink: Object with `async write(rows)` and `async close()`. Defaults to
+            a `BigQueryAppendSink` for the table; use `FileAnalyticsSink` to
+            write local files instead.
+        spool_dir: Where to spool batches; None disables spooling (they are dropped).
+    """
+
+    def __init__(self, project_id: str, dataset_id: str, table_id: str = "agent_events",
+                 config: BigQueryLoggerConfig | None = None, *, sink=None, max_queue: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 2.0, high_water: float = 0.8,
+                 sample_rate: float = 0.1, write_timeout: float = 10.0, retry_interval: float = 30.0,
+                 spool_dir: str | None = None, max_spool_bytes: int = 256 * 1024 * 1024,
+                 max_content_length: int = MAX_CONTENT_LENGTH, name: str = "bigquery_agent_analytics"):
+        super().__init__(name=name)
+        self.config = config or BigQueryLoggerConfig()
+        self.sink = sink or BigQueryAppendSink(project_id, dataset_id, table_id)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.high_water = int(max_queue * high_water)
+        self.sample_rate = sample_rate
+        self.write_timeout = write_timeout
+        self.retry_interval = retry_interval
+        self.max_content_length = max_content_length
+        self.spool = AnalyticsSpool(spool_dir, max_spool_bytes) if spool_dir else None
+        self.counters = defaultdict(int)
+        self._buffer = deque()
+        self._wake: asyncio.Event | None = None
+        self._flusher: asyncio.Task | None = None
+        self._unavailable_until = 0.0
+        atexit.register(self._spool_remaining)
+
+    # --- Callbacks --------------------------------------------------------
+
+    async def on_user_message_callback(self, *, invocation_context, user_message):
+        self._log_event("USER_MESSAGE_RECEIVED", invocation_context, f"User Content: {_text(user_message)}")
+
+    async def before_run_callback(self, *, invocation_context):
+        self._log_event("INVOCATION_STARTING", invocation_context)
+
+    async def after_run_callback(self, *, invocation_context):
+        self._log_event("INVOCATION_COMPLETED", invocation_context)
+
+    async def before_agent_callback(self, *, agent, callback_context):
+        self._log_event("AGENT_STARTING", callback_context, f"Agent Name: {agent.name}")
+
+    async def after_agent_callback(self, *, agent, callback_context):
+        self._log_event("AGENT_COMPLETED", callback_context, f"Agent Name: {agent.name}")
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        prompt = " | ".join(f"{content.role}: {_text(content)}" for content in llm_request.contents or [])
+        self._log_event("LLM_REQUEST", callback_context, f"Model: {llm_request.model} | Prompt: {prompt}")
+
+    async def after_model_callback(self, *, callback_context, llm_response):
+        usage = llm_response.usage_metadata
+        tokens = f" | Token Usage: prompt={usage.prompt_token_count}, total={usage.total_token_count}" if usage else ""
+        self._log_event("LLM_RESPONSE", callback_context, f"Response: {_text(llm_response.content)}{tokens}")
+
+    async def on_model_error_callback(self, *, callback_context, llm_request, error):
+        self._log_event("LLM_ERROR", callback_context, error=error)
+
+    async def before_tool_callback(self, *, tool, tool_args, tool_context):
+        self._log_event("TOOL_STARTING", tool_context, f"Tool Name: {tool.name}, Arguments: {_json(tool_args)}")
+
+    async def after_tool_callback(self, *, tool, tool_args, tool_context, result):
+        self._log_event("TOOL_COMPLETED", tool_context, f"Tool Name: {tool.name}, Result: {_json(result)}")
+
+    async def on_tool_error_callback(self, *, tool, tool_args, tool_context, error):
+        self._log_event("TOOL_ERROR", tool_context, f"Tool Name: {tool.name}, Arguments: {_json(tool_args)}", error)
+
+    # --- Buffering --------------------------------------------------------
+
+    def _accepts(self, event_type: str) -> bool:
+        config = self.config
+        if not config.enabled:
+            return False
+        if config.event_denylist and event_type in config.event_denylist:
+            return False
+        return not (config.event_allowlist and event_type not in config.event_allowlist)
+
+    def _log_event(self, event_type: str, context, content: str | None = None, error: Exception | None = None):
+        """Queues one event row. Never raises: analytics must not break a turn."""
+        try:
+            if not self._accepts(event_type):
+                return
+            depth = len(self._buffer)
+            if depth >= self.max_queue:
+                self.counters["dropped"] += 1
+                return
+            if depth >= self.high_water and event_type not in ALWAYS_KEEP and random.random() >= self.sample_rate:
+                self.counters["sampled_out"] += 1
+                return
+            self._buffer.append(self._row(event_type, context, content, error))
+            self.counters["queued"] += 1
+            self._ensure_flusher()
+            if len(self._buffer) >= self.batch_size:
+                self._wake.set()
+        except Exception as e:
+            logger.warning(f"Could not log {event_type} analytics event: {e}")
+
+    def _row(self, event_type: str, context, content: str | None, error: Exception | None) -> dict:
+        # Invocation contexts expose the agent; callback and tool contexts its name.
+        session = context.session
+        agent = context.agent.name if hasattr(context, "agent") else context.agent_name
+        if content is not None and self.config.content_formatter:
+            try:
+                content = self.config.content_formatter(content)
+            except Exception as e:
+                logger.warning(f"Analytics content formatter failed: {e}")
+        truncated = content is not None and len(content) > self.max_content_length
+        return {
+            "timestamp": datetime.now(timezone.utc),
+            "event_type": event_type,
+            "agent": agent,
+            "session_id": session.id,
+            "invocation_id": context.invocation_id,
+            "user_id": session.user_id,
+            "content": content[:self.max_content_length] + "...[truncated]" if truncated else content,
+            "error_message": str(error) if error is not None else None,
+            "is_truncated": truncated,
+        }
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._flusher is None or self._flusher.done() or self._flusher.get_loop() is not loop:
+            self._wake = asyncio.Event()
+            self._flusher = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Analytics flush failed: {e}")
+
+    def _take(self, limit: int) -> list:
+        rows = []
+        while self._buffer and len(rows) < limit:
+            rows.append(self._buffer.popleft())
+        return rows
+
+    async def flush(self):
+        """Writes everything buffered, in batches, then replays the spool if the sink is healthy."""
+        while self._buffer:
+            await self._write(self._take(self.batch_size))
+        await self._replay_spool()
+
+    async def _write(self, rows: list) -> bool:
+        if not rows:
+            return True
+        if time.monotonic() >= self._unavailable_until:
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.sink.write(rows), timeout=self.write_timeout)
+                self.counters["written"] += len(rows)
+                self.counters["batches"] += 1
+                logger.debug(f"Wrote {len(rows)} analytics events in {(time.perf_counter() - started) * 1000:.0f}ms")
+                return True
+            except Exception as e:
+                self._unavailable_until = time.monotonic() + self.retry_interval
+                logger.warning(f"Analytics sink unavailable, spooling for {self.retry_interval:.0f}s: {e!r}")
+        await self._spool(rows)
+        return False
+
+    async def _spool(self, rows: list):
+        if self.spool is None:
+            self.counters["dropped"] += len(rows)
+            return
+        try:
+            self.counters["spool_dropped_files"] += await asyncio.to_thread(self.spool.write, rows)
+            self.counters["spooled"] += len(rows)
+        except OSError as e:
+            self.counters["dropped"] += len(rows)
+            logger.warning(f"Could not spool {len(rows)} analytics events: {e}")
+
+    async def _replay_spool(self):
+        if self.spool is None or time.monotonic() < self._unavailable_until:
+            return
+        for path in await asyncio.to_thread(self.spool.files):
+            rows = await asyncio.to_thread(self.spool.read, path)
+            # Unlink first: a failed write spools the rows again as a new file.
+            path.unlink(missing_ok=True)
+            if not await self._write(rows):
+                return
+            self.counters["replayed"] += len(rows)
+
+    def _spool_remaining(self):
+        """At interpreter exit, keeps what is still buffered instead of losing it."""
+        rows = self._take(len(self._buffer))
+        if rows and self.spool is not None:
+            self.spool.write(rows)
+            logger.info(f"Spooled {len(rows)} buffered analytics events at exit")
+
+    async def close(self):
+        """Flushes the buffer and closes the sink."""
+        if self._flusher is not None and not self._flusher.done() and self._flusher.get_loop() is asyncio.get_running_loop():
+            self._flusher.cancel()
+        self._flusher = None
+        try:
+            await asyncio.wait_for(self.flush(), timeout=self.config.shutdown_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out flushing analytics events; spooling the rest.")
+            await self._spool(self._take(len(self._buffer)))
+        await self.sink.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "buffered": len(self._buffer),
+            "spool_files": len(self.spool.files()) if self.spool else 0,
+            "sink_available": time.monotonic() >= self._unavailable_until,
+        }
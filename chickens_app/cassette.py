@@ -0,0 +1,258 @@
+"""
+Record/replay of model and tool traffic, for deterministic offline runs.
+
+In record mode every Gemini request/response and every tool call (with the
+tool declarations of each toolset) is written to a cassette, keyed by a hash
+of the canonical request. In replay mode they are served from the cassette,
+so full agent runs need no network and finish at CPU speed, with optional
+injected latency.
+
+A cassette is a directory holding `records.bin` (length-prefixed,
+zlib-compressed JSON records) and `index.jsonl` (one `[key, offset]` line
+per record), both append-only. A key recorded several times replays its
+responses in order.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import List, Optional
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models.llm_response import LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.genai import types
+
+from chickens_app.memo import canonical_args
+from mcp_server.toolsets import WrappedTool, WrappingToolset
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# CASSETTE_MODE: "off" (default), "record" or "replay".
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", str(PROJECT_ROOT / ".cache" / "cassettes" / "default"))
+# Latency injected on replay: "recorded" replays the recorded latencies, a number is milliseconds per call.
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "0")
+
+_HEADER = struct.Struct(">I")
+# Function call ids are random per run; they must not change request keys.
+_VOLATILE = re.compile(r"\badk-[0-9a-f-]{36}\b")
+
+
+def canonical_key(kind: str, payload) -> str:
+    text = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{kind}:{_VOLATILE.sub('*', text)}".encode()).hexdigest()[:32]
+
+
+def llm_request_key(llm_request) -> str:
+    """Key of a model request: model, conversation contents, system instruction and tool names."""
+    contents = [content.model_dump(mode="json", exclude_none=True) for content in llm_request.contents]
+    for content in contents:
+        for part in content.get("parts", []):
+            for field in ("function_call", "function_response"):
+                if field in part:
+                    part[field].pop("id", None)
+            part.pop("thought_signature", None)
+    config = llm_request.config
+    return canonical_key("model", {
+        "model": llm_request.model,
+        "contents": contents,
+        "system_instruction": str(config.system_instruction or "") if config else "",
+        "tools": sorted(llm_request.tools_dict),
+    })
+
+
+def tool_call_key(tool_name: str, args: dict) -> str:
+    return canonical_key("tool", {"tool": tool_name, "args": canonical_args(tool_name, args)})
+
+
+class Cassette:
+    """
+    Append-only store of recorded calls with an in-memory index.
+
+    Args:
+        path: Cassette directory.
+        latency: Seconds injected per replayed call, or None to replay the recorded latency.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH, latency: Optional[float] = 0.0):
+        self.path = Path(path)
+        self.latency = latency
+        self._index = defaultdict(list)  # key -> [offset, ...]
+        self._cursor = defaultdict(int)  # key -> next recording to replay
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+        index_path = self.path / "index.jsonl"
+        if index_path.exists():
+            with index_path.open() as f:
+                for line in f:
+                    if line.strip():
+                        key, offset = json.loads(line)
+                        self._index[key].append(offset)
+
+    def __len__(self) -> int:
+        return sum(len(offsets) for offsets in self._index.values())
+
+    def record(self, key: str, payload, latency_ms: float = 0.0):
+        data = zlib.compress(json.dumps({"key": key, "latency_ms": round(latency_ms, 2), "payload": payload}, default=str).encode())
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with (self.path / "records.bin").open("ab") as f:
+                offset = f.tell()
+                f.write(_HEADER.pack(len(data)) + data)
+            # Written after the record, so an interrupted write never indexes a partial record.
+            with (self.path / "index.jsonl").open("a") as f:
+                f.write(json.dumps([key, offset]) + "\n")
+            self._index[key].append(offset)
+            self.counters["recorded"] += 1
+
+    def _read(self, offset: int) -> dict:
+        with (self.path / "records.bin").open("rb") as f:
+            f.seek(offset)
+            (length,) = _HEADER.unpack(f.read(_HEADER.size))
+            return json.loads(zlib.decompress(f.read(length)))
+
+    def lookup(self, key: str):
+        """The next recording for `key` (the last one repeats), or None."""
+        with self._lock:
+            offsets = self._index.get(key)
+            if not offsets:
+                self.counters["misses"] += 1
+                return None
+            position = min(self._cursor[key], len(offsets) - 1)
+            self._cursor[key] += 1
+            self.counters["hits"] += 1
+            return self._read(offsets[position])
+
+    async def replay_delay(self, record: dict):
+        seconds = record["latency_ms"] / 1000 if self.latency is None else self.latency
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def stats(self) -> dict:
+        return {**self.counters, "recordings": len(self)}
+
+
+class CassettePlugin(BasePlugin):
+    """
+    Records model responses, or serves them from the cassette instead of calling the model.
+
+    Register it before plugins that rewrite model requests (instruction
+    caching): keys are computed on the request as the agent built it, and a
+    replayed response short-circuits the plugins after it.
+    """
+
+    def __init__(self, cassette: Cassette, mode: str, name: str = "cassette"):
+        super().__init__(name=name)
+        self.cassette = cassette
+        self.mode = mode
+        self._pending = {}  # (invocation id, agent) -> (key, started)
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        key = llm_request_key(llm_request)
+        if self.mode == "record":
+            self._pending[(callback_context.invocation_id, callback_context.agent_name)] = (key, time.perf_counter())
+            return None
+        record = self.cassette.lookup(key)
+        if record is None:
+            raise LookupError(f"No recorded model response for request {key} in cassette {self.cassette.path}")
+        await self.cassette.replay_delay(record)
+        return LlmResponse.model_validate_json(json.dumps(record["payload"]))
+
+    async def after_model_callback(self, *, callback_context, llm_response):
+        if self.mode != "record" or llm_response.partial:
+            return None
+        pending = self._pending.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if pending is not None:
+            key, started = pending
+            payload = json.loads(llm_response.model_dump_json(exclude_none=True))
+            await asyncio.to_thread(self.cassette.record, key, payload, (time.perf_counter() - started) * 1000)
+        return None
+
+
+class RecordingTool(WrappedTool):
+    def __init__(self, tool: BaseTool, cassette: Cassette):
+        super().__init__(tool)
+        self.cassette = cassette
+
+    async def run_async(self, *, args: dict, tool_context):
+        started = time.perf_counter()
+        result = await self.tool.run_async(args=args, tool_context=tool_context)
+        latency_ms = (time.perf_counter() - started) * 1000
+        await asyncio.to_thread(self.cassette.record, tool_call_key(self.name, args), result, latency_ms)
+        return result
+
+
+class RecordingToolset(WrappingToolset):
+    """Passes calls through to the real toolset and records its declarations and results."""
+
+    def __init__(self, toolset: BaseToolset, cassette: Cassette, name: Optional[str] = None):
+        super().__init__(toolset)
+        self.name = name or getattr(toolset, "name", type(toolset).__name__)
+        self.cassette = cassette
+        self._recorded_declarations = False
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        tools = await super().get_tools(readonly_context)
+        if not self._recorded_declarations:
+            self._recorded_declarations = True
+            declarations = [tool._get_declaration() for tool in tools]
+            await asyncio.to_thread(self.cassette.record, canonical_key("tools", self.name), [
+                declaration.model_dump(mode="json", exclude_none=True) for declaration in declarations if declaration
+            ])
+        return tools
+
+    def wrap_tool(self, tool: BaseTool) -> BaseTool:
+        return RecordingTool(tool, self.cassette)
+
+
+class ReplayTool(BaseTool):
+    def __init__(self, declaration: types.FunctionDeclaration, cassette: Cassette):
+        super().__init__(name=declaration.name, description=declaration.description or "")
+        self.declaration = declaration
+        self.cassette = cassette
+
+    def _get_declaration(self):
+        return self.declaration
+
+    async def run_async(self, *, args: dict, tool_context):
+        record = self.cassette.lookup(tool_call_key(self.name, args))
+        if record is None:
+            return {"content": [{"type": "text", "text": f"No recorded result for {self.name}({args})"}], "isError": True}
+        await self.cassette.replay_delay(record)
+        return record["payload"]
+
+
+class ReplayToolset(BaseToolset):
+    """Serves a toolset's recorded declarations and results; the real toolset is never built."""
+
+    def __init__(self, name: str, cassette: Cassette):
+        super().__init__()
+        self.name = name
+        self.cassette = cassette
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        record = self.cassette.lookup(canonical_key("tools", self.name))
+        if record is None:
+            logger.warning(f"No recorded tools for toolset '{self.name}' in cassette {self.cassette.path}")
+            return []
+        return [ReplayTool(types.FunctionDeclaration.model_validate(declaration), self.cassette) for declaration in record["payload"]]
+
+    async def close(self) -> None:
+        pass
+
+
+def cassette_latency(value: str = CASSETTE_LATENCY) -> Optional[float]:
+    """Parses CASSETTE_LATENCY: "recorded" -> None, otherwise milliseconds -> seconds."""
+    return None if value.lower() == "recorded" else float(value) / 1000
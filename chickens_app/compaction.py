@@ -0,0 +1,268 @@
+import csv
+import io
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from google.adk.apps.base_events_summarizer import BaseEventsSummarizer
+from google.adk.events.event import Event
+from google.adk.events.event_actions import EventActions, EventCompaction
+from google.adk.plugins.base_plugin import BasePlugin
+from google.genai import types
+
+from chickens_app.result_shaping import SESSION_ROWS_PREFIX, ResultStore, result_store
+
+logger = logging.getLogger(__name__)
+
+# Compact a session once the history sent to the model exceeds this many (estimated) tokens.
+COMPACTION_TRIGGER_TOKENS = int(os.getenv("COMPACTION_TRIGGER_TOKENS", "24000"))
+# Most recent turns of a compacted range whose user and agent messages are kept in full.
+COMPACTION_FULL_TEXT_TURNS = int(os.getenv("COMPACTION_FULL_TEXT_TURNS", "2"))
+# Rough chars-per-token ratio for Gemini on mixed English/JSON/CSV text.
+CHARS_PER_TOKEN = 4
+# Row sets up to this many rows are kept in session state when compacted; larger ones are dropped.
+COMPACTION_MAX_KEPT_ROWS = int(os.getenv("COMPACTION_MAX_KEPT_ROWS", "2000"))
+MAX_TEXT_CHARS = 600
+MAX_PAYLOAD_CHARS = 240
+
+
+def estimate_tokens(value) -> int:
+    """Estimated token count of a string or JSON-like value."""
+    if value is None:
+        return 0
+    text = value if isinstance(value, str) else json.dumps(value, separators=(",", ":"), default=str)
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def content_tokens(content: types.Content | None) -> int:
+    if content is None or not content.parts:
+        return 0
+    total = 0
+    for part in content.parts:
+        total += estimate_tokens(part.text)
+        if part.function_call:
+            total += estimate_tokens(part.function_call.name) + estimate_tokens(part.function_call.args)
+        if part.function_response:
+            total += estimate_tokens(part.function_response.name) + estimate_tokens(part.function_response.response)
+    return total
+
+
+def _compaction(event):
+    return event.actions.compaction if event.actions and event.actions.compaction else None
+
+
+def context_tokens(events: list) -> int:
+    """Estimated tokens of the history the model sees, with compacted ranges replaced by their summaries."""
+    ranges = [(c.start_timestamp, c.end_timestamp) for c in map(_compaction, events) if c is not None]
+    total = 0
+    for event in events:
+        compaction = _compaction(event)
+        if compaction is None:
+            if not any(start <= event.timestamp <= end for start, end in ranges):
+                total += content_tokens(event.content)
+        elif not any(
+            start <= compaction.start_timestamp and compaction.end_timestamp <= end
+            and (start, end) != (compaction.start_timestamp, compaction.end_timestamp)
+            for start, end in ranges
+        ):
+            total += content_tokens(compaction.compacted_content)
+    return total
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _parse_csv(text: str) -> tuple:
+    rows = list(csv.DictReader(io.StringIO(text)))
+    return (list(rows[0].keys()) if rows else []), rows
+
+
+class DigestSummarizer(BaseEventsSummarizer):
+    """
+    Deterministic summarizer: no model call, so compaction costs milliseconds.
+
+    User and agent messages are kept, clipped except in the last
+    `full_text_turns` turns; each tool call becomes one line. Row sets in tool
+    results are replaced by their row count, columns and a handle the model
+    can page with `get_result_page`; other bulky payloads are clipped.
+
+    The rows behind each handle (up to `max_kept_rows` per set) are written to
+    session state by the compaction event, so they last as long as the
+    session rather than the process-wide result store. Larger sets are marked
+    in the digest as no longer available.
+    """
+
+    def __init__(self, store: ResultStore = result_store, full_text_turns: int = COMPACTION_FULL_TEXT_TURNS,
+                 max_text_chars: int = MAX_TEXT_CHARS, max_payload_chars: int = MAX_PAYLOAD_CHARS,
+                 max_kept_rows: int = COMPACTION_MAX_KEPT_ROWS):
+        self.store = store
+        self.max_kept_rows = max_kept_rows
+        self.full_text_turns = full_text_turns
+        self.max_text_chars = max_text_chars
+        self.max_payload_chars = max_payload_chars
+
+    def _keep(self, columns: list, rows: list, kept: dict, handle: str | None = None) -> str:
+        """Adds a row set to `kept` (session state key -> rows) and returns its digest suffix."""
+        if len(rows) > self.max_kept_rows:
+            return "rows no longer available, re-run the call if needed"
+        handle = handle or self.store.put(columns, rows)
+        # Round-trip through JSON so persistent session services can store the rows.
+        kept[f"{SESSION_ROWS_PREFIX}{handle}"] = json.loads(json.dumps({"columns": columns, "rows": rows}, default=str))
+        return f"handle {handle}"
+
+    def digest_value(self, value, kept: dict | None = None) -> str:
+        """
+        One-line digest of a tool result value.
+
+        Row sets given a handle are added to `kept`, to be stored with the session.
+        """
+        kept = {} if kept is None else kept
+        if isinstance(value, dict) and value.get("format") == "csv" and "csv" in value:
+            columns, rows = _parse_csv(value["csv"])
+            digest = f"{value.get('total_rows', len(rows))} rows [{', '.join(columns)}]"
+            handle = value.get("handle")
+            if handle:
+                # A capped result: its full rows are only in the result store, if still there.
+                entry = self.store.get(handle)
+                if entry is None:
+                    return f"{digest}, rows no longer available, re-run the call if needed"
+                columns, rows = entry
+            elif not rows:
+                return digest
+            return f"{digest}, {self._keep(columns, rows, kept, handle)}"
+        if isinstance(value, dict) and isinstance(value.get("content"), list):
+            texts = []
+            for item in value["content"]:
+                text = item.get("text") if isinstance(item, dict) else None
+                try:
+                    texts.append(self.digest_value(json.loads(text), kept))
+                except (TypeError, ValueError):
+                    texts.append(_clip(text or "", self.max_payload_chars))
+            return "; ".join(texts)
+        if isinstance(value, list) and len(value) > 1 and all(isinstance(row, dict) for row in value):
+            columns = list(dict.fromkeys(key for row in value for key in row))
+            return f"{len(value)} rows [{', '.join(columns)}], {self._keep(columns, value, kept)}"
+        if isinstance(value, dict) and len(value) == 1:
+            return self.digest_value(next(iter(value.values())), kept)
+        return _clip(value if isinstance(value, str) else json.dumps(value, default=str), self.max_payload_chars)
+
+    def digest_events(self, events: list, kept: dict | None = None) -> str:
+        turns = list(dict.fromkeys(event.invocation_id for event in events))
+        full_text = set(turns[-self.full_text_turns:]) if self.full_text_turns else set()
+        lines = []
+        for event in events:
+            for part in event.content.parts if event.content and event.content.parts else []:
+                if part.text and not part.thought:
+                    speaker = "User" if event.author == "user" else "Agent"
+                    text = part.text.strip() if event.invocation_id in full_text else _clip(part.text, self.max_text_chars)
+                    lines.append(f"{speaker}: {text}")
+                elif part.function_call:
+                    args = json.dumps(part.function_call.args or {}, default=str)
+                    lines.append(f"Called {part.function_call.name}({_clip(args, self.max_payload_chars)})")
+                elif part.function_response:
+                    lines.append(f"  -> {self.digest_value(part.function_response.response, kept)}")
+        return "\n".join(lines)
+
+    async def maybe_summarize_events(self, *, events: list) -> Event | None:
+        if not events:
+            return None
+        kept = {}
+        summary = (
+            "[Compacted earlier conversation. Row sets with a handle stay available through "
+            "get_result_page(handle); the others are gone.]\n" + self.digest_events(events, kept)
+        )
+        return Event(
+            author="user",
+            invocation_id=Event.new_id(),
+            actions=EventActions(state_delta=kept, compaction=EventCompaction(
+                start_timestamp=events[0].timestamp,
+                end_timestamp=events[-1].timestamp,
+                compacted_content=types.Content(role="model", parts=[types.Part(text=summary)]),
+            )),
+        )
+
+
+class SessionCompactionPlugin(BasePlugin):
+    """
+    Token-triggered compaction of session history.
+
+    After every run, the history the next model call would see is measured.
+    Above `trigger_tokens`, everything since the previous compaction is
+    replaced by a digest from `summarizer`, recorded as an ADK compaction
+    event that the contents builder substitutes for the covered events.
+    (The builder hides every event before a compaction event that is newer
+    than its start, so a compaction always runs to the end of the history;
+    recent turns survive as full text inside the digest.) Token accounting
+    per session is available via `stats()`.
+    """
+
+    def __init__(self, summarizer: BaseEventsSummarizer | None = None,
+                 trigger_tokens: int = COMPACTION_TRIGGER_TOKENS,
+                 max_sessions: int = 1000, name: str = "session_compaction"):
+        super().__init__(name=name)
+        self.summarizer = summarizer or DigestSummarizer()
+        self.trigger_tokens = trigger_tokens
+        self.max_sessions = max_sessions
+        self._accounting = OrderedDict()  # session id -> token accounting
+
+    def _account(self, session_id: str) -> dict:
+        accounting = self._accounting.get(session_id)
+        if accounting is None:
+            accounting = self._accounting[session_id] = {
+                "request_tokens": 0, "context_tokens": 0, "raw_tokens": 0,
+                "compactions": 0, "tokens_saved": 0, "compaction_ms": 0.0,
+            }
+            while len(self._accounting) > self.max_sessions:
+                self._accounting.popitem(last=False)
+        self._accounting.move_to_end(session_id)
+        return accounting
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        session_id = callback_context.session.id
+        self._account(session_id)["request_tokens"] = sum(content_tokens(content) for content in llm_request.contents)
+        return None
+
+    @staticmethod
+    def _compactable(events: list) -> list:
+        """Events after the last compaction."""
+        last_end = max((c.end_timestamp for c in map(_compaction, events) if c is not None), default=0.0)
+        return [event for event in events if event.timestamp > last_end and _compaction(event) is None]
+
+    async def after_run_callback(self, *, invocation_context):
+        session = invocation_context.session
+        accounting = self._account(session.id)
+        accounting["raw_tokens"] = sum(content_tokens(event.content) for event in session.events)
+        accounting["context_tokens"] = context_tokens(session.events)
+        if accounting["context_tokens"] <= self.trigger_tokens:
+            return None
+
+        started = time.perf_counter()
+        try:
+            events = self._compactable(session.events)
+            compaction = await self.summarizer.maybe_summarize_events(events=events)
+            if compaction is None:
+                return None
+            await invocation_context.session_service.append_event(session=session, event=compaction)
+        except Exception as e:
+            logger.warning(f"Could not compact session {session.id}: {e}")
+            return None
+        before = accounting["context_tokens"]
+        accounting["context_tokens"] = context_tokens(session.events)
+        accounting["compactions"] += 1
+        accounting["tokens_saved"] += before - accounting["context_tokens"]
+        accounting["compaction_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(
+            f"Compacted session {session.id}: {len(events)} events, "
+            f"{before} -> {accounting['context_tokens']} tokens in {accounting['compaction_ms']}ms"
+        )
+        return None
+
+    def stats(self, session_id: str | None = None) -> dict:
+        """Token accounting for one session, or for all tracked sessions."""
+        if session_id is not None:
+            return dict(self._accounting.get(session_id, {}))
+        return {session_id: dict(accounting) for session_id, accounting in self._accounting.items()}
@@ -0,0 +1,266 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DISPLAY_NAME_PREFIX = "chickens-instruction"
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def instruction_fingerprint(llm_request) -> str:
+    """
+    Hash of the rendered system instruction plus the tool declarations.
+
+    Gemini rejects requests that set `cached_content` together with a system
+    instruction, tools or tool config, so all three live in the cache and
+    are part of its key.
+    """
+    config = llm_request.config
+    data = {
+        "model": llm_request.model,
+        "system_instruction": str(config.system_instruction or ""),
+        "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in config.tools or [] if isinstance(tool, types.Tool)],
+        "tool_config": config.tool_config.model_dump(mode="json", exclude_none=True) if config.tool_config else None,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class InstructionCache:
+    """
+    Provider-side cached content for the agent's instruction and tools.
+
+    A cache is identified by its display name, which embeds the instruction
+    fingerprint. Any process rendering the same instruction finds and reuses
+    the existing cache via `caches.list`; a changed instruction hashes to a
+    new name, so a new cache is created and the old one simply expires.
+    Caches are extended when they get close to expiry.
+
+    Args:
+        client: A `google.genai.Client` (or `LocalCachedContentClient`).
+            Created from the environment on first use when omitted.
+        ttl_seconds: Lifetime of created caches.
+        refresh_margin_seconds: Extend a cache when it expires sooner than this.
+        retry_seconds: After a failed create, send the instruction inline for
+            this long before trying again; doubles on each consecutive failure,
+            up to `max_retry_seconds`.
+    """
+
+    def __init__(self, client=None, ttl_seconds: int = 3600, refresh_margin_seconds: int = 300,
+                 retry_seconds: float = 60, max_retry_seconds: float = 3600):
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin_seconds)
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._caches = {}  # fingerprint -> (name, expire_time)
+        self._failed = {}  # fingerprint -> (consecutive failures, monotonic time to retry at)
+        self._locks = {}  # event loop -> asyncio.Lock
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client()
+        return self._client
+
+    def _lock(self) -> asyncio.Lock:
+        # Locks bind to the loop they are first used on (the service loop, adk web's); keep one per loop.
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            self._locks = {l: lk for l, lk in self._locks.items() if not l.is_closed()}
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+
+    def _ttl(self) -> str:
+        return f"{self.ttl_seconds}s"
+
+    async def _find(self, display_name: str, model: str):
+        async for cached in await self.client.aio.caches.list():
+            if (
+                cached.display_name == display_name
+                and (cached.model or "").endswith(model)
+                and cached.expire_time and cached.expire_time > _now() + self.refresh_margin
+            ):
+                return cached
+        return None
+
+    async def ensure(self, llm_request) -> str | None:
+        """
+        Returns the name of a live cache for the request's instruction and tools, creating it if needed.
+
+        Returns:
+            str | None: The cache name, or None when caching is unavailable for this instruction.
+        """
+        fingerprint = instruction_fingerprint(llm_request)
+        failed = self._failed.get(fingerprint)
+        if failed and time.monotonic() < failed[1]:
+            return None
+        cached = self._caches.get(fingerprint)
+        if cached and cached[1] > _now() + self.refresh_margin:
+            return cached[0]
+
+        # One lookup/create per event loop at a time; other sessions wait and reuse it.
+        async with self._lock():
+            cached = self._caches.get(fingerprint)
+            if cached and cached[1] > _now() + self.refresh_margin:
+                return cached[0]
+            found = None
+            if cached:
+                try:
+                    found = await self.client.aio.caches.update(
+                        name=cached[0], config=types.UpdateCachedContentConfig(ttl=self._ttl())
+                    )
+                    logger.info(f"Extended instruction cache {found.name}")
+                except Exception as e:
+                    # E.g. the provider already expired it: find or create a fresh one.
+                    logger.info(f"Could not extend instruction cache {cached[0]}, recreating it: {e}")
+                    self._caches.pop(fingerprint, None)
+            try:
+                found = found or await self._create_or_reuse(fingerprint, llm_request)
+            except Exception as e:
+                failures = self._failed.get(fingerprint, (0, 0.0))[0] + 1
+                backoff = min(self.retry_seconds * 2 ** (failures - 1), self.max_retry_seconds)
+                self._failed[fingerprint] = (failures, time.monotonic() + backoff)
+                logger.warning(f"Instruction caching unavailable, sending the instruction inline for {backoff:.0f}s: {e}")
+                return None
+            self._failed.pop(fingerprint, None)
+            self._caches[fingerprint] = (found.name, found.expire_time)
+            return found.name
+
+    async def _create_or_reuse(self, fingerprint: str, llm_request):
+        display_name = f"{DISPLAY_NAME_PREFIX}-{fingerprint}"
+        found = await self._find(display_name, llm_request.model)
+        if found:
+            logger.info(f"Reusing instruction cache {found.name} ({display_name})")
+            return found
+        config = llm_request.config
+        found = await self.client.aio.caches.create(
+            model=llm_request.model,
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                system_instruction=config.system_instruction,
+                tools=config.tools or None,
+                tool_config=config.tool_config,
+                ttl=self._ttl(),
+            ),
+        )
+        logger.info(f"Created instruction cache {found.name} ({display_name})")
+        return found
+
+    @staticmethod
+    def apply(llm_request, cache_name: str):
+        """Points the request at the cache and drops the parts it holds."""
+        llm_request.config.system_instruction = None
+        llm_request.config.tools = None
+        llm_request.config.tool_config = None
+        llm_request.config.cached_content = cache_name
+
+
+class _LocalPager:
+    def __init__(self, items: list):
+        self._items = items
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for item in self._items:
+            yield item
+
+
+class _LocalCaches:
+    def __init__(self, owner: "LocalCachedContentClient"):
+        self._owner = owner
+
+    async def create(self, *, model: str, config) -> types.CachedContent:
+        ttl = float(str(config.ttl or "3600s").rstrip("s"))
+        cached = types.CachedContent(
+            name=f"cachedContents/{uuid.uuid4().hex}",
+            display_name=config.display_name,
+            model=model if model.startswith("models/") else f"models/{model}",
+            create_time=_now(),
+            update_time=_now(),
+            expire_time=_now() + datetime.timedelta(seconds=ttl),
+        )
+        self._owner._store(cached, config.system_instruction)
+        return cached
+
+    async def list(self, *, config=None) -> _LocalPager:
+        return _LocalPager([cached for cached, _ in self._owner._load().values()])
+
+    async def get(self, *, name: str, config=None) -> types.CachedContent:
+        return self._owner._load()[name][0]
+
+    async def update(self, *, name: str, config) -> types.CachedContent:
+        cached, instruction = self._owner._load()[name]
+        ttl = float(str(config.ttl or "3600s").rstrip("s"))
+        cached = cached.model_copy(update={"update_time": _now(), "expire_time": _now() + datetime.timedelta(seconds=ttl)})
+        self._owner._store(cached, instruction)
+        return cached
+
+    async def delete(self, *, name: str, config=None):
+        self._owner._delete(name)
+
+
+class LocalCachedContentClient:
+    """
+    In-process stand-in for the Gemini cached-content API (`client.aio.caches`).
+
+    Supports create/list/get/update/delete with TTL expiry. With `path`, caches
+    are persisted to a JSON file so reuse across processes can be exercised
+    without a provider. Requests pointing at a local cache cannot be sent to
+    Gemini, so it is only for offline runs with a scripted model (load_test.py
+    selects it for its stub and replay backends via CONTEXT_CACHE=local).
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = Path(path) if path else None
+        self._caches = {}  # name -> (CachedContent, system instruction)
+        self._lock = threading.Lock()
+        self.aio = type("Aio", (), {})()
+        self.aio.caches = _LocalCaches(self)
+
+    def _load(self) -> dict:
+        with self._lock:
+            if self.path and self.path.exists():
+                data = json.loads(self.path.read_text())
+                self._caches = {
+                    name: (types.CachedContent.model_validate(entry["cache"]), entry["system_instruction"])
+                    for name, entry in data.items()
+                }
+            now = _now()
+            self._caches = {name: entry for name, entry in self._caches.items() if entry[0].expire_time > now}
+            return dict(self._caches)
+
+    def _save(self):
+        if self.path:
+            data = {
+                name: {"cache": cached.model_dump(mode="json"), "system_instruction": str(instruction or "")}
+                for name, (cached, instruction) in self._caches.items()
+            }
+            self.path.write_text(json.dumps(data, indent=2))
+
+    def _store(self, cached: types.CachedContent, system_instruction):
+        self._load()
+        with self._lock:
+            self._caches[cached.name] = (cached, system_instruction)
+            self._save()
+
+    def _delete(self, name: str):
+        self._load()
+        with self._lock:
+            self._caches.pop(name, None)
+            self._save()
@@ -0,0 +1,290 @@
+"""
+Per-turn latency breakdown for the chickens agent.
+
+`LatencyPlugin` times every turn and splits it into model, tool, queue and
+A2A spans. Spans are exported as OpenTelemetry spans (under one span per
+turn) and observed into Prometheus-style histograms. With LATENCY_LOG_PATH
+set they are also appended, off the event loop, to a size-rotated JSONL log
+that `latency_report.py` summarises as p50/p95/p99 per component.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+import numpy as np
+from google.adk.plugins.base_plugin import BasePlugin
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# JSONL log of per-turn breakdowns; off unless set (e.g. to DEFAULT_LATENCY_LOG_PATH).
+DEFAULT_LATENCY_LOG_PATH = str(PROJECT_ROOT / ".cache" / "latency.jsonl")
+LATENCY_LOG_PATH = os.getenv("LATENCY_LOG_PATH", "")
+# The log is rotated to `<path>.1` (replacing the previous one) once it reaches this size.
+LATENCY_LOG_MAX_BYTES = int(os.getenv("LATENCY_LOG_MAX_BYTES", str(16 * 1024 * 1024)))
+# Prometheus text exposition file, rewritten after every turn (e.g. for a node_exporter textfile collector).
+LATENCY_PROM_PATH = os.getenv("LATENCY_PROM_PATH", "")
+# Tools that call the marketing agent over A2A; their time is reported as "a2a".
+A2A_TOOLS = {"consult_marketing_expert"}
+COMPONENTS = ("turn", "model", "tool", "queue", "a2a")
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_NAME = "chickens_agent_latency_seconds"
+
+tracer = trace.get_tracer("chickens_app.latency")
+
+
+class LatencyHistograms:
+    """Cumulative Prometheus-style histograms, one per component."""
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self._counts = defaultdict(lambda: [0] * (len(buckets) + 1))  # last slot is +Inf
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, component: str, seconds: float):
+        with self._lock:
+            counts = self._counts[component]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[component] += seconds
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = [
+            f"# HELP {METRIC_NAME} Agent turn latency by component.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        with self._lock:
+            for component in sorted(self._counts):
+                counts, cumulative = self._counts[component], 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_NAME}_bucket{{component="{component}",le="{bound}"}} {cumulative}')
+                cumulative += counts[-1]
+                lines.append(f'{METRIC_NAME}_bucket{{component="{component}",le="+Inf"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_sum{{component="{component}"}} {self._sums[component]:.6f}')
+                lines.append(f'{METRIC_NAME}_count{{component="{component}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+class _Turn:
+    def __init__(self, invocation_id: str, session_id: str):
+        self.invocation_id = invocation_id
+        self.session_id = session_id
+        self.started_ns = time.time_ns()
+        self.spans = []  # (component, name, start_ns, end_ns, attributes)
+        self.open = {}  # span key -> (component, name, start_ns)
+
+
+def _ms(ns: int) -> float:
+    return round(ns / 1e6, 2)
+
+
+class LatencyPlugin(BasePlugin):
+    """
+    Times each turn and breaks it down into model, tool, queue and A2A spans.
+
+    Model spans run from before to after each model call; tool spans from
+    before to after each tool call, minus the time the call queued for a
+    toolset concurrency slot (reported as "queue", see `record_tool_timing`).
+    Calls to A2A tools are reported as "a2a" instead of "tool".
+
+    Observe-only: register it first so every other plugin's work is inside
+    the spans and no short-circuiting plugin hides a call from it.
+    """
+
+    def __init__(self, log_path: str = LATENCY_LOG_PATH, prom_path: str = LATENCY_PROM_PATH,
+                 history: int = 200, max_log_bytes: int = LATENCY_LOG_MAX_BYTES, name: str = "latency"):
+        super().__init__(name=name)
+        self.log_path = Path(log_path) if log_path else None
+        self.prom_path = Path(prom_path) if prom_path else None
+        self.max_log_bytes = max_log_bytes
+        self._write_lock = threading.Lock()
+        self.histograms = LatencyHistograms()
+        self.turns = deque(maxlen=history)  # finished per-turn breakdowns, oldest first
+        self._active = {}  # invocation id -> _Turn
+        self._calls = {}  # function call id -> invocation id
+        self._queued = {}  # function call id -> queued ns
+
+    def _turn(self, context) -> _Turn | None:
+        return self._active.get(context.invocation_id)
+
+    def _start(self, turn: _Turn, key, component: str, name: str):
+        turn.open[key] = (component, name, time.time_ns())
+
+    def _end(self, turn: _Turn, key, **attributes):
+        started = turn.open.pop(key, None)
+        if started is not None:
+            component, name, start_ns = started
+            turn.spans.append((component, name, start_ns, time.time_ns(), attributes))
+
+    async def before_run_callback(self, *, invocation_context):
+        self._active[invocation_context.invocation_id] = _Turn(
+            invocation_context.invocation_id, invocation_context.session.id
+        )
+        return None
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        turn = self._turn(callback_context)
+        if turn is not None:
+            self._start(turn, ("model", callback_context.agent_name), "model", llm_request.model or "model")
+        return None
+
+    async def after_model_callback(self, *, callback_context, llm_response):
+        turn = self._turn(callback_context)
+        if turn is not None:
+            usage = llm_response.usage_metadata
+            self._end(
+                turn, ("model", callback_context.agent_name),
+                prompt_tokens=getattr(usage, "prompt_token_count", None) or 0,
+                cached_tokens=getattr(usage, "cached_content_token_count", None) or 0,
+            )
+        return None
+
+    async def on_model_error_callback(self, *, callback_context, llm_request, error):
+        turn = self._turn(callback_context)
+        if turn is not None:
+            self._end(turn, ("model", callback_context.agent_name), error=type(error).__name__)
+        return None
+
+    async def before_tool_callback(self, *, tool, tool_args, tool_context):
+        turn = self._turn(tool_context)
+        if turn is not None:
+            component = "a2a" if tool.name in A2A_TOOLS else "tool"
+            self._calls[tool_context.function_call_id] = turn.invocation_id
+            self._start(turn, ("tool", tool_context.function_call_id), component, tool.name)
+        return None
+
+    def _end_tool(self, tool_context, **attributes):
+        turn = self._turn(tool_context)
+        call_id = tool_context.function_call_id
+        self._calls.pop(call_id, None)
+        queued_ns = self._queued.pop(call_id, 0)
+        if turn is None or ("tool", call_id) not in turn.open:
+            return
+        component, name, start_ns = turn.open[("tool", call_id)]
+        if queued_ns:
+            turn.spans.append(("queue", name, start_ns, start_ns + queued_ns, {}))
+            turn.open[("tool", call_id)] = (component, name, start_ns + queued_ns)
+        self._end(turn, ("tool", call_id), **attributes)
+
+    async def after_tool_callback(self, *, tool, tool_args, tool_context, result):
+        self._end_tool(tool_context)
+        return None
+
+    async def on_tool_error_callback(self, *, tool, tool_args, tool_context, error):
+        self._end_tool(tool_context, error=type(error).__name__)
+        return None
+
+    def record_tool_timing(self, timing: dict):
+        """Listener for `ConcurrencyLimitedToolset` timings; attributes queue time to the call."""
+        if timing.get("function_call_id") in self._calls and timing["queued_ms"] > 0:
+            self._queued[timing["function_call_id"]] = int(timing["queued_ms"] * 1e6)
+
+    async def after_run_callback(self, *, invocation_context):
+        turn = self._active.pop(invocation_context.invocation_id, None)
+        if turn is None:
+            return None
+        breakdown = self._finish(turn, time.time_ns())
+        if self.log_path or self.prom_path:
+            try:
+                await asyncio.to_thread(self._write, breakdown)
+            except Exception as e:
+                logger.warning(f"Could not write latency for turn {turn.invocation_id}: {e}")
+        return None
+
+    def _finish(self, turn: _Turn, end_ns: int) -> dict:
+        totals = defaultdict(float)
+        for component, _, start_ns, span_end_ns, _ in turn.spans:
+            totals[component] += (span_end_ns - start_ns) / 1e6
+        breakdown = {
+            "invocation_id": turn.invocation_id,
+            "session_id": turn.session_id,
+            "started_at": turn.started_ns / 1e9,
+            "turn_ms": _ms(end_ns - turn.started_ns),
+            **{f"{component}_ms": round(totals[component], 2) for component in COMPONENTS[1:]},
+            "spans": [
+                {"component": component, "name": name, "offset_ms": _ms(start_ns - turn.started_ns),
+                 "duration_ms": _ms(span_end_ns - start_ns), **attributes}
+                for component, name, start_ns, span_end_ns, attributes in turn.spans
+            ],
+        }
+        self.turns.append(breakdown)
+
+        self.histograms.observe("turn", (end_ns - turn.started_ns) / 1e9)
+        for component, _, start_ns, span_end_ns, _ in turn.spans:
+            self.histograms.observe(component, (span_end_ns - start_ns) / 1e9)
+        try:
+            self._export_spans(turn, end_ns)
+        except Exception as e:
+            logger.warning(f"Could not export latency for turn {turn.invocation_id}: {e}")
+        return breakdown
+
+    def _export_spans(self, turn: _Turn, end_ns: int):
+        root = tracer.start_span("chickens_agent.turn", start_time=turn.started_ns, attributes={
+            "chickens.invocation_id": turn.invocation_id, "chickens.session_id": turn.session_id,
+        })
+        parent = trace.set_span_in_context(root)
+        for component, name, start_ns, span_end_ns, attributes in turn.spans:
+            span = tracer.start_span(f"chickens_agent.{component}", context=parent, start_time=start_ns, attributes={
+                "chickens.component": component, "chickens.name": name,
+                **{f"chickens.{key}": value for key, value in attributes.items()},
+            })
+            span.end(end_time=span_end_ns)
+        root.end(end_time=end_ns)
+
+    def _write(self, breakdown: dict):
+        # Runs in a worker thread; the lock keeps concurrent turns' lines and rotations apart.
+        with self._write_lock:
+            if self.log_path:
+                self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                if self.log_path.exists() and self.log_path.stat().st_size >= self.max_log_bytes:
+                    os.replace(self.log_path, self.log_path.with_name(self.log_path.name + ".1"))
+                with self.log_path.open("a") as f:
+                    f.write(json.dumps(breakdown) + "\n")
+            if self.prom_path:
+                tmp = self.prom_path.with_suffix(".tmp")
+                tmp.write_text(self.histograms.render())
+                os.replace(tmp, self.prom_path)
+
+    def breakdown(self, invocation_id: str) -> dict | None:
+        """The finished breakdown of a turn, if it is still in the recent history."""
+        return next((turn for turn in reversed(self.turns) if turn["invocation_id"] == invocation_id), None)
+
+
+def percentile_summary(turns: list) -> dict:
+    """p50/p95/p99 in ms per component: whole turns, and individual spans for the others."""
+    samples = defaultdict(list)
+    for turn in turns:
+        samples["turn"].append(turn["turn_ms"])
+        for span in turn.get("spans", []):
+            samples[span["component"]].append(span["duration_ms"])
+    return {
+        component: {
+            "count": len(samples[component]),
+            **{f"p{q}": round(float(np.percentile(samples[component], q)), 1) for q in (50, 95, 99)},
+        }
+        for component in COMPONENTS if samples[component]
+    }
+
+
+def load_turns(path: str, last: int | None = None) -> list:
+    """Per-turn breakdowns from the JSONL log, oldest first (empty if there is no log yet)."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        turns = [json.loads(line) for line in f if line.strip()]
+    return turns[-last:] if last else turns
+
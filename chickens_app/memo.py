@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict
+
+from google.adk.plugins.base_plugin import BasePlugin
+
+from mcp_server.sql_cache import canonical_args
+
+logger = logging.getLogger(__name__)
+
+# Seconds a memoized result stays valid, per tool. None never expires, 0 disables memoization.
+# Sensor readings go stale fast, master data and schemas do not change within a session.
+DEFAULT_TOOL_TTLS = {
+    # Live state: sensor readings (also part of the store snapshot), stock levels and
+    # expiry, Maps weather and places. Never longer than the data they include.
+    "get_store_temperature": 30,
+    "get_store_snapshot": 30,
+    "stock_for": 60,
+    "expiring_within": 60,
+    "get_expiring_stock": 60,
+    "get_projected_expiry": 60,
+    "lookup_weather": 300,
+    "search_places": 3600,
+    "compute_routes": 3600,
+    # SQL results are cached by SqlResultCache, which skips writes and tracks table versions.
+    "execute_sql": 0,
+    "consult_marketing_expert": 0,
+    "get_result_page": 0,
+    "product_catalog": None,
+    "get_dataset_schema": None,
+    "get_site_distances": None,
+    "list_dataset_ids": None,
+    "get_dataset_info": None,
+    "list_table_ids": None,
+    "get_table_info": None,
+}
+DEFAULT_TTL = 300
+# Seconds a duplicate call waits for the identical in-flight call before running itself.
+DEFAULT_WAIT_TIMEOUT = 60
+
+
+def tool_ttls() -> dict:
+    """Per-tool TTLs, with overrides from MEMO_TOOL_TTLS (JSON, e.g. '{"get_store_temperature": 10}')."""
+    return {**DEFAULT_TOOL_TTLS, **json.loads(os.getenv("MEMO_TOOL_TTLS", "{}"))}
+
+
+class ToolMemoPlugin(BasePlugin):
+    """
+    Per-session memoization of tool calls.
+
+    A repeat call (same tool, same canonical arguments) within a session is
+    answered from the earlier result while it is fresh. Identical calls that
+    run concurrently (parallel function calls in one turn) share one execution;
+    a duplicate waits at most `wait_timeout` seconds, and calls still in flight
+    when their invocation ends are released so later duplicates never hang.
+
+    Must be registered after plugins that only observe tool calls (their
+    before_tool_callback is skipped once this plugin returns a result) and
+    before plugins that rewrite results, so the raw result is what is stored.
+    """
+
+    def __init__(self, ttls: dict | None = None, default_ttl: float | None = DEFAULT_TTL,
+                 max_sessions: int = 1000, max_entries_per_session: int = 256,
+                 wait_timeout: float = DEFAULT_WAIT_TIMEOUT, name: str = "tool_memo"):
+        super().__init__(name=name)
+        self.ttls = tool_ttls() if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.max_sessions = max_sessions
+        self.max_entries_per_session = max_entries_per_session
+        self.wait_timeout = wait_timeout
+        self._sessions = OrderedDict()  # session id -> OrderedDict(key -> (stored_at, result))
+        self._in_flight = {}  # (session id, key) -> (Future, invocation id)
+        self._served = set()  # function call ids answered from the memo
+        self.counters = defaultdict(int)
+
+    def _ttl(self, tool_name: str):
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    def _key(self, tool, tool_args, tool_context):
+        return tool_context.session.id, f"{tool.name}:{canonical_args(tool.name, tool_args)}"
+
+    def _entries(self, session_id: str) -> OrderedDict:
+        entries = self._sessions.get(session_id)
+        if entries is None:
+            entries = self._sessions[session_id] = OrderedDict()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return entries
+
+    async def before_tool_callback(self, *, tool, tool_args, tool_context):
+        ttl = self._ttl(tool.name)
+        if ttl == 0:
+            return None
+        session_id, key = self._key(tool, tool_args, tool_context)
+
+        entry = self._entries(session_id).get(key)
+        if entry is not None and (ttl is None or time.monotonic() - entry[0] < ttl):
+            self.counters["hits"] += 1
+            self._served.add(tool_context.function_call_id)
+            return entry[1]
+
+        in_flight = self._in_flight.get((session_id, key))
+        if in_flight is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(in_flight[0]), self.wait_timeout)
+            except asyncio.TimeoutError:
+                # The owning call never settled: release it so later duplicates do not wait too.
+                if self._in_flight.get((session_id, key)) is in_flight:
+                    self._settle(session_id, key, None)
+                self.counters["wait_timeouts"] += 1
+                result = None
+            if result is not None:
+                self.counters["deduplicated"] += 1
+                self._served.add(tool_context.function_call_id)
+                return result
+            return None
+
+        self.counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[(session_id, key)] = (future, tool_context.invocation_id)
+        return None
+
+    def _settle(self, session_id: str, key: str, result):
+        in_flight = self._in_flight.pop((session_id, key), None)
+        if in_flight is not None and not in_flight[0].done():
+            in_flight[0].set_result(result)
+
+    async def after_tool_callback(self, *, tool, tool_args, tool_context, result):
+        if tool_context.function_call_id in self._served:
+            self._served.discard(tool_context.function_call_id)
+            return None
+        if self._ttl(tool.name) == 0:
+            return None
+        session_id, key = self._key(tool, tool_args, tool_context)
+        failed = not isinstance(result, dict) or result.get("isError") or "error" in result
+        if not failed:
+            entries = self._entries(session_id)
+            entries[key] = (time.monotonic(), result)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries_per_session:
+                entries.popitem(last=False)
+        # Waiting duplicates re-run the tool themselves if this call failed.
+        self._settle(session_id, key, None if failed else result)
+        return None
+
+    async def on_tool_error_callback(self, *, tool, tool_args, tool_context, error):
+        if self._ttl(tool.name) != 0:
+            self._settle(*self._key(tool, tool_args, tool_context), None)
+        return None
+
+    async def after_run_callback(self, *, invocation_context):
+        # Calls cancelled mid-flight never reach after_tool_callback; release their waiters.
+        for (session_id, key), (_, invocation_id) in list(self._in_flight.items()):
+            if invocation_id == invocation_context.invocation_id:
+                self._settle(session_id, key, None)
+        return None
+
+    def stats(self) -> dict:
+        return {**self.counters, "sessions": len(self._sessions)}
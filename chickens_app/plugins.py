@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import threading
+from typing import Callable
+
+from google.adk.plugins.base_plugin import BasePlugin
+
+from mcp_server.toolsets import warm_up_toolsets
+
+logger = logging.getLogger(__name__)
+
+
+class ToolsetWarmupPlugin(BasePlugin):
+    """
+    Startup hook that initialises all toolsets concurrently before the first run.
+
+    ADK resolves an agent's toolsets one after another on the first model call.
+    Warming them up together here overlaps the credential fetches and MCP
+    handshakes, so the first turn pays for the slowest toolset rather than the sum.
+
+    `warm_up` is the one entry point: callers that warm up ahead of the first
+    run (e.g. `ConversationService`) join the same task this hook waits on.
+    """
+
+    def __init__(self, toolsets: list, connect: bool = True, name: str = "toolset_warmup"):
+        super().__init__(name=name)
+        self._toolsets = toolsets
+        self._connect = connect
+        self._warm_up_task: asyncio.Task | None = None
+        self._warm_up_connects = False
+        self.report: dict | None = None
+
+    def warm_up(self, connect: bool | None = None) -> asyncio.Future:
+        """Starts the warm-up on the running loop, or joins the one in progress. Resolves to the readiness report."""
+        connect = self._connect if connect is None else connect
+        task = self._warm_up_task
+        # A warm-up that only built the toolsets is redone if a caller wants connections.
+        if task is None or task.get_loop() is not asyncio.get_running_loop() or (connect and not self._warm_up_connects):
+            task = self._warm_up_task = asyncio.ensure_future(warm_up_toolsets(self._toolsets, connect=connect))
+            self._warm_up_connects = connect
+        return asyncio.shield(task)
+
+    async def before_run_callback(self, *, invocation_context):
+        if self.report is not None:
+            return None
+        # Concurrent first runs share one warm-up.
+        self.report = await self.warm_up()
+        logger.info(f"Toolsets ready: {self.report}")
+        return None
+
+
+class LazyPlugin(BasePlugin):
+    """
+    Defers building a plugin, and importing its dependencies, until it is first needed.
+
+    Callbacks are forwarded to the plugin built by `factory`, which runs on
+    the first callback or ahead of time via `resolve` (e.g. from a warm-up
+    thread). Other attributes, such as `stats()`, are read from the built plugin.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], BasePlugin]):
+        super().__init__(name=name)
+        self._factory = factory
+        self._plugin: BasePlugin | None = None
+        self._lock = threading.Lock()
+
+    def resolve(self) -> BasePlugin:
+        """Builds the plugin once (thread-safe) and returns it."""
+        if self._plugin is None:
+            with self._lock:
+                if self._plugin is None:
+                    self._plugin = self._factory()
+        return self._plugin
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    async def close(self):
+        if self._plugin is not None:
+            await self._plugin.close()
+
+
+def _forward(callback: str):
+    async def forward(self, **kwargs):
+        return await getattr(self.resolve(), callback)(**kwargs)
+
+    forward.__name__ = callback
+    return forward
+
+
+for _callback in (
+    "on_user_message_callback", "before_run_callback", "on_event_callback", "after_run_callback",
+    "before_agent_callback", "after_agent_callback", "before_model_callback", "after_model_callback",
+    "on_model_error_callback", "before_tool_callback", "after_tool_callback", "on_tool_error_callback",
+):
+    setattr(LazyPlugin, _callback, _forward(_callback))
+
+
+class InstructionCachePlugin(BasePlugin):
+    """
+    Sends the agent instruction and tool declarations as provider-side cached content.
+
+    The first model call creates (or finds) a cache keyed by a hash of the
+    rendered instruction; every later call, in any session or process, only
+    references it. If caching fails the request goes out unchanged.
+    """
+
+    def __init__(self, cache, name: str = "instruction_cache"):
+        super().__init__(name=name)
+        self.cache = cache
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        config = llm_request.config
+        if config is None or config.cached_content or not config.system_instruction:
+            return None
+        cache_name = await self.cache.ensure(llm_request)
+        if cache_name:
+            self.cache.apply(llm_request, cache_name)
+        return None
@@ -0,0 +1,231 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.tool_context import ToolContext
+
+logger = logging.getLogger(__name__)
+
+# Row sets longer than this are capped; the rest stays addressable by handle.
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "50"))
+# Lists shorter than this are left as JSON (no gain from re-encoding).
+MIN_ROWS = 3
+TOP_K = 5
+# Session state key prefix for row sets kept with the session (see compaction.py).
+SESSION_ROWS_PREFIX = "result_rows:"
+
+
+class ResultStore:
+    """Bounded LRU of full row sets, addressable by handle for paging."""
+
+    def __init__(self, max_handles: int = 256):
+        self.max_handles = max_handles
+        self._results = OrderedDict()  # handle -> (columns, rows)
+        self._lock = threading.Lock()
+
+    def put(self, columns: list, rows: list) -> str:
+        # Content-addressed: the same row set always gets the same handle, so
+        # repeated results share an entry and recorded runs replay identically.
+        digest = hashlib.sha256(json.dumps([columns, rows], separators=(",", ":"), default=str).encode())
+        handle = f"rs-{digest.hexdigest()[:8]}"
+        with self._lock:
+            self._results[handle] = (columns, rows)
+            while len(self._results) > self.max_handles:
+                self._results.popitem(last=False)
+        return handle
+
+    def get(self, handle: str):
+        with self._lock:
+            entry = self._results.get(handle)
+            if entry is not None:
+                self._results.move_to_end(handle)
+            return entry
+
+
+result_store = ResultStore()
+
+
+def _is_row_set(value) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) >= MIN_ROWS
+        and all(isinstance(row, dict) for row in value)
+    )
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), default=str)
+    return "" if value is None else value
+
+
+def encode_csv(columns: list, rows: list) -> str:
+    """Header line plus one CSV line per row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_cell(row.get(column)) for column in columns])
+    return buffer.getvalue().rstrip("\n")
+
+
+def summarize_rows(columns: list, rows: list) -> dict:
+    """Aggregates over the full row set: sum/min/max/mean for numeric columns, top values for the others."""
+    # Imported here so importing the agent does not load pandas.
+    import pandas as pd
+
+    frame = pd.DataFrame(rows, columns=columns)
+    numeric, top_values = {}, {}
+    for column in columns:
+        series = frame[column]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            numeric[column] = {
+                "sum": round(float(series.sum()), 2),
+                "min": series.min().item(),
+                "max": series.max().item(),
+                "mean": round(float(series.mean()), 2),
+            }
+        else:
+            counts = series.astype(str).value_counts()
+            # Unique-per-row columns (IDs, batch numbers) have no useful top-k.
+            if len(counts) < len(series):
+                top_values[column] = [[value, int(count)] for value, count in counts.head(TOP_K).items()]
+    return {"row_count": len(rows), "numeric": numeric, "top_values": top_values}
+
+
+def shape_rows(rows: list, store: ResultStore = result_store, max_rows: int = RESULT_MAX_ROWS) -> dict:
+    """
+    Encodes a list of row dicts as CSV, capping long sets.
+
+    Capped sets carry a summary of the full set and a handle for `get_result_page`.
+    """
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    shaped = {"format": "csv", "total_rows": len(rows), "csv": encode_csv(columns, rows[:max_rows])}
+    if len(rows) > max_rows:
+        shaped.update({
+            "shown_rows": max_rows,
+            "handle": store.put(columns, rows),
+            "summary": summarize_rows(columns, rows),
+            "note": f"First {max_rows} rows shown. Call get_result_page(handle, offset) for more.",
+        })
+    return shaped
+
+
+def shape_value(value, store: ResultStore = result_store, max_rows: int = RESULT_MAX_ROWS):
+    """Recursively replaces row sets inside a JSON-like value with their compact encoding."""
+    if _is_row_set(value):
+        return shape_rows(value, store, max_rows)
+    if isinstance(value, dict):
+        return {key: shape_value(item, store, max_rows) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shape_value(item, store, max_rows) for item in value]
+    return value
+
+
+def _compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def shape_tool_result(result: dict, store: ResultStore = result_store, max_rows: int = RESULT_MAX_ROWS) -> dict | None:
+    """
+    Shapes a tool result for the model.
+
+    MCP results carry JSON as text content (and sometimes a duplicate
+    `structuredContent`); the JSON is shaped and re-serialised compactly, and
+    the duplicate is dropped. Plain dict results are shaped directly.
+
+    Returns:
+        dict | None: The shaped result, or None if nothing changed.
+    """
+    if not isinstance(result, dict) or result.get("isError"):
+        return None
+
+    if "content" not in result:
+        shaped = shape_value(result, store, max_rows)
+        return shaped if shaped != result else None
+
+    structured = result.get("structuredContent")
+    content, changed = [], False
+    for item in result["content"]:
+        if isinstance(item, dict) and item.get("type") == "text":
+            try:
+                parsed = json.loads(item["text"])
+            except (TypeError, ValueError):
+                content.append(item)
+                continue
+            if structured is not None and parsed == structured:
+                structured = None
+            text = _compact_json(shape_value(parsed, store, max_rows))
+            changed = changed or text != item["text"]
+            item = {**item, "text": text}
+        content.append(item)
+
+    shaped = {key: value for key, value in result.items() if key != "structuredContent"}
+    shaped["content"] = content
+    if structured is not None:
+        shaped["structuredContent"] = shape_value(structured, store, max_rows)
+    changed = changed or "structuredContent" in result and shaped.get("structuredContent") != result["structuredContent"]
+    return shaped if changed else None
+
+
+def get_result_page(handle: str, offset: int = 0, limit: int = 50, tool_context: ToolContext | None = None) -> dict:
+    """
+    Returns more rows of a large tool result that was shown truncated.
+
+    Row sets kept with the session (by compaction) are found there once they
+    have left the in-memory result store.
+
+    Args:
+        handle: The `handle` from the truncated result (e.g. 'rs-1a2b3c4d').
+        offset: Index of the first row to return.
+        limit: Number of rows to return.
+
+    Returns:
+        dict: The requested rows as CSV with the total row count.
+    """
+    entry = result_store.get(handle)
+    if entry is None and tool_context is not None:
+        kept = tool_context.state.get(f"{SESSION_ROWS_PREFIX}{handle}")
+        entry = (kept["columns"], kept["rows"]) if kept else None
+    if entry is None:
+        return {"error": f"Unknown or expired result handle '{handle}'. Re-run the original tool call."}
+    columns, rows = entry
+    page = rows[offset:offset + limit]
+    return {
+        "handle": handle,
+        "offset": offset,
+        "returned_rows": len(page),
+        "total_rows": len(rows),
+        "format": "csv",
+        "csv": encode_csv(columns, page),
+    }
+
+
+class ResultShapingPlugin(BasePlugin):
+    """
+    Re-encodes tool results before they reach the model.
+
+    Row sets become CSV text instead of JSON objects with the column names
+    repeated on every row. Sets longer than `max_rows` are capped, with a
+    summary of the whole set and a handle for paging.
+    """
+
+    def __init__(self, store: ResultStore = result_store, max_rows: int = RESULT_MAX_ROWS, name: str = "result_shaping"):
+        super().__init__(name=name)
+        self.store = store
+        self.max_rows = max_rows
+
+    async def after_tool_callback(self, *, tool, tool_args, tool_context, result):
+        if tool.name == get_result_page.__name__:
+            return None
+        try:
+            return shape_tool_result(result, self.store, self.max_rows)
+        except Exception as e:
+            logger.warning(f"Could not shape result of {tool.name}: {e}")
+            return None
@@ -0,0 +1,173 @@
+import asyncio
+import atexit
+import logging
+import threading
+import uuid
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from chickens_app.latency import LatencyPlugin
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = "chickens_app"
+USER_ID = "chickens_user_101"
+
+
+class ConversationService:
+    """
+    Long-lived conversation service: one Runner, one session service and warm
+    toolset connections for the whole process.
+
+    MCP sessions are bound to the event loop that opened them, so the service
+    runs everything on its own background loop. `converse` can be awaited
+    from any loop (calls are forwarded to the service loop) and any number
+    of conversations can run concurrently; `converse_sync` is the blocking
+    entry point for synchronous callers such as the eval harness.
+
+    Args:
+        app: The App to serve. Defaults to the chickens app.
+        session_service: Defaults to an InMemorySessionService.
+        warm_up: Coroutine function `warm_up(connect)` run once before the first
+            turn. Defaults to `chickens_app.agent.warm_up` for the chickens app.
+    """
+
+    def __init__(self, app=None, session_service=None, warm_up=None, app_name: str = APP_NAME):
+        if app is None:
+            from chickens_app.agent import get_chickens_agent, warm_up as agent_warm_up
+            app, warm_up = get_chickens_agent(), warm_up or agent_warm_up
+        self.app = app
+        self.warm_up = warm_up
+        self.latency_plugin = next((plugin for plugin in app.plugins if isinstance(plugin, LatencyPlugin)), None)
+        self.app_name = app_name
+        self.session_service = session_service or InMemorySessionService()
+        self.runner = Runner(app=app, session_service=self.session_service)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="conversation-service", daemon=True)
+        self._thread.start()
+        self._started: asyncio.Future | None = None
+        self._closed = False
+
+    def _submit(self, coro):
+        """Runs a coroutine on the service loop and returns an awaitable for the calling loop."""
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                return coro
+        except RuntimeError:
+            pass
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    async def start(self, connect: bool = True) -> dict:
+        """Builds and connects all toolsets once. Returns the readiness report."""
+        return await self._submit(self._start(connect))
+
+    async def _start(self, connect: bool) -> dict:
+        if self.warm_up is None:
+            return {}
+        if self._started is None:
+            self._started = asyncio.ensure_future(self.warm_up(connect=connect))
+        started = self._started
+        try:
+            return await asyncio.shield(started)
+        except Exception:
+            # A failed warm-up is retried by the next caller instead of failing every later turn.
+            if self._started is started:
+                self._started = None
+            raise
+
+    async def converse(self, prompt: str, session_id: str | None = None, user_id: str = USER_ID,
+                       raise_errors: bool = False) -> dict:
+        """
+        Runs one turn. Without `session_id` a new session is created; pass the
+        returned `session_id` to continue the conversation. Errors are reported
+        in `response` unless `raise_errors` is set (e.g. by callers that retry).
+
+        Returns:
+            dict: `response`, `predicted_trajectory` (tool calls), `latency` and `session_id`.
+        """
+        return await self._submit(self._converse(prompt, session_id, user_id, raise_errors))
+
+    def converse_sync(self, prompt: str, session_id: str | None = None, user_id: str = USER_ID,
+                      raise_errors: bool = False) -> dict:
+        """Blocking `converse`, for callers without an event loop."""
+        return asyncio.run_coroutine_threadsafe(
+            self._converse(prompt, session_id, user_id, raise_errors), self._loop
+        ).result()
+
+    async def _converse(self, prompt: str, session_id: str | None, user_id: str, raise_errors: bool = False) -> dict:
+        try:
+            await self._start(connect=True)
+        except Exception as e:
+            if raise_errors:
+                raise
+            # Toolsets still build on first use, so the turn can go ahead.
+            logger.warning(f"Warm-up failed, continuing without it: {e}")
+        if session_id is None or await self.session_service.get_session(
+            app_name=self.app_name, user_id=user_id, session_id=session_id
+        ) is None:
+            session = await self.session_service.create_session(
+                app_name=self.app_name, user_id=user_id,
+                session_id=session_id or f"{self.app_name}-{uuid.uuid4().hex[:8]}",
+            )
+            session_id = session.id
+
+        final_response_text = "Unable to retrieve final response."
+        final_response_seen = False
+        invocation_id = None
+        tool_calls = []
+        try:
+            async for event in self.runner.run_async(
+                user_id=user_id,
+                session_id=session_id,
+                new_message=types.Content(role="user", parts=[types.Part(text=prompt)]),
+            ):
+                invocation_id = event.invocation_id
+                for part in (event.content.parts if event.content and event.content.parts else []):
+                    if part.function_call:
+                        tool_calls.append({"tool_name": part.function_call.name, "tool_input": dict(part.function_call.args or {})})
+                # Keep consuming after the final response so the run completes
+                # (after-run plugin hooks such as the latency breakdown fire at the end).
+                if event.is_final_response() and not final_response_seen:
+                    final_response_seen = True
+                    if event.content and event.content.parts:
+                        final_response_text = event.content.parts[0].text
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Error in conversation {session_id}: {e}")
+            final_response_text = f"An error occurred during the conversation: {e}"
+
+        return {
+            "response": final_response_text,
+            "predicted_trajectory": tool_calls,
+            "latency": self.latency_plugin.breakdown(invocation_id) if self.latency_plugin and invocation_id else None,
+            "session_id": session_id,
+        }
+
+    def close(self):
+        """Closes the runner (toolsets, plugins) and stops the service loop."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            asyncio.run_coroutine_threadsafe(self.runner.close(), self._loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Error closing conversation service: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+_service: ConversationService | None = None
+_service_lock = threading.Lock()
+
+
+def get_conversation_service() -> ConversationService:
+    """The process-wide conversation service, created on first use and closed at exit."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ConversationService()
+            atexit.register(_service.close)
+        return _service
@@ -1,3 +1,6 @@
+import argparse
+import asyncio
+import time
 import uuid
 import pandas as pd
 from datetime import datetime
@@ -7,7 +10,14 @@ from vertexai.preview.evaluation.metrics import (
    PointwiseMetric,
    TrajectorySingleToolUse,
 )
-from utils import save_evaluation_results, print_evaluation_summary, get_agent_response
+from utils import (
+   EVAL_CONCURRENCY,
+   EVAL_MAX_RETRIES,
+   EVAL_RATE_PER_MINUTE,
+   generate_responses,
+   print_evaluation_summary,
+   save_evaluation_results,
+)
 
 factual_accuracy_metric = PointwiseMetric(
    metric="factual_accuracy_metric",
@@ -49,10 +59,15 @@ completeness_metric = PointwiseMetric(
    ),
 )
 
-tool_use_metric = TrajectorySingleToolUse(tool_name="list_table_ids")
+# With the schema injected, answers should come from a query rather than table discovery.
+tool_use_metric = TrajectorySingleToolUse(tool_name="execute_sql")
 
 
-def run_eval():
+def run_eval(
+   concurrency: int = EVAL_CONCURRENCY,
+   rate_per_minute: float = EVAL_RATE_PER_MINUTE,
+   max_retries: int = EVAL_MAX_RETRIES,
+):
    eval_dataset = pd.read_json("evaluation_dataset.json")
 
    # Generate a unique run name
@@ -61,6 +76,21 @@ def run_eval():
 
    print(f"--- Starting evaluation: ({experiment_run_id}) ---")
 
+   # Generate all agent responses up front, concurrently on one event loop,
+   # then let EvalTask score the precomputed responses (no runnable).
+   started = time.perf_counter()
+   results = asyncio.run(
+       generate_responses(
+           eval_dataset["prompt"].tolist(),
+           concurrency=concurrency,
+           rate_per_minute=rate_per_minute,
+           max_retries=max_retries,
+       )
+   )
+   eval_dataset["response"] = [result["response"] for result in results]
+   eval_dataset["predicted_trajectory"] = [result["predicted_trajectory"] for result in results]
+   print(f"--- Responses generated in {time.perf_counter() - started:.1f}s, scoring ---")
+
    # Define the evaluation task with your dataset and metrics
    eval_task = EvalTask(
        dataset=eval_dataset,
@@ -73,9 +103,7 @@ def run_eval():
    )
 
    try:
-       eval_result = eval_task.evaluate(
-           runnable=get_agent_response, experiment_run_name=experiment_run_id
-       )
+       eval_result = eval_task.evaluate(experiment_run_name=experiment_run_id)
        save_evaluation_results(eval_result, experiment_run_id)
        print_evaluation_summary(eval_result)
 
@@ -84,4 +112,9 @@ def run_eval():
 
 
 if __name__ == "__main__":
-   run_eval()
\ No newline at end of file
+   parser = argparse.ArgumentParser(description="Evaluate the chickens agent on evaluation_dataset.json.")
+   parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY, help="Agent responses generated at once.")
+   parser.add_argument("--rate", type=float, default=EVAL_RATE_PER_MINUTE, help="Conversations started per minute (0 = unlimited).")
+   parser.add_argument("--retries", type=int, default=EVAL_MAX_RETRIES, help="Retries per prompt on transient failures.")
+   args = parser.parse_args()
+   run_eval(concurrency=args.concurrency, rate_per_minute=args.rate, max_retries=args.retries)
\ No newline at end of file
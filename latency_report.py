@@ -0,0 +1,43 @@
+"""
+Latency percentiles per component from the turn log written by `LatencyPlugin`.
+
+Usage:
+    python latency_report.py [--path .cache/latency.jsonl] [--last 500] [--prometheus]
+
+Components: turn (whole turn), model, tool, queue (waiting for a toolset
+concurrency slot) and a2a (marketing agent calls).
+"""
+import argparse
+
+from chickens_app.latency import DEFAULT_LATENCY_LOG_PATH, LATENCY_LOG_PATH, LatencyHistograms, load_turns, percentile_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency percentiles per component.")
+    parser.add_argument("--path", default=LATENCY_LOG_PATH or DEFAULT_LATENCY_LOG_PATH, help="JSONL log written by LatencyPlugin.")
+    parser.add_argument("--last", type=int, default=None, help="Only the most recent N turns.")
+    parser.add_argument("--prometheus", action="store_true", help="Print the histograms in Prometheus text format instead.")
+    args = parser.parse_args()
+
+    turns = load_turns(args.path, args.last)
+    if not turns:
+        print(f"No turns recorded in {args.path}")
+        return
+
+    if args.prometheus:
+        histograms = LatencyHistograms()
+        for turn in turns:
+            histograms.observe("turn", turn["turn_ms"] / 1000)
+            for span in turn["spans"]:
+                histograms.observe(span["component"], span["duration_ms"] / 1000)
+        print(histograms.render(), end="")
+        return
+
+    print(f"⏱️  {len(turns)} turns from {args.path}")
+    print(f"{'component':<10}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for component, stats in percentile_summary(turns).items():
+        print(f"{component:<10}{stats['count']:>8}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Bulk-loads analytics event files written by `FileAnalyticsSink` into BigQuery.
+
+Each completed file (gzip JSONL or Parquet) becomes one load job appending to
+the `agent_events` table, which is created with the plugin's schema if it does
+not exist. Loaded files are moved to a `loaded/` subdirectory so a re-run does
+not load them twice.
+
+Usage:
+    python load_analytics.py [--dir .cache/analytics] [--table agent_events] [--dry-run]
+
+`--dry-run` only reads the files locally and prints event counts per type.
+"""
+import argparse
+import os
+from collections import Counter
+from pathlib import Path
+
+from chickens_app.analytics import ANALYTICS_FILE_DIR, FILE_SUFFIXES, agent_events_schema, event_files, read_event_files
+
+
+def load_file(client, table_id: str, schema: list, path: Path):
+    from google.cloud import bigquery
+
+    is_parquet = str(path).endswith(FILE_SUFFIXES["parquet"])
+    job_config = bigquery.LoadJobConfig(
+        schema=schema,
+        source_format=bigquery.SourceFormat.PARQUET if is_parquet else bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+    )
+    with path.open("rb") as f:
+        job = client.load_table_from_file(f, table_id, job_config=job_config)
+    return job.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load analytics event files into BigQuery.")
+    parser.add_argument("--dir", default=ANALYTICS_FILE_DIR, help="Directory written by FileAnalyticsSink.")
+    parser.add_argument("--project", default=os.getenv("GOOGLE_CLOUD_PROJECT"))
+    parser.add_argument("--dataset", default=os.getenv("BIGQUERY_DATASET", "save_the_chickens"))
+    parser.add_argument("--table", default="agent_events")
+    parser.add_argument("--dry-run", action="store_true", help="Summarise the files without loading them.")
+    args = parser.parse_args()
+
+    files = event_files(args.dir)
+    if not files:
+        print(f"No completed event files in {args.dir}")
+        return
+
+    if args.dry_run:
+        events = read_event_files(files)
+        print(f"📦 {len(files)} files, {events.num_rows} events")
+        for event_type, count in Counter(events.column("event_type").to_pylist()).most_common():
+            print(f"  {event_type}: {count}")
+        return
+
+    if not args.project:
+        raise SystemExit("❌ Set GOOGLE_CLOUD_PROJECT or pass --project.")
+
+    from google.cloud import bigquery
+
+    schema = agent_events_schema()
+    client = bigquery.Client(project=args.project)
+    table_id = f"{args.project}.{args.dataset}.{args.table}"
+    table = bigquery.Table(table_id, schema=schema)
+    table.time_partitioning = bigquery.TimePartitioning(type_="DAY", field="timestamp")
+    client.create_table(table, exists_ok=True)
+
+    loaded_dir = Path(args.dir) / "loaded"
+    loaded_dir.mkdir(exist_ok=True)
+    total = 0
+    for path in files:
+        job = load_file(client, table_id, schema, path)
+        total += job.output_rows or 0
+        path.rename(loaded_dir / path.name)
+        print(f"✅ {path.name}: {job.output_rows} rows")
+    print(f"Loaded {total} events from {len(files)} files into {table_id}")
+
+
+if __name__ == "__main__":
+    main()
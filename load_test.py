@@ -0,0 +1,356 @@
+"""
+Concurrent load test for the chickens agent.
+
+Drives N concurrent sessions through one `ConversationService` (one Runner,
+the full plugin stack) with prompts sampled from `evaluation_dataset.json`,
+and reports throughput, p50/p95/p99 turn latency, event-loop lag, memory
+growth and open connections. Results are saved as JSON so runs can be
+compared across commits.
+
+Backends:
+  * `stub` (default): a scripted model and stub toolsets with configurable
+    latency; no network or credentials needed.
+  * `replay`: the real agent served from a cassette (see chickens_app/cassette.py).
+    Record one first with the same --sessions/--turns/--seed and
+    `CASSETTE_MODE=record python load_test.py --backend live`.
+  * `live`: the real agent as configured by the environment.
+
+Usage:
+    python load_test.py [--sessions 50] [--turns 3] [--backend stub] [--compare .cache/loadtest/<run>.json]
+"""
+import argparse
+import asyncio
+import gc
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent
+DATASET_PATH = PROJECT_ROOT / "evaluation_dataset.json"
+RESULTS_DIR = PROJECT_ROOT / ".cache" / "loadtest"
+
+# Stub toolsets: toolset name -> [(tool name, argument name)].
+STUB_TOOLS = {
+    "bigquery": [("execute_sql", "query")],
+    "maps": [("search_places", "text_query")],
+    "local": [("get_store_temperature", "store_id")],
+}
+
+
+def configure_environment(backend: str, cassette: str | None, run_dir: Path):
+    """Offline defaults for everything the agent would otherwise send to Google Cloud. Must run before importing it."""
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "loadtest-project")
+    if backend == "live":
+        return
+    os.environ.setdefault("CONTEXT_CACHE", "local")
+    os.environ.setdefault("ANALYTICS_SINK", "jsonl")
+    os.environ.setdefault("ANALYTICS_FILE_DIR", str(run_dir / "analytics"))
+    os.environ.setdefault("LATENCY_LOG_PATH", str(run_dir / "latency.jsonl"))
+    os.environ.setdefault("SCHEMA_SOURCE", "local")
+    if backend == "replay":
+        os.environ["CASSETTE_MODE"] = "replay"
+        if cassette:
+            os.environ["CASSETTE_PATH"] = cassette
+
+
+def build_stub_app(model_latency: float, tool_latency: float, rows: int):
+    """The chickens app with its plugins, but a scripted model and stub toolsets."""
+    from google.adk.agents import Agent
+    from google.adk.apps import App
+    from google.adk.models.base_llm import BaseLlm
+    from google.adk.models.llm_response import LlmResponse
+    from google.adk.tools.base_tool import BaseTool
+    from google.adk.tools.base_toolset import BaseToolset
+    from google.genai import types
+
+    from chickens_app import agent
+    from chickens_app.plugins import ToolsetWarmupPlugin
+    from chickens_app.result_shaping import get_result_page
+    from mcp_server.toolsets import ConcurrencyLimitedToolset
+
+    arguments = {tool: argument for tools in STUB_TOOLS.values() for tool, argument in tools}
+
+    def jittered(seconds: float) -> float:
+        return seconds * random.uniform(0.5, 1.5)
+
+    class StubTool(BaseTool):
+        def __init__(self, name: str, argument: str):
+            super().__init__(name=name, description=f"Stub {name}.")
+            self.argument = argument
+
+        def _get_declaration(self):
+            return types.FunctionDeclaration(
+                name=self.name, description=self.description,
+                parameters=types.Schema(type="OBJECT", properties={self.argument: types.Schema(type="STRING")}),
+            )
+
+        async def run_async(self, *, args: dict, tool_context):
+            await asyncio.sleep(jittered(tool_latency))
+            seed = int(hashlib.sha256(json.dumps(args, sort_keys=True).encode()).hexdigest()[:8], 16)
+            data = [
+                {"product_id": 1000 + (seed + i) % 12, "store_id": f"S{(seed + i) % 40:03d}", "quantity": (seed * (i + 1)) % 500}
+                for i in range(rows)
+            ]
+            return {"content": [{"type": "text", "text": json.dumps(data)}], "isError": False}
+
+    class StubToolset(BaseToolset):
+        def __init__(self, name: str):
+            super().__init__()
+            self.name = name
+            self.tools = [StubTool(tool, argument) for tool, argument in STUB_TOOLS[name]]
+
+        async def get_tools(self, readonly_context=None):
+            return self.tools
+
+        async def close(self) -> None:
+            pass
+
+    class StubLlm(BaseLlm):
+        """Calls one or two tools for a new prompt, then answers from the tool results."""
+
+        async def generate_content_async(self, llm_request, stream: bool = False):
+            await asyncio.sleep(jittered(model_latency))
+            last = llm_request.contents[-1]
+            results = [part.function_response for part in last.parts or [] if part.function_response]
+            if results:
+                text = "Summary of " + ", ".join(result.name for result in results) + "."
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+                return
+            prompt = " ".join(part.text for part in last.parts or [] if part.text)
+            digest = int(hashlib.sha256(prompt.encode()).hexdigest()[:8], 16)
+            tools = [name for name in sorted(llm_request.tools_dict) if name != "get_result_page"]
+            calls = [tools[(digest + i) % len(tools)] for i in range(1 + digest % 2)]
+            yield LlmResponse(content=types.Content(role="model", parts=[
+                types.Part(function_call=types.FunctionCall(name=name, args={arguments.get(name, "query"): f"{prompt[:80]} #{i}"}))
+                for i, name in enumerate(calls)
+            ]))
+
+    toolsets = [
+        ConcurrencyLimitedToolset(StubToolset(name), agent.TOOLSET_CONCURRENCY.get(name, 4))
+        for name in STUB_TOOLS
+    ]
+    for toolset in toolsets:
+        toolset.listeners.append(agent.latency_plugin.record_tool_timing)
+    root_agent = Agent(
+        name=agent.root_agent.name,
+        model=StubLlm(model="stub"),
+        description=agent.root_agent.description,
+        instruction=agent.root_agent.instruction,
+        tools=toolsets + [get_result_page],
+    )
+    # The real toolsets are never used, so they must not be warmed up.
+    plugins = [plugin for plugin in agent.app_plugins if not isinstance(plugin, ToolsetWarmupPlugin)]
+    return App(name=agent.app.name, root_agent=root_agent, plugins=plugins)
+
+
+def sample_conversations(sessions: int, turns: int, seed: int) -> list:
+    """Prompts per session; the same arguments always give the same conversations (for replay)."""
+    prompts = [item["prompt"] for item in json.loads(DATASET_PATH.read_text())]
+    rng = random.Random(seed)
+    return [[rng.choice(prompts) for _ in range(turns)] for _ in range(sessions)]
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), or peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def open_handles() -> dict:
+    """Open file descriptors and sockets of this process (Linux only)."""
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return {"fds": None, "sockets": None}
+    sockets = 0
+    for fd in fds:
+        try:
+            sockets += os.readlink(f"/proc/self/fd/{fd}").startswith("socket:")
+        except OSError:
+            pass
+    return {"fds": len(fds), "sockets": sockets}
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    return {
+        "count": len(samples),
+        **{f"p{q}": round(float(np.percentile(samples, q)), 1) for q in (50, 95, 99)},
+        "max": round(max(samples), 1),
+    }
+
+
+async def monitor_loop_lag(lags: list, stop: threading.Event, interval: float = 0.05):
+    """Runs on the service loop: how late each `interval` wake-up is, in ms."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append((loop.time() - started - interval) * 1000)
+
+
+async def sample_resources(samples: list, stop: threading.Event, interval: float = 0.25):
+    while not stop.is_set():
+        samples.append({"rss_mb": rss_mb(), **open_handles()})
+        await asyncio.sleep(interval)
+
+
+async def run_session(service, prompts: list, think_time: float, turns: list):
+    session_id = None
+    for prompt in prompts:
+        started = time.perf_counter()
+        result = await service.converse(prompt, session_id=session_id)
+        session_id = result["session_id"]
+        turns.append({
+            "ms": (time.perf_counter() - started) * 1000,
+            "error": result["response"].startswith("An error occurred"),
+            "breakdown": result["latency"],
+        })
+        if think_time:
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
+
+
+async def run_load(service, conversations: list, think_time: float) -> dict:
+    await service.start()
+    gc.collect()
+    baseline = {"rss_mb": rss_mb(), **open_handles()}
+
+    lags, resources, turns = [], [], []
+    stop = threading.Event()
+    # Lag is measured on the service loop, where the conversations actually run.
+    lag_monitor = asyncio.run_coroutine_threadsafe(monitor_loop_lag(lags, stop), service._loop)
+    sampler = asyncio.create_task(sample_resources(resources, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(service, prompts, think_time, turns) for prompts in conversations))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await sampler
+    await asyncio.wrap_future(lag_monitor)
+    gc.collect()
+    final = {"rss_mb": rss_mb(), **open_handles()}
+
+    latencies = [turn["ms"] for turn in turns]
+    breakdowns = [turn["breakdown"] for turn in turns if turn["breakdown"]]
+    from chickens_app.latency import percentile_summary
+
+    return {
+        "turns": len(turns),
+        "errors": sum(turn["error"] for turn in turns),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_turns_per_s": round(len(turns) / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+        "components_ms": percentile_summary(breakdowns),
+        "event_loop_lag_ms": percentiles(lags),
+        "memory_mb": {
+            "baseline": round(baseline["rss_mb"], 1),
+            "peak": round(max([baseline["rss_mb"]] + [sample["rss_mb"] for sample in resources]), 1),
+            "final": round(final["rss_mb"], 1),
+            "growth": round(final["rss_mb"] - baseline["rss_mb"], 1),
+        },
+        "open_connections": {
+            "baseline": baseline["sockets"],
+            "peak": max((sample["sockets"] for sample in resources if sample["sockets"] is not None), default=None),
+            "final": final["sockets"],
+        },
+        "open_fds": {"baseline": baseline["fds"], "final": final["fds"]},
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, previous: dict):
+    """Prints the headline metrics of two runs side by side."""
+    rows = [
+        ("throughput_turns_per_s",), ("latency_ms", "p50"), ("latency_ms", "p95"), ("latency_ms", "p99"),
+        ("event_loop_lag_ms", "p99"), ("memory_mb", "growth"), ("open_connections", "peak"), ("errors",),
+    ]
+    print(f"\n{'metric':<28}{previous.get('commit') or 'previous':>12}{current.get('commit') or 'current':>12}")
+    for path in rows:
+        values = []
+        for run in (previous, current):
+            value = run["results"]
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            values.append(value)
+        print(f"{'.'.join(path):<28}{str(values[0]):>12}{str(values[1]):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the chickens agent.")
+    parser.add_argument("--sessions", type=int, default=50, help="Concurrent sessions.")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between turns, in seconds.")
+    parser.add_argument("--seed", type=int, default=0, help="Prompt sampling seed.")
+    parser.add_argument("--backend", choices=("stub", "replay", "live"), default="stub")
+    parser.add_argument("--cassette", help="Cassette directory for --backend replay (default: CASSETTE_PATH).")
+    parser.add_argument("--model-latency", type=float, default=0.5, help="Stub model latency per call, in seconds.")
+    parser.add_argument("--tool-latency", type=float, default=0.2, help="Stub tool latency per call, in seconds.")
+    parser.add_argument("--rows", type=int, default=20, help="Rows per stub tool result.")
+    parser.add_argument("--output", help="Results file (default: .cache/loadtest/<commit>-<time>.json).")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit or 'nocommit'}-{stamp}.json"
+    run_dir = output.with_suffix("")
+    configure_environment(args.backend, args.cassette, run_dir)
+
+    from chickens_app.service import ConversationService
+
+    random.seed(args.seed)
+    if args.backend == "stub":
+        service = ConversationService(
+            app=build_stub_app(args.model_latency, args.tool_latency, args.rows),
+            warm_up=None,
+        )
+    else:
+        service = ConversationService()
+    conversations = sample_conversations(args.sessions, args.turns, args.seed)
+
+    print(f"🚀 {args.sessions} sessions x {args.turns} turns against the {args.backend} backend...")
+    try:
+        results = asyncio.run(run_load(service, conversations, args.think_time))
+    finally:
+        service.close()
+
+    report = {
+        "commit": commit,
+        "timestamp": stamp,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(json.dumps(results, indent=2))
+    print(f"💾 Saved {output}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import datetime
+import logging
+import threading
+
+import google.auth
+import google.auth.transport.requests
+
+logger = logging.getLogger("mcp_server")
+
+BIGQUERY_SCOPES = ["https://www.googleapis.com/auth/bigquery"]
+
+
+def _utcnow() -> datetime.datetime:
+    # google-auth keeps expiry as a naive UTC datetime.
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class RefreshingAuthHeaders:
+    """
+    Auth header provider backed by Application Default Credentials.
+
+    Tokens are refreshed by a background thread `refresh_margin` seconds before
+    they expire, so `headers()` normally returns cached headers without blocking.
+    If a caller does find the token stale (e.g. the background refresh failed),
+    it refreshes inline; concurrent callers share that single refresh.
+
+    Instances are callable with a ReadonlyContext, so they can be passed directly
+    as an MCPToolset `header_provider`.
+    """
+
+    def __init__(self, scopes: list = BIGQUERY_SCOPES, refresh_margin: float = 300.0, retry_interval: float = 30.0):
+        self._scopes = scopes
+        self._refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self._retry_interval = retry_interval
+        self._credentials = None
+        self._project_id = None
+        self._headers = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refresh_count = 0
+
+    def _is_fresh(self) -> bool:
+        credentials = self._credentials
+        if self._headers is None or credentials is None or not credentials.token:
+            return False
+        # Credentials without an expiry (e.g. some user tokens) never go stale on their own.
+        return credentials.expiry is None or credentials.expiry - self._refresh_margin > _utcnow()
+
+    def _refresh(self):
+        # Caller holds self._lock.
+        if self._credentials is None:
+            # Finds credentials from `gcloud auth application-default login`
+            # or the service account attached to the compute instance.
+            self._credentials, self._project_id = google.auth.default(scopes=self._scopes)
+        self._credentials.refresh(google.auth.transport.requests.Request())
+        self.refresh_count += 1
+        # - Authorization: Bearer token for authentication
+        # - x-goog-user-project: Required for billing/quota attribution
+        self._headers = {
+            "Authorization": f"Bearer {self._credentials.token}",
+            "x-goog-user-project": self._project_id,
+        }
+        logger.info(f"Refreshed Google access token (expires {self._credentials.expiry})")
+
+    def headers(self) -> dict:
+        """Returns headers with a valid access token, refreshing once if needed (single-flight)."""
+        if not self._is_fresh():
+            with self._lock:
+                # Another caller may have refreshed while we waited for the lock.
+                if not self._is_fresh():
+                    self._refresh()
+        return dict(self._headers)
+
+    def __call__(self, readonly_context=None) -> dict:
+        return self.headers()
+
+    def _seconds_until_refresh(self) -> float:
+        expiry = self._credentials.expiry if self._credentials else None
+        if expiry is None:
+            return 3600.0
+        return max((expiry - self._refresh_margin - _utcnow()).total_seconds(), 0.0)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self._seconds_until_refresh()):
+            try:
+                with self._lock:
+                    if not self._is_fresh():
+                        self._refresh()
+            except Exception as e:
+                logger.warning(f"Background token refresh failed, retrying in {self._retry_interval}s: {e}")
+                if self._stop.wait(self._retry_interval):
+                    return
+
+    def start(self):
+        """Starts the background refresh thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="auth-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background refresh thread."""
+        self._stop.set()
+
+
+_bigquery_auth = None
+_bigquery_auth_lock = threading.Lock()
+
+
+def get_bigquery_auth() -> RefreshingAuthHeaders:
+    """Returns the process-wide BigQuery header provider, shared by all sessions."""
+    global _bigquery_auth
+    with _bigquery_auth_lock:
+        if _bigquery_auth is None:
+            _bigquery_auth = RefreshingAuthHeaders(BIGQUERY_SCOPES)
+        return _bigquery_auth
@@ -0,0 +1,144 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from mcp_server.data import load_table, table_version
+
+logger = logging.getLogger("mcp_server")
+
+# Recipe units normalised to a base unit per dimension.
+# Count units (each, cloves, stalks) have no common base and are kept as-is.
+UNIT_CONVERSIONS = {
+    "grams": ("g", 1.0),
+    "kg": ("g", 1000.0),
+    "ml": ("ml", 1.0),
+    "tbsp": ("ml", 15.0),
+    "tsp": ("ml", 5.0),
+    "each": ("each", 1.0),
+    "cloves": ("cloves", 1.0),
+    "stalks": ("stalks", 1.0),
+}
+
+
+class BillOfMaterials:
+    """
+    Sparse product -> ingredient matrix built from `Recipes` and `ProductMasterData`.
+
+    The matrix is stored as coordinate arrays (product index, ingredient index,
+    quantity in base units), so exploding a sales or forecast vector into
+    ingredient demand is a single vectorised multiply-and-accumulate.
+    """
+
+    def __init__(self, recipes: pd.DataFrame, products: pd.DataFrame):
+        # ProductMasterData.RecipeID is the authoritative product -> recipe link.
+        linked = products.dropna(subset=["RecipeID"]).merge(
+            recipes.drop(columns=["ProductID"]), on="RecipeID"
+        )
+
+        units = linked["Unit"].str.strip().str.lower()
+        unknown = sorted(set(units) - UNIT_CONVERSIONS.keys())
+        if unknown:
+            logger.warning(f"Unknown recipe units kept unconverted: {unknown}")
+        base_unit = units.map(lambda u: UNIT_CONVERSIONS.get(u, (u, 1.0))[0])
+        factor = units.map(lambda u: UNIT_CONVERSIONS.get(u, (u, 1.0))[1])
+
+        # The same ingredient can appear in different dimensions across recipes
+        # (e.g. Carrots "each" vs "grams"), so ingredients are keyed by name and base unit.
+        keys = pd.MultiIndex.from_arrays([linked["IngredientName"], base_unit])
+        ingredient_codes, ingredient_keys = pd.factorize(keys, sort=True)
+
+        self.product_ids = products["ProductNumber"].to_numpy()
+        self._product_index = {pid: i for i, pid in enumerate(self.product_ids)}
+
+        self.ingredients = pd.DataFrame(
+            {
+                "IngredientName": ingredient_keys.get_level_values(0),
+                "Unit": ingredient_keys.get_level_values(1),
+            }
+        )
+        # An ingredient is only as durable as its shortest listed shelf life.
+        self.ingredients["IngredientShelfLifeDays"] = (
+            linked.groupby(ingredient_codes)["IngredientShelfLifeDays"].min().to_numpy()
+        )
+
+        self._rows = linked["ProductNumber"].map(self._product_index).to_numpy()
+        self._cols = ingredient_codes
+        self._quantities = (linked["IngredientQuantity"] * factor).to_numpy(dtype=np.float64)
+
+    @property
+    def shape(self) -> tuple:
+        return len(self.product_ids), len(self.ingredients)
+
+    def product_vector(self, product_quantities: dict) -> np.ndarray:
+        """Converts a {ProductNumber: quantity} mapping into a dense product vector."""
+        vector = np.zeros(len(self.product_ids), dtype=np.float64)
+        for product_id, quantity in product_quantities.items():
+            index = self._product_index.get(str(product_id))
+            if index is not None:
+                vector[index] += quantity
+        return vector
+
+    def explode(self, product_vector: np.ndarray) -> np.ndarray:
+        """
+        Multiplies a product quantity vector through the recipe matrix.
+
+        Args:
+            product_vector: Quantities aligned with `product_ids`.
+
+        Returns:
+            np.ndarray: Ingredient demand in base units, aligned with `ingredients`.
+        """
+        return np.bincount(
+            self._cols,
+            weights=self._quantities * product_vector[self._rows],
+            minlength=len(self.ingredients),
+        )
+
+
+_bom = None
+_bom_version = None
+
+
+def get_bill_of_materials() -> BillOfMaterials:
+    """
+    Returns the shared bill of materials, rebuilding it only when the recipe data changes.
+    """
+    global _bom, _bom_version
+    version = (table_version("Recipes"), table_version("ProductMasterData"))
+    if _bom is None or version != _bom_version:
+        _bom = BillOfMaterials(load_table("Recipes"), load_table("ProductMasterData"))
+        _bom_version = version
+        logger.info(f"Built bill of materials: {_bom.shape[0]} products x {_bom.shape[1]} ingredients")
+    return _bom
+
+
+def ingredient_demand(product_quantities: dict, window_days: int = 1) -> pd.DataFrame:
+    """
+    Explodes product quantities into ingredient demand and expiry risk.
+
+    Expiry risk compares each ingredient's shelf life with the planning window:
+    an ingredient that cannot be held for the whole window must be bought in
+    several deliveries, and anything beyond `MaxStockBeforeExpiry` will expire.
+
+    Args:
+        product_quantities: {ProductNumber: quantity} sold or forecast over the window.
+        window_days: Length of the window in days.
+
+    Returns:
+        pd.DataFrame: One row per ingredient with non-zero demand.
+    """
+    bom = get_bill_of_materials()
+    demand = bom.explode(bom.product_vector(product_quantities))
+    window_days = max(int(window_days), 1)
+
+    result = bom.ingredients.copy()
+    result["Quantity"] = demand
+    result["DailyDemand"] = demand / window_days
+    result["MaxStockBeforeExpiry"] = result["DailyDemand"] * result["IngredientShelfLifeDays"]
+    shelf_life = result["IngredientShelfLifeDays"]
+    result["ExpiryRisk"] = np.select(
+        [shelf_life <= 2, shelf_life < window_days], ["HIGH", "MEDIUM"], default="LOW"
+    )
+    result = result[result["Quantity"] > 0]
+    return result.sort_values(["IngredientShelfLifeDays", "Quantity"], ascending=[True, False])
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import os
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Local copy of the Save the Chickens dataset.
+# These are the same CSV files `bigquery_source_data/setup_bigquery.sh` loads
+# into BigQuery, so tools can answer deterministic questions in-process
+# instead of round-tripping generated SQL through the BigQuery MCP server.
+PROJECT_ROOT = Path(__file__).parent.parent
+DATA_DIR = Path(os.getenv("CHICKENS_DATA_DIR", PROJECT_ROOT / "bigquery_source_data"))
+
+logger = logging.getLogger("mcp_server")
+
+# Identifier columns are kept as strings (e.g. "1001", "S001"), matching how
+# the instructions present them.
+_STRING_COLUMNS = {
+    "ProductNumber": str,
+    "ProductID": str,
+    "RecipeID": str,
+    "StoreID": str,
+    "FacilityID": str,
+}
+
+# Date columns per table. Timestamps in product_sales are stored as UTC
+# strings ("2024-02-22 00:00:00 UTC") and are normalised to naive dates.
+_DATE_COLUMNS = {
+    "product_sales": ["SaleDate", "DeliveryDate", "DueDate"],
+    "StoreStock": ["StockDate", "DeliveryDate", "ExpiryDate"],
+    "DistributionStock": ["StockDate", "DeliveryDate", "ExpiryDate"],
+    "CustomerFeedback": ["FeedbackDate"],
+    "WasteTracking": ["WasteDate"],
+}
+
+# name -> (version, DataFrame)
+_tables = {}
+# Tools may load tables from worker threads (see snapshot.py). Each table has
+# its own lock, so different tables parse in parallel and a table is parsed once.
+_table_locks = {}
+_table_locks_guard = threading.Lock()
+
+
+def table_path(name: str) -> Path:
+    """Returns the CSV path backing a dataset table."""
+    return DATA_DIR / f"{name}.csv"
+
+
+def table_version(name: str) -> int:
+    """
+    Returns a version stamp for a table (the CSV modification time).
+
+    Derived structures (indexes, matrices) store this stamp and rebuild
+    only when it changes.
+    """
+    return table_path(name).stat().st_mtime_ns
+
+
+def load_table(name: str) -> pd.DataFrame:
+    """
+    Loads a dataset table from its CSV file, reusing the parsed frame until the file changes.
+
+    The returned DataFrame is shared between callers and must not be mutated.
+
+    Args:
+        name: The table name as used in BigQuery (e.g. 'StoreStock').
+
+    Returns:
+        pd.DataFrame: The table contents.
+    """
+    import pandas as pd
+
+    with _table_locks_guard:
+        lock = _table_locks.setdefault(name, threading.Lock())
+    with lock:
+        version = table_version(name)
+        cached = _tables.get(name)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        df = pd.read_csv(table_path(name), dtype=_STRING_COLUMNS)
+        for column in _DATE_COLUMNS.get(name, []):
+            df[column] = pd.to_datetime(df[column], utc=True).dt.tz_localize(None).dt.normalize()
+
+        _tables[name] = (version, df)
+        logger.info(f"Loaded local table {name} ({len(df)} rows)")
+        return df
+
+
+def current_stock(name: str, today: pd.Timestamp | None = None) -> pd.DataFrame:
+    """
+    Returns the latest stock snapshot with dates rebased to today.
+
+    Mirrors the `store_stock_current` / `distribution_stock_current` views:
+    only the latest `StockDate` per location and product is kept, and all
+    dates are shifted by (today - latest StockDate) so the sample data always
+    looks current.
+
+    Args:
+        name: 'StoreStock' or 'DistributionStock'.
+        today: Reference date. Defaults to the current date.
+
+    Returns:
+        pd.DataFrame: Stock rows with an added `DaysUntilExpiry` column.
+    """
+    import pandas as pd
+
+    stock = load_table(name)
+    location = "StoreID" if name == "StoreStock" else "FacilityID"
+    today = (today or pd.Timestamp.today()).normalize()
+
+    latest = stock.groupby([location, "ProductNumber"])["StockDate"].transform("max")
+    stock = stock[stock["StockDate"] == latest].copy()
+
+    offset = today - stock["StockDate"].max()
+    for column in ["StockDate", "DeliveryDate", "ExpiryDate"]:
+        stock[column] = stock[column] + offset
+    stock["DaysUntilExpiry"] = (stock["ExpiryDate"] - today).dt.days
+    return stock
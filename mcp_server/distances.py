@@ -0,0 +1,370 @@
+"""
+Offline road-distance matrix between stores and distribution facilities.
+
+Ranking questions ("nearest distribution centre to S005", "which stores can
+cover a transfer from London Central") only need approximate road distances.
+Those are estimated without any Maps call: great-circle (haversine) distance
+times a road factor, and drive time from an average speed. Both parameters
+can be calibrated once against the routes already in the Maps result cache
+(`mcp_server/maps_cache.py`); Maps is then only needed for the final route.
+
+The matrix covers every site pair (store <-> store, facility <-> store and
+facility <-> facility) as float32 arrays indexed by site id. It is stored at
+`ROUTE_MATRIX_PATH` and rebuilt only when `Stores` or `DistributionFacilities`
+change; a rebuild keeps the previous calibration. Running servers pick up a
+replaced artifact (e.g. a new calibration) on their next lookup.
+
+Usage:
+    python -m mcp_server.distances --calibrate   # fit road factor and speed to cached Maps routes
+    python -m mcp_server.distances --stats
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from mcp_server.data import PROJECT_ROOT, load_table, table_version
+
+logger = logging.getLogger("mcp_server")
+
+ROUTE_MATRIX_PATH = Path(os.getenv("ROUTE_MATRIX_PATH", PROJECT_ROOT / ".cache" / "route_matrix.npz"))
+# Road distance / straight-line distance, used until calibrated against Maps routes.
+ROUTE_ROAD_FACTOR = float(os.getenv("ROUTE_ROAD_FACTOR", "1.3"))
+# Average driving speed (km/h) for drive-time estimates, used until calibrated.
+ROUTE_SPEED_KMH = float(os.getenv("ROUTE_SPEED_KMH", "50"))
+# Fewer cached Maps routes than this leave the defaults in place.
+ROUTE_CALIBRATION_MIN_ROUTES = int(os.getenv("ROUTE_CALIBRATION_MIN_ROUTES", "5"))
+
+EARTH_RADIUS_KM = 6371.0088
+# (table, id column, name column, site kind)
+SITE_TABLES = (
+    ("Stores", "StoreID", "StoreName", "store"),
+    ("DistributionFacilities", "FacilityID", "FacilityName", "facility"),
+)
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+
+def data_version() -> str:
+    return "-".join(str(table_version(table)) for table, *_ in SITE_TABLES)
+
+
+def load_sites() -> tuple:
+    """Site ids, kinds and (latitude, longitude) rows, stores first."""
+    ids, kinds, coordinates = [], [], []
+    for table, id_column, _, kind in SITE_TABLES:
+        frame = load_table(table)
+        ids.extend(frame[id_column].astype(str))
+        kinds.extend([kind] * len(frame))
+        coordinates.extend(zip(frame["Latitude"].astype(float), frame["Longitude"].astype(float)))
+    return np.array(ids), np.array(kinds), np.array(coordinates, dtype=np.float64)
+
+
+def site_directory() -> dict:
+    """Site id -> {"Name", "City"} for stores and facilities."""
+    directory = {}
+    for table, id_column, name_column, _ in SITE_TABLES:
+        frame = load_table(table)
+        for site, name, city in zip(frame[id_column].astype(str), frame[name_column], frame["City"]):
+            directory[site] = {"Name": name, "City": city}
+    return directory
+
+
+def resolve_site(value: str, directory: Optional[dict] = None) -> Optional[str]:
+    """
+    Resolves a StoreID / FacilityID, or part of a site name, to a site id.
+
+    An exact id wins; otherwise the first site whose name contains `value`
+    (case-insensitive), stores before facilities.
+    """
+    directory = directory if directory is not None else site_directory()
+    value = value.strip()
+    if value.upper() in directory:
+        return value.upper()
+    needle = value.lower()
+    return next((site for site, info in directory.items() if needle and needle in str(info["Name"]).lower()), None)
+
+
+def haversine_matrix(coordinates: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km between (latitude, longitude) rows."""
+    lat, lng = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+    h = (
+        np.sin((lat[:, None] - lat[None, :]) / 2) ** 2
+        + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin((lng[:, None] - lng[None, :]) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+class RouteMatrix:
+    """
+    Estimated road distance (km) and drive time (minutes) between all sites.
+
+    Args:
+        ids: Site ids (StoreID / FacilityID), one per matrix row and column.
+        kinds: "store" or "facility" per site.
+        straight_km: Great-circle distances.
+        road_factor: Road distance / straight-line distance.
+        speed_kmh: Average driving speed.
+        version: Version of the site tables the matrix was built from.
+        calibration: How the parameters were obtained ({"routes": n, ...}), or None for the defaults.
+    """
+
+    def __init__(self, ids, kinds, straight_km, road_factor: float = ROUTE_ROAD_FACTOR,
+                 speed_kmh: float = ROUTE_SPEED_KMH, version: str = "", calibration: Optional[dict] = None):
+        self.ids = np.asarray(ids)
+        self.kinds = np.asarray(kinds)
+        self.straight_km = np.asarray(straight_km, dtype=np.float32)
+        self.road_factor = float(road_factor)
+        self.speed_kmh = float(speed_kmh)
+        self.version = version
+        self.calibration = calibration
+        self.index = {site: i for i, site in enumerate(self.ids)}
+        self.km = self.straight_km * np.float32(self.road_factor)
+        self.minutes = self.km * np.float32(60.0 / self.speed_kmh)
+
+    @classmethod
+    def build(cls, road_factor: float = ROUTE_ROAD_FACTOR, speed_kmh: float = ROUTE_SPEED_KMH,
+              calibration: Optional[dict] = None) -> "RouteMatrix":
+        ids, kinds, coordinates = load_sites()
+        return cls(ids, kinds, haversine_matrix(coordinates), road_factor, speed_kmh, data_version(), calibration)
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def distance(self, origin: str, destination: str) -> dict:
+        i, j = self.index[origin], self.index[destination]
+        return {
+            "RoadKm": round(float(self.km[i, j]), 1),
+            "DriveMinutes": round(float(self.minutes[i, j])),
+            "StraightKm": round(float(self.straight_km[i, j]), 1),
+        }
+
+    def nearest(self, origin: str, kind: str = "", destinations: Optional[list] = None, limit: int = 5) -> list:
+        """
+        Sites ranked by estimated road distance from `origin`.
+
+        Args:
+            origin: Site id.
+            kind: Optional "store" or "facility" filter.
+            destinations: Optional site ids to rank; defaults to all sites.
+            limit: Maximum number of sites to return (<= 0 for all).
+
+        Returns:
+            list: [{"SiteID", "Kind", "RoadKm", "DriveMinutes", "StraightKm"}], nearest first.
+        """
+        i = self.index[origin]
+        if destinations is None:
+            mask = np.ones(self.size, dtype=bool)
+        else:
+            mask = np.isin(self.ids, list(destinations))
+        mask[i] = False
+        if kind:
+            mask &= self.kinds == kind
+        candidates = np.flatnonzero(mask)
+        order = candidates[np.argsort(self.km[i, candidates], kind="stable")]
+        if limit > 0:
+            order = order[:limit]
+        return [
+            {"SiteID": str(self.ids[j]), "Kind": str(self.kinds[j]), **self.distance(origin, str(self.ids[j]))}
+            for j in order
+        ]
+
+    def parameters(self) -> dict:
+        return {
+            "road_factor": round(self.road_factor, 3),
+            "speed_kmh": round(self.speed_kmh, 1),
+            "calibration": self.calibration,
+            "version": self.version,
+        }
+
+    def save(self, path: Path = ROUTE_MATRIX_PATH):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp,
+                ids=self.ids.astype(str),
+                kinds=self.kinds.astype(str),
+                straight_km=self.straight_km,
+                meta=np.array(json.dumps(self.parameters())),
+            )
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write route matrix {path}: {e}")
+
+    @classmethod
+    def load(cls, path: Path = ROUTE_MATRIX_PATH) -> Optional["RouteMatrix"]:
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as artifact:
+                meta = json.loads(str(artifact["meta"]))
+                return cls(
+                    artifact["ids"], artifact["kinds"], artifact["straight_km"],
+                    meta["road_factor"], meta["speed_kmh"], meta["version"], meta["calibration"],
+                )
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable route matrix {path}: {e}")
+            return None
+
+
+_matrix = None
+_matrix_mtime = None  # mtime of the artifact `_matrix` was loaded from or saved to
+_matrix_lock = threading.Lock()
+
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def _save_matrix(path: Path):
+    # Caller holds _matrix_lock.
+    global _matrix_mtime
+    _matrix.save(path)
+    _matrix_mtime = _mtime(path)
+
+
+def get_route_matrix(path: Path = ROUTE_MATRIX_PATH) -> RouteMatrix:
+    """
+    Returns the shared route matrix, rebuilding it only when the site tables change.
+
+    The artifact is reloaded when another process replaced it (e.g. after
+    `--calibrate`). A rebuild keeps the road factor and speed of a calibrated artifact.
+    """
+    global _matrix, _matrix_mtime
+    with _matrix_lock:
+        version = data_version()
+        mtime = _mtime(path)
+        if _matrix is None or (mtime is not None and mtime != _matrix_mtime):
+            loaded = RouteMatrix.load(path)
+            if loaded is not None:
+                _matrix, _matrix_mtime = loaded, mtime
+        stale = _matrix is None or _matrix.version != version or (
+            # Uncalibrated matrices follow the configured defaults.
+            not _matrix.calibration and (_matrix.road_factor, _matrix.speed_kmh) != (ROUTE_ROAD_FACTOR, ROUTE_SPEED_KMH)
+        )
+        if stale:
+            previous = _matrix if _matrix is not None and _matrix.calibration else None
+            started = time.perf_counter()
+            if previous:
+                _matrix = RouteMatrix.build(previous.road_factor, previous.speed_kmh, previous.calibration)
+            else:
+                _matrix = RouteMatrix.build()
+            _save_matrix(path)
+            logger.info(f"Built {_matrix.size}x{_matrix.size} route matrix in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return _matrix
+
+
+# --- Calibration ---------------------------------------------------------
+
+def route_metrics(result) -> Optional[tuple]:
+    """
+    (distance in meters, duration in seconds) of the first route in a Maps
+    result, looking inside MCP text content, or None.
+    """
+    if isinstance(result, str):
+        try:
+            result = json.loads(result)
+        except ValueError:
+            return None
+    if isinstance(result, dict):
+        if "distanceMeters" in result:
+            duration = result.get("duration", result.get("staticDuration"))
+            if isinstance(duration, str):
+                match = _DURATION.match(duration)
+                duration = float(match.group(1)) if match else None
+            return float(result["distanceMeters"]), float(duration) if duration is not None else None
+        values = result.values()
+    elif isinstance(result, list):
+        values = result
+    else:
+        return None
+    for value in values:
+        metrics = route_metrics(value)
+        if metrics is not None:
+            return metrics
+    return None
+
+
+def fit_parameters(samples: list, min_routes: int = ROUTE_CALIBRATION_MIN_ROUTES) -> Optional[dict]:
+    """
+    Fits the road factor and speed to (straight km, road km, seconds or None) samples.
+
+    Medians keep a few odd routes (ferries, closures) from skewing the fit.
+    Samples under 1 km straight-line are skipped: their ratio is dominated by
+    the street layout around the sites.
+    """
+    usable = [(straight, road, seconds) for straight, road, seconds in samples if straight >= 1.0 and road > 0]
+    if len(usable) < min_routes:
+        return None
+    ratios = np.array([road / straight for straight, road, _ in usable])
+    speeds = np.array([road / (seconds / 3600) for _, road, seconds in usable if seconds])
+    return {
+        "road_factor": float(np.median(ratios)),
+        "speed_kmh": float(np.median(speeds)) if len(speeds) >= min_routes else ROUTE_SPEED_KMH,
+        "calibration": {"routes": len(usable), "timed_routes": int(len(speeds)), "calibrated_at": time.time()},
+    }
+
+
+def calibrate(cache=None, path: Path = ROUTE_MATRIX_PATH) -> dict:
+    """
+    Calibrates the route matrix against routes between known sites in the Maps result cache.
+
+    Returns:
+        dict: The matrix parameters, or the reason they were left unchanged.
+    """
+    from mcp_server.maps_cache import MapsResultCache
+
+    global _matrix
+    cache = cache or MapsResultCache()
+    ids, _, coordinates = load_sites()
+    # Route endpoints are stored quantized; match sites at the same precision.
+    site_at = {tuple(round(value, cache.precision) for value in point): i for i, point in enumerate(coordinates)}
+    straight = haversine_matrix(coordinates)
+
+    samples = []
+    for origin, destination, result in cache.routes():
+        i, j = site_at.get(tuple(origin)), site_at.get(tuple(destination))
+        metrics = route_metrics(result)
+        if i is None or j is None or i == j or metrics is None:
+            continue
+        meters, seconds = metrics
+        samples.append((float(straight[i, j]), meters / 1000, seconds))
+
+    fitted = fit_parameters(samples)
+    if fitted is None:
+        return {"calibrated": False, "reason": f"{len(samples)} cached routes between known sites "
+                                               f"(need {ROUTE_CALIBRATION_MIN_ROUTES}); run maps_cache --prewarm first"}
+    with _matrix_lock:
+        _matrix = RouteMatrix.build(**fitted)
+        _save_matrix(path)
+    logger.info(f"Calibrated route matrix on {fitted['calibration']['routes']} Maps routes: {_matrix.parameters()}")
+    return {"calibrated": True, **_matrix.parameters()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline route-distance matrix maintenance.")
+    parser.add_argument("--calibrate", action="store_true", help="Fit road factor and speed to cached Maps routes.")
+    parser.add_argument("--stats", action="store_true", help="Print the matrix parameters.")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        print(f"🛣️  Calibration: {json.dumps(calibrate(), indent=2)}")
+    if args.stats or not args.calibrate:
+        matrix = get_route_matrix()
+        print(json.dumps({"sites": matrix.size, "bytes": int(matrix.straight_km.nbytes), **matrix.parameters()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
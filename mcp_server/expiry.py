@@ -0,0 +1,123 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from mcp_server.data import current_stock, load_table
+
+logger = logging.getLogger("mcp_server")
+
+# Location column per stock table.
+LOCATION_COLUMNS = {"StoreStock": "StoreID", "DistributionStock": "FacilityID"}
+
+
+def historical_daily_demand(lookback_days: int = 90) -> pd.Series:
+    """
+    Average daily units sold per store and product over the last `lookback_days` of sales history.
+
+    Args:
+        lookback_days: Size of the averaging window, ending at the latest SaleDate.
+
+    Returns:
+        pd.Series: Daily demand indexed by (StoreID, ProductNumber).
+    """
+    sales = load_table("product_sales")
+    start = sales["SaleDate"].max() - pd.Timedelta(days=lookback_days - 1)
+    recent = sales[(sales["SaleDate"] >= start) & (sales["SalesQuantity"] > 0)]
+    return recent.groupby(["StoreID", "ProductNumber"])["SalesQuantity"].sum() / lookback_days
+
+
+def facility_daily_demand(store_demand: pd.Series) -> pd.Series:
+    """
+    Rolls store demand up to distribution facilities.
+
+    Each store is assumed to be replenished by its nearest facility, so a
+    facility's demand is the summed sales rate of the stores it serves.
+
+    Args:
+        store_demand: Daily demand indexed by (StoreID, ProductNumber).
+
+    Returns:
+        pd.Series: Daily demand indexed by (FacilityID, ProductNumber).
+    """
+    stores = load_table("Stores")
+    facilities = load_table("DistributionFacilities")
+
+    # Equirectangular distance is plenty to pick the nearest facility.
+    lat = np.radians(stores["Latitude"].to_numpy())[:, None]
+    lon = np.radians(stores["Longitude"].to_numpy())[:, None]
+    f_lat = np.radians(facilities["Latitude"].to_numpy())[None, :]
+    f_lon = np.radians(facilities["Longitude"].to_numpy())[None, :]
+    distance = np.hypot((lon - f_lon) * np.cos((lat + f_lat) / 2), lat - f_lat)
+    nearest = pd.Series(
+        facilities["FacilityID"].to_numpy()[distance.argmin(axis=1)], index=stores["StoreID"]
+    )
+
+    demand = store_demand.rename("Demand").reset_index()
+    demand["FacilityID"] = demand["StoreID"].map(nearest)
+    return demand.groupby(["FacilityID", "ProductNumber"])["Demand"].sum()
+
+
+def allocate_fefo(batches: pd.DataFrame, daily_demand: pd.Series, location: str) -> pd.DataFrame:
+    """
+    Allocates a constant daily demand to batches in first-expired-first-out order.
+
+    For batches of one location and product sorted by expiry, the cumulative
+    quantity sold by the time batch i expires is
+
+        C_i = min(C_{i-1} + q_i, rate * d_i)
+
+    which unrolls to C_i = Q_i + min(0, cummin_k(rate * d_k - Q_k)) with Q the
+    running quantity. That is a grouped cumsum plus a grouped cummin, so the
+    whole allocation is one sorted, vectorised pass.
+
+    Args:
+        batches: Stock rows with `location`, ProductNumber, Quantity, ExpiryDate,
+            BatchNumber and DaysUntilExpiry.
+        daily_demand: Units per day indexed by (location, ProductNumber).
+        location: The location column ('StoreID' or 'FacilityID').
+
+    Returns:
+        pd.DataFrame: The batches in FEFO order with DailyDemand, ProjectedSold
+            and ProjectedUnsold columns.
+    """
+    keys = [location, "ProductNumber"]
+    result = batches.sort_values(keys + ["ExpiryDate", "BatchNumber"]).reset_index(drop=True)
+
+    rate = daily_demand.reindex(pd.MultiIndex.from_frame(result[keys])).fillna(0.0).to_numpy()
+    quantity = result["Quantity"].to_numpy(dtype=np.float64)
+    # A batch expiring today (or already expired) has no selling days left.
+    selling_days = result["DaysUntilExpiry"].clip(lower=0).to_numpy(dtype=np.float64)
+
+    groups = result.groupby(keys, sort=False).ngroup()
+    running = pd.Series(quantity).groupby(groups).cumsum()
+    slack = pd.Series(rate * selling_days) - running
+    sold_by_expiry = running + slack.groupby(groups).cummin().clip(upper=0)
+    sold = sold_by_expiry - sold_by_expiry.groupby(groups).shift(fill_value=0.0)
+
+    result["DailyDemand"] = rate
+    result["ProjectedSold"] = sold.to_numpy()
+    result["ProjectedUnsold"] = quantity - result["ProjectedSold"]
+    return result
+
+
+def projected_expiry(table: str = "StoreStock", daily_demand: pd.Series | None = None,
+                     lookback_days: int = 90) -> pd.DataFrame:
+    """
+    Projects unsold quantity per batch for the current stock snapshot.
+
+    Args:
+        table: 'StoreStock' or 'DistributionStock'.
+        daily_demand: Optional forecast as units per day indexed by (location, ProductNumber).
+            Defaults to historical sales rates.
+        lookback_days: Averaging window for historical sales rates.
+
+    Returns:
+        pd.DataFrame: FEFO-ordered batches with projected sold/unsold quantities.
+    """
+    location = LOCATION_COLUMNS[table]
+    if daily_demand is None:
+        daily_demand = historical_daily_demand(lookback_days)
+        if table == "DistributionStock":
+            daily_demand = facility_daily_demand(daily_demand)
+    return allocate_fefo(current_stock(table), daily_demand, location)
@@ -0,0 +1,236 @@
+import bisect
+import logging
+import threading
+from collections import defaultdict
+
+import pandas as pd
+
+from mcp_server.data import current_stock, load_table, table_version
+
+logger = logging.getLogger("mcp_server")
+
+# Urgency buckets from section 7 of the agent instructions (upper bound in days, inclusive).
+EXPIRY_BUCKETS = [(0, "EXPIRED"), (1, "CRITICAL"), (2, "URGENT"), (3, "WARNING")]
+
+# Index source name -> (stock table, location column, location table, location name column)
+SOURCES = {
+    "store": ("StoreStock", "StoreID", "Stores", "StoreName"),
+    "distribution": ("DistributionStock", "FacilityID", "DistributionFacilities", "FacilityName"),
+}
+
+
+def expiry_status(days_until_expiry: int) -> str | None:
+    """Maps days until expiry to EXPIRED/CRITICAL/URGENT/WARNING, or None beyond 3 days."""
+    for upper, status in EXPIRY_BUCKETS:
+        if days_until_expiry <= upper:
+            return status
+    return None
+
+
+class ExpiryIndex:
+    """
+    In-memory priority index over store and distribution batches, keyed by expiry date.
+
+    Batches are kept in sorted lists (globally and per location, city and
+    category) of `(expiry ordinal, batch key)` tuples, so range and top-k
+    queries are a bisect plus a slice; days until expiry is derived at query
+    time. Keys are the rebased expiry dates of `current_stock`, which move
+    with the date, so every group changes (and is re-inserted) on the first
+    sync of each day. Inserts and removals shift the lists (O(n) each), which
+    is fine for the sample data's few thousand batches.
+    """
+
+    def __init__(self):
+        self._batches = {}  # batch key -> record
+        self._groups = defaultdict(set)  # (source, location, product) -> batch keys
+        self._sorted = defaultdict(list)  # (dimension, value) -> sorted [(ordinal, batch key)]
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+    def _dimensions(self, record: dict) -> list:
+        return [
+            ("all", None),
+            ("source", record["Source"]),
+            ("location", record["LocationID"]),
+            ("city", record["City"].lower()),
+            ("category", record["ProductCategory"].lower()),
+        ]
+
+    def _insert(self, key: tuple, record: dict):
+        self._batches[key] = record
+        self._groups[key[:3]].add(key)
+        entry = (record["ExpiryOrdinal"], key)
+        for dimension in self._dimensions(record):
+            bisect.insort(self._sorted[dimension], entry)
+
+    def _remove(self, key: tuple):
+        record = self._batches.pop(key)
+        self._groups[key[:3]].discard(key)
+        entry = (record["ExpiryOrdinal"], key)
+        for dimension in self._dimensions(record):
+            entries = self._sorted[dimension]
+            del entries[bisect.bisect_left(entries, entry)]
+
+    def apply_snapshot(self, source: str, records: list, complete: bool = False) -> int:
+        """
+        Applies a stock snapshot incrementally.
+
+        Stock rows are snapshots per location and product, so each
+        (location, product) group in `records` replaces the indexed batches
+        of that group. Unchanged groups are left untouched.
+
+        Args:
+            source: 'store' or 'distribution'.
+            records: Batch records as produced by `snapshot_records`.
+            complete: Whether `records` is the full snapshot for `source`, in
+                which case groups absent from it are dropped.
+
+        Returns:
+            int: Number of (location, product) groups that changed.
+        """
+        incoming = defaultdict(dict)
+        for record in records:
+            key = (source, record["LocationID"], record["ProductNumber"], record["BatchNumber"])
+            incoming[key[:3]][key] = record
+
+        stale = []
+        if complete:
+            stale = [group for group in self._groups if group[0] == source and group not in incoming]
+
+        changed = 0
+        for group, batches in incoming.items():
+            current = {key: self._batches[key] for key in self._groups.get(group, ())}
+            if current == batches:
+                continue
+            for key in current:
+                self._remove(key)
+            for key, record in batches.items():
+                self._insert(key, record)
+            changed += 1
+
+        for group in stale:
+            for key in list(self._groups[group]):
+                self._remove(key)
+            del self._groups[group]
+            changed += 1
+        return changed
+
+    def _candidates(self, location_id: str, city: str, category: str, source: str) -> list:
+        # Scan the most selective index; the remaining filters are applied per row.
+        if location_id:
+            return self._sorted.get(("location", location_id), [])
+        if city:
+            return self._sorted.get(("city", city.lower()), [])
+        if category:
+            return self._sorted.get(("category", category.lower()), [])
+        if source:
+            return self._sorted.get(("source", source), [])
+        return self._sorted.get(("all", None), [])
+
+    def query(self, max_days: int | None = 3, min_days: int | None = None, limit: int | None = None,
+              location_id: str = "", city: str = "", category: str = "", source: str = "",
+              today: pd.Timestamp | None = None) -> list:
+        """
+        Returns batches ordered by expiry, optionally bounded by days until expiry.
+
+        With `max_days=None` and a `limit` this is a top-k query over the
+        soonest-expiring batches.
+
+        Args:
+            max_days: Inclusive upper bound on days until expiry (None for unbounded).
+            min_days: Inclusive lower bound on days until expiry (None for unbounded).
+            limit: Maximum number of batches to return.
+            location_id: StoreID / FacilityID filter.
+            city: City filter (case-insensitive).
+            category: ProductCategory filter (case-insensitive).
+            source: 'store' or 'distribution' filter.
+            today: Reference date. Defaults to the current date.
+
+        Returns:
+            list: Batch records with DaysUntilExpiry and ExpiryStatus added.
+        """
+        today_ordinal = (today or pd.Timestamp.today()).toordinal()
+        entries = self._candidates(location_id, city, category, source)
+        lo = 0 if min_days is None else bisect.bisect_left(entries, (today_ordinal + min_days,))
+        hi = len(entries) if max_days is None else bisect.bisect_left(entries, (today_ordinal + max_days + 1,))
+
+        results = []
+        for _, key in entries[lo:hi]:
+            record = self._batches[key]
+            if (
+                (location_id and record["LocationID"] != location_id)
+                or (city and record["City"].lower() != city.lower())
+                or (category and record["ProductCategory"].lower() != category.lower())
+                or (source and record["Source"] != source)
+            ):
+                continue
+            days = record["ExpiryOrdinal"] - today_ordinal
+            results.append({**record, "DaysUntilExpiry": days, "ExpiryStatus": expiry_status(days)})
+            if limit and len(results) >= limit:
+                break
+        return results
+
+    def bucket_counts(self, today: pd.Timestamp | None = None) -> dict:
+        """Counts all indexed batches per expiry bucket with bisects on the global index."""
+        today_ordinal = (today or pd.Timestamp.today()).toordinal()
+        entries = self._sorted.get(("all", None), [])
+        counts, lo = {}, 0
+        for upper, status in EXPIRY_BUCKETS:
+            hi = bisect.bisect_left(entries, (today_ordinal + upper + 1,))
+            counts[status] = hi - lo
+            lo = hi
+        return counts
+
+
+def snapshot_records(source: str, today: pd.Timestamp | None = None) -> list:
+    """Builds index records for the current snapshot of a stock table."""
+    table, location, location_table, name_column = SOURCES[source]
+    stock = current_stock(table, today)
+    locations = load_table(location_table)[[location, name_column, "City"]]
+    products = load_table("ProductMasterData")[["ProductNumber", "ProductDescription", "ProductCategory"]]
+    stock = stock.merge(locations, on=location).merge(products, on="ProductNumber")
+
+    return [
+        {
+            "Source": source,
+            "LocationID": row[location],
+            "LocationName": row[name_column],
+            "City": row["City"],
+            "ProductNumber": row["ProductNumber"],
+            "ProductDescription": row["ProductDescription"],
+            "ProductCategory": row["ProductCategory"],
+            "Quantity": int(row["Quantity"]),
+            "ExpiryDate": row["ExpiryDate"].date().isoformat(),
+            "ExpiryOrdinal": row["ExpiryDate"].toordinal(),
+            "BatchNumber": row["BatchNumber"],
+            "StorageLocation": row["StorageLocation"],
+        }
+        for row in stock.to_dict(orient="records")
+    ]
+
+
+_index = ExpiryIndex()
+_synced = {}  # source -> (table versions, as-of date)
+_index_lock = threading.Lock()
+
+
+def get_expiry_index() -> ExpiryIndex:
+    """
+    Returns the shared expiry index, applying new stock snapshots incrementally.
+
+    A source is re-synced when its stock or master-data files change, or when
+    the date rolls over (the stock dates are rebased to today, like the views).
+    """
+    today = pd.Timestamp.today().normalize()
+    with _index_lock:
+        for source, (table, _, location_table, _) in SOURCES.items():
+            state = (
+                (table_version(table), table_version(location_table), table_version("ProductMasterData")),
+                today,
+            )
+            if _synced.get(source) != state:
+                changed = _index.apply_snapshot(source, snapshot_records(source, today), complete=True)
+                _synced[source] = state
+                logger.info(f"Expiry index synced for {source} stock: {changed} groups changed, {len(_index)} batches")
+    return _index
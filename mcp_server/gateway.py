@@ -0,0 +1,355 @@
+"""
+Aggregating MCP gateway in front of the Maps, BigQuery and local MCP servers.
+
+One MCP endpoint exposes the tools of all upstreams. The gateway holds the
+upstream sessions (pooled and authenticated, built by the same factories the
+agent uses), answers repeat calls from a response cache with per-tool TTLs,
+serves read-only SQL from a table-version-aware `SqlResultCache`, runs
+identical concurrent calls once, caps the calls in flight per upstream
+and keeps per-tool metrics, served at /metrics (Prometheus) and /stats (JSON).
+
+Usage:
+    python -m mcp_server.gateway [--host 127.0.0.1] [--port 8765] [--transport streamable-http|stdio]
+
+Point the agent at it with MCP_GATEWAY_URL=http://127.0.0.1:8765/mcp.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+from mcp import types
+from mcp.server.lowlevel import Server
+
+from mcp_server.sql_cache import SQL_TOOLS, SqlResultCache, bigquery_table_versions, canonical_args
+from mcp_server.tool_cache import CachedSchemaMcpToolset
+
+logger = logging.getLogger("mcp_server")
+
+GATEWAY_HOST = os.getenv("MCP_GATEWAY_HOST", "127.0.0.1")
+GATEWAY_PORT = int(os.getenv("MCP_GATEWAY_PORT", "8765"))
+
+# Seconds a response is served from the gateway cache, per tool. None never
+# expires, 0 disables caching. Responses are shared by all clients, so tools
+# not listed fall back to their upstream's default below. execute_sql is not
+# listed: it goes through the gateway's SqlResultCache when one is configured.
+DEFAULT_GATEWAY_TTLS = {
+    "get_store_temperature": 30,
+    "consult_marketing_expert": 0,
+    "list_dataset_ids": 3600,
+    "get_dataset_info": 3600,
+    "list_table_ids": 3600,
+    "get_table_info": 3600,
+    "get_dataset_schema": 3600,
+    "product_catalog": 3600,
+    "get_site_distances": 3600,
+}
+DEFAULT_UPSTREAM_TTLS = {"maps": 86400, "bigquery": 0, "local": 0}
+DEFAULT_UPSTREAM_CONCURRENCY = {"maps": 4, "bigquery": 4, "local": 8}
+
+
+def gateway_ttls() -> dict:
+    """Per-tool TTLs, with overrides from GATEWAY_TOOL_TTLS (JSON, e.g. '{"product_catalog": 0}')."""
+    return {**DEFAULT_GATEWAY_TTLS, **json.loads(os.getenv("GATEWAY_TOOL_TTLS", "{}"))}
+
+
+def default_upstreams() -> Dict[str, CachedSchemaMcpToolset]:
+    from mcp_server.tools import get_bigquery_mcp_toolset, get_local_mcp_toolset, get_maps_mcp_toolset
+
+    return {
+        "maps": get_maps_mcp_toolset(),
+        "bigquery": get_bigquery_mcp_toolset(),
+        "local": get_local_mcp_toolset(),
+    }
+
+
+class McpGateway:
+    """
+    Routes MCP tool calls to upstream toolsets, with caching, deduplication,
+    per-upstream concurrency limits and metrics.
+
+    Args:
+        upstreams: Upstream name -> toolset. Tool names must be unique across
+            upstreams; on a clash the first upstream wins.
+        ttls: Per-tool cache TTLs (see DEFAULT_GATEWAY_TTLS).
+        upstream_ttls: Cache TTL for tools without their own entry, per upstream.
+        concurrency: Calls allowed in flight per upstream.
+        max_entries: Cached responses kept (least recently used are evicted).
+        sql_cache: Cache for SQL tool calls. Only read-only, deterministic
+            queries are cached, keyed by table versions; writes always run
+            and invalidate the tables they touch. Without it SQL is not cached.
+        history: Recent call durations kept per tool for the latency quantiles.
+    """
+
+    def __init__(self, upstreams: Dict[str, CachedSchemaMcpToolset], ttls: Optional[dict] = None,
+                 upstream_ttls: Optional[dict] = None, concurrency: Optional[dict] = None,
+                 max_entries: int = 1024, history: int = 1000, sql_cache: Optional[SqlResultCache] = None,
+                 name: str = "chickens-mcp-gateway"):
+        self.upstreams = upstreams
+        self.sql_cache = sql_cache
+        self.ttls = gateway_ttls() if ttls is None else ttls
+        self.upstream_ttls = DEFAULT_UPSTREAM_TTLS if upstream_ttls is None else upstream_ttls
+        concurrency = {**DEFAULT_UPSTREAM_CONCURRENCY, **(concurrency or {})}
+        self._semaphores = {upstream: asyncio.Semaphore(concurrency.get(upstream, 4)) for upstream in upstreams}
+        self.max_entries = max_entries
+        self._routes = {}  # tool name -> upstream name
+        self._tools = []
+        self._cache = OrderedDict()  # key -> (stored_at, CallToolResult)
+        self._in_flight = {}  # key -> Future
+        self.counters = defaultdict(int)  # (upstream, tool, outcome) -> count
+        self.durations = defaultdict(lambda: deque(maxlen=history))  # tool -> seconds
+        self.in_flight = defaultdict(int)  # upstream -> calls running
+        self.server = self._build_server(name)
+
+    def _build_server(self, name: str) -> Server:
+        server = Server(name)
+        server.list_tools()(self.list_tools)
+        # Arguments are validated by the upstream servers.
+        server.call_tool(validate_input=False)(self.call_tool)
+        return server
+
+    async def list_tools(self) -> list:
+        """The tools of all reachable upstreams (schemas from the tool schema cache)."""
+        listings = await asyncio.gather(
+            *(toolset.get_tools() for toolset in self.upstreams.values()), return_exceptions=True
+        )
+        routes, tools = {}, []
+        for upstream, listing in zip(self.upstreams, listings):
+            if isinstance(listing, BaseException):
+                logger.warning(f"Gateway upstream '{upstream}' unavailable: {listing}")
+                continue
+            for tool in listing:
+                if tool.name in routes:
+                    logger.warning(f"Tool '{tool.name}' of '{upstream}' shadowed by '{routes[tool.name]}'")
+                    continue
+                routes[tool.name] = upstream
+                tools.append(tool.raw_mcp_tool)
+        self._routes, self._tools = routes, tools
+        return tools
+
+    def _ttl(self, upstream: str, tool: str):
+        return self.ttls[tool] if tool in self.ttls else self.upstream_ttls.get(upstream, 0)
+
+    def _cached(self, key: str, ttl):
+        entry = self._cache.get(key)
+        if entry is None or (ttl is not None and time.monotonic() - entry[0] >= ttl):
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    async def _store(self, key: str, result: types.CallToolResult):
+        self._cache[key] = (time.monotonic(), result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def call_tool(self, name: str, arguments: dict) -> types.CallToolResult:
+        if name not in self._routes:
+            await self.list_tools()
+        upstream = self._routes.get(name)
+        if upstream is None:
+            return types.CallToolResult(content=[types.TextContent(type="text", text=f"Unknown tool: {name}")], isError=True)
+
+        arguments = arguments or {}
+        if self.sql_cache is not None and name in SQL_TOOLS:
+            return await self._call_sql(upstream, name, arguments)
+        ttl = self._ttl(upstream, name)
+        if ttl == 0:
+            return await self._call_upstream(upstream, name, arguments)
+
+        key = f"{name}:{canonical_args(name, arguments)}"
+        result = self._cached(key, ttl)
+        if result is not None:
+            self.counters[(upstream, name, "cache_hit")] += 1
+            return result
+        return await self._call_once(key, upstream, name, arguments, self._store)
+
+    async def _call_sql(self, upstream: str, name: str, arguments: dict) -> types.CallToolResult:
+        await self.sql_cache.refresh_versions()
+        keyed = self.sql_cache.key_for(name, arguments)
+        if keyed is None:
+            # Writes and nondeterministic queries always run, and are never deduplicated.
+            self.sql_cache.counters["bypassed"] += 1
+            result = await self._call_upstream(upstream, name, arguments)
+            self.sql_cache.invalidate_written(name, arguments)
+            return result
+        key, tables = keyed
+        cached = await self.sql_cache.lookup(key)
+        if cached is not None:
+            self.counters[(upstream, name, "cache_hit")] += 1
+            return types.CallToolResult.model_validate(cached)
+
+        async def store(_, result: types.CallToolResult):
+            await self.sql_cache.store(key, tables, result.model_dump(mode="json", by_alias=True, exclude_none=True))
+
+        return await self._call_once(f"sql:{key}", upstream, name, arguments, store)
+
+    async def _call_once(self, key: str, upstream: str, name: str, arguments: dict,
+                         store: Callable[[str, types.CallToolResult], Awaitable[None]]) -> types.CallToolResult:
+        """Runs a cacheable call, sharing one upstream execution among identical concurrent calls."""
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.counters[(upstream, name, "deduplicated")] += 1
+            return await asyncio.shield(in_flight)
+
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._call_upstream(upstream, name, arguments)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark retrieved: there may be no waiters
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+        if not result.isError:
+            await store(key, result)
+        future.set_result(result)
+        return result
+
+    async def _call_upstream(self, upstream: str, name: str, arguments: dict) -> types.CallToolResult:
+        async with self._semaphores[upstream]:
+            self.in_flight[upstream] += 1
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await self.upstreams[upstream].call_tool(name, arguments)
+                outcome = "error" if result.isError else "upstream"
+                return result
+            finally:
+                self.in_flight[upstream] -= 1
+                self.durations[name].append(time.perf_counter() - started)
+                self.counters[(upstream, name, outcome)] += 1
+
+    def stats(self) -> dict:
+        """Calls by outcome, cache size and upstream latency quantiles, per tool."""
+        tools = defaultdict(lambda: {"upstream": None, "calls": defaultdict(int)})
+        for (upstream, tool, outcome), count in self.counters.items():
+            tools[tool]["upstream"] = upstream
+            tools[tool]["calls"][outcome] += count
+        for tool, durations in self.durations.items():
+            if durations:
+                tools[tool]["latency_ms"] = {
+                    f"p{q}": round(float(np.percentile(durations, q)) * 1000, 1) for q in (50, 95, 99)
+                }
+        return {
+            "tools": {tool: {**entry, "calls": dict(entry["calls"])} for tool, entry in tools.items()},
+            "cache_entries": len(self._cache),
+            "in_flight": dict(self.in_flight),
+        }
+
+    def render_metrics(self) -> str:
+        """Prometheus text format."""
+        lines = [
+            "# HELP mcp_gateway_calls_total Tool calls by outcome (upstream, cache_hit, deduplicated, error).",
+            "# TYPE mcp_gateway_calls_total counter",
+        ]
+        for (upstream, tool, outcome), count in sorted(self.counters.items()):
+            lines.append(f'mcp_gateway_calls_total{{upstream="{upstream}",tool="{tool}",outcome="{outcome}"}} {count}')
+        lines += [
+            "# HELP mcp_gateway_upstream_seconds Upstream call duration over recent calls.",
+            "# TYPE mcp_gateway_upstream_seconds summary",
+        ]
+        for tool, durations in sorted(self.durations.items()):
+            if not durations:
+                continue
+            for q in (0.5, 0.95, 0.99):
+                value = float(np.quantile(durations, q))
+                lines.append(f'mcp_gateway_upstream_seconds{{tool="{tool}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'mcp_gateway_upstream_seconds_count{{tool="{tool}"}} {len(durations)}')
+        lines += ["# TYPE mcp_gateway_in_flight gauge"]
+        for upstream in self.upstreams:
+            lines.append(f'mcp_gateway_in_flight{{upstream="{upstream}"}} {self.in_flight[upstream]}')
+        lines += ["# TYPE mcp_gateway_cache_entries gauge", f"mcp_gateway_cache_entries {len(self._cache)}"]
+        return "\n".join(lines) + "\n"
+
+    async def close(self):
+        await asyncio.gather(*(toolset.close() for toolset in self.upstreams.values()), return_exceptions=True)
+
+
+def build_http_app(gateway: McpGateway):
+    """Starlette app serving the gateway at /mcp (streamable HTTP), plus /metrics and /stats."""
+    from mcp.server.fastmcp.server import StreamableHTTPASGIApp
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, PlainTextResponse
+    from starlette.routing import Route
+
+    session_manager = StreamableHTTPSessionManager(app=gateway.server)
+
+    async def metrics(request):
+        return PlainTextResponse(gateway.render_metrics(), media_type="text/plain; version=0.0.4")
+
+    async def stats(request):
+        return JSONResponse(gateway.stats())
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        async with session_manager.run():
+            # Open the upstream sessions before the first client connects.
+            await gateway.list_tools()
+            try:
+                yield
+            finally:
+                await gateway.close()
+
+    return Starlette(
+        routes=[
+            Route("/mcp", endpoint=StreamableHTTPASGIApp(session_manager)),
+            Route("/metrics", endpoint=metrics),
+            Route("/stats", endpoint=stats),
+        ],
+        lifespan=lifespan,
+    )
+
+
+async def serve_stdio(gateway: McpGateway):
+    from mcp.server.stdio import stdio_server
+
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await gateway.server.run(read_stream, write_stream, gateway.server.create_initialization_options())
+    finally:
+        await gateway.close()
+
+
+def main(upstream_factory: Callable[[], Dict[str, CachedSchemaMcpToolset]] = default_upstreams):
+    parser = argparse.ArgumentParser(description="Aggregating MCP gateway for the chickens agent.")
+    parser.add_argument("--host", default=GATEWAY_HOST)
+    parser.add_argument("--port", type=int, default=GATEWAY_PORT)
+    parser.add_argument("--transport", choices=("streamable-http", "stdio"), default="streamable-http")
+    args = parser.parse_args()
+
+    gateway = McpGateway(
+        upstream_factory(),
+        concurrency=json.loads(os.getenv("GATEWAY_CONCURRENCY", "{}")),
+        max_entries=int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", "1024")),
+        sql_cache=SqlResultCache(
+            max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", "512")),
+            version_provider=bigquery_table_versions(
+                os.getenv("GOOGLE_CLOUD_PROJECT"), os.getenv("BIGQUERY_DATASET", "save_the_chickens")
+            ),
+            version_ttl=float(os.getenv("SQL_CACHE_VERSION_TTL", "60")),
+            spill_dir=os.getenv("SQL_CACHE_SPILL_DIR") or None,
+        ),
+    )
+    if args.transport == "stdio":
+        asyncio.run(serve_stdio(gateway))
+        return
+
+    import uvicorn
+
+    logger.info(f"🚪 MCP gateway on http://{args.host}:{args.port}/mcp (metrics at /metrics)")
+    uvicorn.run(build_http_app(gateway), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import random
+
+# Units monitored in every store.
+UNITS = ["Freezer-1", "Freezer-2", "Fridge-Main", "Display-Case"]
+
+
+def read_store_temperature(store_id: str) -> dict:
+    """
+    Simulates reading real-time IoT sensor data for a store's freezer/fridge units.
+
+    Args:
+        store_id: The ID of the store (e.g., 'S001').
+
+    Returns:
+        dict: The store ID and a reading (temperature and OK/WARNING/CRITICAL status) per unit.
+    """
+    data = {"store_id": store_id, "units": []}
+
+    for unit in UNITS:
+        # 90% chance of good temp, 10% chance of issue
+        if random.random() > 0.1:
+            temp = round(random.uniform(-22.0, -18.0), 1)
+            status = "OK"
+        else:
+            temp = round(random.uniform(-15.0, -5.0), 1)
+            status = "WARNING" if temp < -10 else "CRITICAL"
+
+        data["units"].append({
+            "unit_id": unit,
+            "temperature_celsius": temp,
+            "status": status
+        })
+
+    return data
@@ -0,0 +1,386 @@
+"""
+Persistent cache of Maps MCP tool results.
+
+The agent asks Maps about places and routes around a small, fixed set of
+stores and distribution facilities, so most calls repeat. Results are kept in
+SQLite, keyed by tool and canonical arguments: place and address text is
+normalized and coordinates are quantized to `precision` decimal places
+(4 ≈ 11 m), so the same store reached by slightly different coordinates or
+spelling hits the same entry. Route entries also record their endpoints, for
+lookups by coordinates. TTLs are set per result type and the database is
+bounded in size (expired entries first, then least recently used).
+
+Usage:
+    python -m mcp_server.maps_cache --prewarm [--neighbours 3]   # warm routes between known sites
+    python -m mcp_server.maps_cache --stats
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+from mcp_server.toolsets import WrappedTool, WrappingToolset
+
+logger = logging.getLogger("mcp_server")
+
+PROJECT_ROOT = Path(__file__).parent.parent
+MAPS_CACHE_PATH = os.getenv("MAPS_CACHE_PATH", str(PROJECT_ROOT / ".cache" / "maps_cache.sqlite"))
+MAPS_CACHE_MAX_BYTES = int(os.getenv("MAPS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+MAPS_CACHE_PRECISION = int(os.getenv("MAPS_CACHE_PRECISION", "4"))
+# Maps tool used to pre-warm routes between known sites.
+MAPS_ROUTE_TOOL = os.getenv("MAPS_ROUTE_TOOL", "compute_routes")
+
+# Seconds a result stays valid, per tool. Roads change slowly, opening hours
+# and ratings faster, weather within the hour. 0 disables caching for a tool.
+DEFAULT_MAPS_TTLS = {
+    "compute_routes": 7 * 86400,
+    "search_places": 86400,
+    "lookup_weather": 1800,
+}
+DEFAULT_MAPS_TTL = 86400
+
+_LAT = re.compile(r"^lat(itude)?$", re.I)
+_LNG = re.compile(r"^(lng|lon|long|longitude)$", re.I)
+_LAT_LNG_TEXT = re.compile(r"^\s*(-?\d{1,3}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)\s*$")
+# Free-text fields (e.g. query, textQuery, address). Other strings such as place
+# IDs and page tokens are case-sensitive and kept as they are.
+_FREE_TEXT = re.compile(r"(query|address|keyword)$", re.I)
+
+
+def maps_ttls() -> dict:
+    """Per-tool TTLs, with overrides from MAPS_CACHE_TTLS (JSON, e.g. '{"search_places": 3600}')."""
+    return {**DEFAULT_MAPS_TTLS, **json.loads(os.getenv("MAPS_CACHE_TTLS", "{}"))}
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.casefold().replace(",", " , ").split()).replace(" ,", ",")
+
+
+def canonical_maps_args(args, precision: int = MAPS_CACHE_PRECISION, points: Optional[list] = None, path: str = "",
+                        free_text: bool = False):
+    """
+    Canonical form of Maps tool arguments.
+
+    Coordinates (fields named lat/latitude and lng/lon/longitude, or
+    "lat,lng" strings) are rounded to `precision` decimals, and free-text
+    query and address fields are case-folded with whitespace collapsed.
+    Coordinate pairs found are appended to `points` as (argument path,
+    (lat, lng)), in argument order.
+    """
+    if isinstance(args, dict):
+        lat_key = next((key for key in args if _LAT.match(key)), None)
+        lng_key = next((key for key in args if _LNG.match(key)), None)
+        canonical = {}
+        for key, value in args.items():
+            if key in (lat_key, lng_key) and isinstance(value, (int, float)):
+                canonical[key] = round(float(value), precision)
+            else:
+                canonical[key] = canonical_maps_args(value, precision, points, f"{path}/{key}",
+                                                     bool(_FREE_TEXT.search(key)))
+        if lat_key and lng_key and points is not None and isinstance(args[lat_key], (int, float)):
+            points.append((path, (canonical[lat_key], canonical[lng_key])))
+        return canonical
+    if isinstance(args, list):
+        return [canonical_maps_args(value, precision, points, f"{path}/{i}", free_text) for i, value in enumerate(args)]
+    if isinstance(args, str):
+        match = _LAT_LNG_TEXT.match(args)
+        if match:
+            lat, lng = (round(float(group), precision) for group in match.groups())
+            if points is not None:
+                points.append((path, (lat, lng)))
+            return f"{lat},{lng}"
+        return _normalize_text(args) if free_text else args
+    return args
+
+
+def route_endpoints(points: list) -> tuple:
+    """(origin, destination) among the points of a call: by argument name, else first and last."""
+    def named(name):
+        return next((point for path, point in points if name in path.lower()), None)
+    origin = named("origin") or (points[0][1] if points else None)
+    destination = named("destination") or (points[-1][1] if len(points) > 1 else None)
+    return origin, destination
+
+
+class MapsResultCache:
+    """
+    SQLite-backed cache of Maps tool results with per-tool TTLs and a size bound.
+
+    Args:
+        path: Database file (created if missing). None keeps it in memory.
+        ttls: Seconds a result stays valid, per tool.
+        default_ttl: TTL of tools not in `ttls`.
+        max_bytes: Bound on the stored (compressed) results; expired entries are
+            evicted first, then the least recently used.
+        precision: Decimal places coordinates are quantized to in keys.
+    """
+
+    def __init__(self, path: Optional[str] = MAPS_CACHE_PATH, ttls: Optional[dict] = None,
+                 default_ttl: float = DEFAULT_MAPS_TTL, max_bytes: int = MAPS_CACHE_MAX_BYTES,
+                 precision: int = MAPS_CACHE_PRECISION):
+        self.path = path
+        self.ttls = maps_ttls() if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                tool TEXT NOT NULL,
+                args TEXT NOT NULL,
+                result BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                origin_lat REAL, origin_lng REAL,
+                destination_lat REAL, destination_lng REAL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_route ON results (tool, origin_lat, origin_lng, destination_lat, destination_lng)")
+
+    def ttl(self, tool_name: str) -> float:
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    def key_for(self, tool_name: str, args: dict) -> tuple:
+        """Returns (cache key, canonical arguments, coordinate points) for a call."""
+        points = []
+        canonical = json.dumps(canonical_maps_args(args, self.precision, points), sort_keys=True, default=str)
+        return hashlib.sha256(f"{tool_name}:{canonical}".encode()).hexdigest(), canonical, points
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT result, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                self.counters["misses" if row is None else "expired"] += 1
+                return None
+            self._db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self.counters["hits"] += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, tool_name: str, canonical: str, points: list, result):
+        ttl = self.ttl(tool_name)
+        if ttl == 0:
+            return
+        blob = zlib.compress(json.dumps(result, default=str).encode())
+        if len(blob) > self.max_bytes:
+            return
+        origin, destination = route_endpoints(points)
+        origin, destination = origin or (None, None), destination or (None, None)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, tool_name, canonical, blob, len(blob), now, now + ttl, now, *origin, *destination),
+            )
+            self.counters["stored"] += 1
+            self._evict(now)
+
+    def _evict(self, now: float):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired = self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,)).rowcount
+        self.counters["evicted"] += max(expired, 0)
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the bound holds.
+        excess = total - self.max_bytes
+        freed = 0
+        keys = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed_at"):
+            keys.append(key)
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM results WHERE key = ?", [(key,) for key in keys])
+        self.counters["evicted"] += len(keys)
+
+    def has_route(self, origin: tuple, destination: tuple, tool_name: str = MAPS_ROUTE_TOOL) -> bool:
+        """Whether a fresh route result between two (quantized) points is cached."""
+        origin = tuple(round(value, self.precision) for value in origin)
+        destination = tuple(round(value, self.precision) for value in destination)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM results WHERE tool = ? AND origin_lat = ? AND origin_lng = ? "
+                "AND destination_lat = ? AND destination_lng = ? AND expires_at > ? LIMIT 1",
+                (tool_name, *origin, *destination, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def routes(self, tool_name: str = MAPS_ROUTE_TOOL) -> list:
+        """Fresh route results as (origin, destination, result) tuples."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT origin_lat, origin_lng, destination_lat, destination_lng, result FROM results "
+                "WHERE tool = ? AND destination_lat IS NOT NULL AND expires_at > ?",
+                (tool_name, time.time()),
+            ).fetchall()
+        return [((row[0], row[1]), (row[2], row[3]), json.loads(zlib.decompress(row[4]))) for row in rows]
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["expired"]
+        with self._lock:
+            by_tool = dict(self._db.execute("SELECT tool, COUNT(*) FROM results GROUP BY tool").fetchall())
+            size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": by_tool,
+            "bytes": size,
+        }
+
+    def close(self):
+        self._db.close()
+
+
+class CachedMapsTool(WrappedTool):
+    """Serves repeated Maps MCP calls from a `MapsResultCache`."""
+
+    def __init__(self, tool, cache: MapsResultCache):
+        super().__init__(tool)
+        self.cache = cache
+
+    async def run_async(self, *, args: dict, tool_context):
+        if self.cache.ttl(self.name) == 0:
+            return await self.tool.run_async(args=args, tool_context=tool_context)
+        key, canonical, points = self.cache.key_for(self.name, args)
+        result = await asyncio.to_thread(self.cache.get, key)
+        if result is not None:
+            return result
+        result = await self.tool.run_async(args=args, tool_context=tool_context)
+        if isinstance(result, dict) and not result.get("isError") and "error" not in result:
+            await asyncio.to_thread(self.cache.put, key, self.name, canonical, points, result)
+        return result
+
+
+class MapsCachingToolset(WrappingToolset):
+    """Wraps the Maps MCP toolset so every call goes through a persistent result cache."""
+
+    def __init__(self, toolset, cache: MapsResultCache):
+        super().__init__(toolset)
+        self.cache = cache
+
+    def wrap_tool(self, tool):
+        return CachedMapsTool(tool, self.cache)
+
+
+# --- Pre-warming --------------------------------------------------------
+
+def known_sites() -> tuple:
+    """Stores and distribution facilities, each as id -> (latitude, longitude)."""
+    from mcp_server.data import load_table
+
+    def coordinates(table: str, id_column: str) -> dict:
+        frame = load_table(table)
+        return dict(zip(frame[id_column], zip(frame["Latitude"].astype(float), frame["Longitude"].astype(float))))
+
+    return coordinates("Stores", "StoreID"), coordinates("DistributionFacilities", "FacilityID")
+
+
+def haversine_km(a: tuple, b: tuple) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(h))
+
+
+def prewarm_pairs(stores: dict, facilities: dict, neighbours: int = 3) -> list:
+    """
+    Site pairs worth pre-warming: each facility to every store, and each store
+    to its `neighbours` nearest stores (both directions), as (origin id, destination id).
+    """
+    pairs = {(facility, store) for facility in facilities for store in stores}
+    for store, point in stores.items():
+        nearest = sorted((other for other in stores if other != store), key=lambda other: haversine_km(point, stores[other]))
+        for other in nearest[:neighbours]:
+            pairs.update({(store, other), (other, store)})
+    return sorted(pairs)
+
+
+def route_args(origin: tuple, destination: tuple) -> dict:
+    """Arguments of a driving route between two coordinates, in the form the agent's calls use."""
+    def waypoint(point):
+        return {"latLng": {"latitude": point[0], "longitude": point[1]}}
+    return {"origin": waypoint(origin), "destination": waypoint(destination), "travelMode": "DRIVE"}
+
+
+async def prewarm_routes(toolset: MapsCachingToolset, neighbours: int = 3, concurrency: int = 4,
+                         tool_name: str = MAPS_ROUTE_TOOL) -> dict:
+    """
+    Fetches routes between known sites that are not cached (or have expired),
+    through the caching toolset so the results are stored.
+
+    Returns:
+        dict: Counts of pairs already cached, fetched and failed.
+    """
+    tools = {tool.name: tool for tool in await toolset.get_tools()}
+    if tool_name not in tools:
+        raise LookupError(f"Maps toolset has no '{tool_name}' tool (available: {sorted(tools)})")
+    stores, facilities = known_sites()
+    sites = {**stores, **facilities}
+    pairs = [(sites[origin], sites[destination]) for origin, destination in prewarm_pairs(stores, facilities, neighbours)]
+    cached = await asyncio.to_thread(lambda: [toolset.cache.has_route(*pair, tool_name) for pair in pairs])
+    todo = [pair for pair, hit in zip(pairs, cached) if not hit]
+    report = {"cached": len(pairs) - len(todo), "fetched": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(origin, destination):
+        async with semaphore:
+            try:
+                result = await tools[tool_name].run_async(args=route_args(origin, destination), tool_context=None)
+                ok = isinstance(result, dict) and not result.get("isError")
+            except Exception as e:
+                logger.warning(f"Could not pre-warm route {origin} -> {destination}: {e}")
+                ok = False
+            report["fetched" if ok else "failed"] += 1
+
+    await asyncio.gather(*(fetch(origin, destination) for origin, destination in todo))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maps result cache maintenance.")
+    parser.add_argument("--prewarm", action="store_true", help="Fetch routes between known stores and facilities.")
+    parser.add_argument("--neighbours", type=int, default=3, help="Nearest stores per store to pre-warm routes to.")
+    parser.add_argument("--stats", action="store_true", help="Print cache statistics.")
+    args = parser.parse_args()
+
+    cache = MapsResultCache()
+    if args.prewarm:
+        from mcp_server.tools import get_maps_mcp_toolset
+
+        async def run():
+            toolset = MapsCachingToolset(get_maps_mcp_toolset(), cache)
+            try:
+                return await prewarm_routes(toolset, neighbours=args.neighbours)
+            finally:
+                await toolset.close()
+
+        print(f"🗺️  Pre-warmed routes: {asyncio.run(run())}")
+    if args.stats or not args.prewarm:
+        print(json.dumps(cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import datetime
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from mcp_server.data import current_stock, load_table, table_version
+from mcp_server.expiry_index import expiry_status
+
+logger = logging.getLogger("mcp_server")
+
+# Where the named queries run: "local" (pandas over bigquery_source_data) or "bigquery".
+QUERY_BACKEND = os.getenv("QUERY_BACKEND", "local").lower()
+PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "")
+DATASET_NAME = os.getenv("BIGQUERY_DATASET", "save_the_chickens")
+
+# Named queries for the "Common Query Patterns" of instructions section 1.1.
+# The SQL text is fixed and all inputs are bound as query parameters, so
+# BigQuery sees one statement per query (query cache and plan reuse apply)
+# and user input is never spliced into SQL. Empty string parameters mean
+# "no filter"; store/product filters match IDs exactly or names fuzzily.
+SQL = {
+    "product_catalog": """
+        SELECT CAST(ProductNumber AS STRING) AS ProductNumber, ProductDescription, ProductCategory,
+               ShelfLifeDays, StorageRequirements
+        FROM `{project}.{dataset}.ProductMasterData`
+        WHERE @category = '' OR LOWER(ProductCategory) LIKE CONCAT('%', LOWER(@category), '%')
+        ORDER BY ProductNumber
+        LIMIT @limit
+    """,
+    "stock_for": """
+        SELECT StoreID, StoreName, City, CAST(ProductNumber AS STRING) AS ProductNumber, ProductDescription,
+               Quantity, CAST(ExpiryDate AS STRING) AS ExpiryDate, DaysUntilExpiry, BatchNumber, StorageLocation
+        FROM `{project}.{dataset}.store_stock_current`
+        WHERE (@store = '' OR StoreID = @store OR LOWER(StoreName) LIKE CONCAT('%', LOWER(@store), '%'))
+          AND (@product = '' OR CAST(ProductNumber AS STRING) = @product
+               OR LOWER(ProductDescription) LIKE CONCAT('%', LOWER(@product), '%'))
+        ORDER BY ExpiryDate, StoreID, ProductNumber
+        LIMIT @limit
+    """,
+    "expiring_within": """
+        SELECT StoreID, StoreName, City, CAST(ProductNumber AS STRING) AS ProductNumber, ProductDescription,
+               Quantity, CAST(ExpiryDate AS STRING) AS ExpiryDate, DaysUntilExpiry, BatchNumber, StorageLocation,
+               CASE WHEN DaysUntilExpiry <= 0 THEN 'EXPIRED' WHEN DaysUntilExpiry <= 1 THEN 'CRITICAL'
+                    WHEN DaysUntilExpiry <= 2 THEN 'URGENT' WHEN DaysUntilExpiry <= 3 THEN 'WARNING' END AS ExpiryStatus
+        FROM `{project}.{dataset}.store_stock_current`
+        WHERE DaysUntilExpiry <= @days
+          AND (@store = '' OR StoreID = @store OR LOWER(StoreName) LIKE CONCAT('%', LOWER(@store), '%'))
+        ORDER BY DaysUntilExpiry, StoreID, ProductNumber
+        LIMIT @limit
+    """,
+    "sales_by_product": """
+        WITH Bounds AS (
+          SELECT
+            COALESCE(SAFE.PARSE_DATE('%Y-%m-%d', NULLIF(@end_date, '')), MAX(DATE(SaleDate))) AS end_date
+          FROM `{project}.{dataset}.product_sales`
+        ), DateWindow AS (
+          SELECT COALESCE(SAFE.PARSE_DATE('%Y-%m-%d', NULLIF(@start_date, '')), DATE_SUB(end_date, INTERVAL 29 DAY)) AS start_date,
+                 end_date
+          FROM Bounds
+        )
+        SELECT CAST(ps.ProductNumber AS STRING) AS ProductNumber, pm.ProductDescription, pm.ProductCategory,
+               SUM(ps.SalesQuantity) AS TotalQuantity, ROUND(SUM(ps.TotalRevenue), 2) AS TotalRevenue,
+               ROUND(AVG(ps.PricePerUnit), 2) AS AveragePrice
+        FROM `{project}.{dataset}.product_sales` AS ps
+        JOIN `{project}.{dataset}.ProductMasterData` AS pm ON ps.ProductNumber = pm.ProductNumber
+        CROSS JOIN DateWindow AS w
+        WHERE DATE(ps.SaleDate) BETWEEN w.start_date AND w.end_date
+          AND ps.SalesQuantity > 0
+          AND (@store = '' OR ps.StoreID = @store)
+        GROUP BY 1, 2, 3
+        ORDER BY TotalRevenue DESC
+        LIMIT @limit
+    """,
+    "feedback_for": """
+        SELECT CAST(ProductNumber AS STRING) AS ProductNumber, ProductDescription, CustomerName,
+               CAST(FeedbackDate AS STRING) AS FeedbackDate, Rating, FeedbackDescription
+        FROM `{project}.{dataset}.customer_feedback_with_products`
+        WHERE @product = '' OR CAST(ProductNumber AS STRING) = @product
+           OR LOWER(ProductDescription) LIKE CONCAT('%', LOWER(@product), '%')
+        ORDER BY Rating, FeedbackDate DESC
+        LIMIT @limit
+    """,
+}
+
+
+# --- Local engine ---------------------------------------------------------
+# Joined frames are prepared once per table version (and day, for stock) and
+# reused, the local counterpart of a prepared statement.
+
+_prepared = {}  # name -> (state, DataFrame)
+_prepared_lock = threading.Lock()
+
+
+def _prepare(name: str, state: tuple, build) -> pd.DataFrame:
+    with _prepared_lock:
+        cached = _prepared.get(name)
+        if cached is None or cached[0] != state:
+            _prepared[name] = (state, build())
+        return _prepared[name][1]
+
+
+def _store_stock_current() -> pd.DataFrame:
+    def build():
+        stock = current_stock("StoreStock")
+        stores = load_table("Stores")[["StoreID", "StoreName", "City"]]
+        products = load_table("ProductMasterData")[["ProductNumber", "ProductDescription", "ProductCategory"]]
+        stock = stock.merge(stores, on="StoreID").merge(products, on="ProductNumber")
+        stock["ExpiryDate"] = stock["ExpiryDate"].dt.date.astype(str)
+        return stock.sort_values(["ExpiryDate", "StoreID", "ProductNumber"])
+
+    state = tuple(table_version(t) for t in ("StoreStock", "Stores", "ProductMasterData")) + (datetime.date.today(),)
+    return _prepare("store_stock_current", state, build)
+
+
+def _matches(frame: pd.DataFrame, value: str, id_column: str, name_column: str) -> pd.Series:
+    if not value:
+        return pd.Series(True, index=frame.index)
+    return (frame[id_column] == value) | frame[name_column].str.lower().str.contains(value.lower(), regex=False)
+
+
+def _local_product_catalog(category: str, limit: int) -> pd.DataFrame:
+    products = load_table("ProductMasterData")
+    if category:
+        products = products[products["ProductCategory"].str.lower().str.contains(category.lower(), regex=False)]
+    columns = ["ProductNumber", "ProductDescription", "ProductCategory", "ShelfLifeDays", "StorageRequirements"]
+    return products.sort_values("ProductNumber")[columns].head(limit)
+
+
+_STOCK_COLUMNS = ["StoreID", "StoreName", "City", "ProductNumber", "ProductDescription", "Quantity",
+                  "ExpiryDate", "DaysUntilExpiry", "BatchNumber", "StorageLocation"]
+
+
+def _local_stock_for(store: str, product: str, limit: int) -> pd.DataFrame:
+    stock = _store_stock_current()
+    mask = _matches(stock, store, "StoreID", "StoreName") & _matches(stock, product, "ProductNumber", "ProductDescription")
+    return stock.loc[mask, _STOCK_COLUMNS].head(limit)
+
+
+def _local_expiring_within(days: int, store: str, limit: int) -> pd.DataFrame:
+    stock = _store_stock_current()
+    stock = stock[(stock["DaysUntilExpiry"] <= days) & _matches(stock, store, "StoreID", "StoreName")]
+    stock = stock.sort_values(["DaysUntilExpiry", "StoreID", "ProductNumber"], kind="stable")[_STOCK_COLUMNS].head(limit)
+    return stock.assign(ExpiryStatus=stock["DaysUntilExpiry"].map(expiry_status))
+
+
+def _local_sales_by_product(start_date: str, end_date: str, store: str, limit: int) -> pd.DataFrame:
+    sales = load_table("product_sales")
+    end = pd.Timestamp(end_date) if end_date else sales["SaleDate"].max()
+    start = pd.Timestamp(start_date) if start_date else end - pd.Timedelta(days=29)
+    mask = sales["SaleDate"].between(start, end) & (sales["SalesQuantity"] > 0)
+    if store:
+        mask &= sales["StoreID"] == store
+    products = load_table("ProductMasterData")[["ProductNumber", "ProductDescription", "ProductCategory"]]
+    totals = (
+        sales[mask].groupby("ProductNumber")
+        .agg(TotalQuantity=("SalesQuantity", "sum"), TotalRevenue=("TotalRevenue", "sum"), AveragePrice=("PricePerUnit", "mean"))
+        .reset_index()
+        .merge(products, on="ProductNumber")
+    )
+    columns = ["ProductNumber", "ProductDescription", "ProductCategory", "TotalQuantity", "TotalRevenue", "AveragePrice"]
+    return totals.sort_values("TotalRevenue", ascending=False)[columns].round(2).head(limit)
+
+
+def _local_feedback_for(product: str, limit: int) -> pd.DataFrame:
+    def build():
+        feedback = load_table("CustomerFeedback")
+        products = load_table("ProductMasterData")[["ProductNumber", "ProductDescription"]]
+        # Same fuzzy link as the customer_feedback_with_products view.
+        pairs = feedback.merge(products, how="cross")
+        pairs = pairs[[name.lower() in description.lower()
+                       for name, description in zip(pairs["ProductName"], pairs["ProductDescription"])]]
+        pairs = pairs.rename(columns={"Description": "FeedbackDescription"})
+        pairs["FeedbackDate"] = pairs["FeedbackDate"].dt.date.astype(str)
+        return pairs.sort_values(["Rating", "FeedbackDate"], ascending=[True, False])
+
+    state = (table_version("CustomerFeedback"), table_version("ProductMasterData"))
+    feedback = _prepare("customer_feedback_with_products", state, build)
+    feedback = feedback[_matches(feedback, product, "ProductNumber", "ProductDescription")]
+    columns = ["ProductNumber", "ProductDescription", "CustomerName", "FeedbackDate", "Rating", "FeedbackDescription"]
+    return feedback[columns].head(limit)
+
+
+LOCAL = {
+    "product_catalog": _local_product_catalog,
+    "stock_for": _local_stock_for,
+    "expiring_within": _local_expiring_within,
+    "sales_by_product": _local_sales_by_product,
+    "feedback_for": _local_feedback_for,
+}
+
+
+# --- BigQuery engine ------------------------------------------------------
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _bigquery_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google.cloud import bigquery
+            _client = bigquery.Client(project=PROJECT_ID or None)
+        return _client
+
+
+def _run_bigquery(name: str, params: dict) -> list:
+    from google.cloud import bigquery
+
+    types = {str: "STRING", int: "INT64", float: "FLOAT64"}
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter(key, types[type(value)], value) for key, value in params.items()],
+        use_query_cache=True,
+    )
+    sql = SQL[name].format(project=PROJECT_ID, dataset=DATASET_NAME)
+    return [dict(row.items()) for row in _bigquery_client().query(sql, job_config=job_config).result()]
+
+
+def run_query(name: str, backend: str | None = None, **params) -> list:
+    """
+    Runs a named query with bound parameters.
+
+    Args:
+        name: One of the keys of `SQL`.
+        backend: 'local' or 'bigquery'. Defaults to QUERY_BACKEND.
+        **params: Query parameters (including `limit`).
+
+    Returns:
+        list: Result rows as dicts.
+    """
+    backend = (backend or QUERY_BACKEND).lower()
+    if backend == "bigquery":
+        return _run_bigquery(name, params)
+    return LOCAL[name](**params).to_dict(orient="records")
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from mcp_server.data import DATA_DIR, PROJECT_ROOT
+
+logger = logging.getLogger("mcp_server")
+
+# Where the snapshot artifact lives and what it is built from:
+# "local" reads the CSVs and the view definitions in setup_bigquery.sh (no network),
+# "bigquery" reads INFORMATION_SCHEMA of GOOGLE_CLOUD_PROJECT.BIGQUERY_DATASET.
+SCHEMA_SNAPSHOT_PATH = Path(os.getenv("SCHEMA_SNAPSHOT_PATH", PROJECT_ROOT / ".cache" / "schema_snapshot.json"))
+SCHEMA_SOURCE = os.getenv("SCHEMA_SOURCE", "local").lower()
+# Seconds between dataset version checks for the bigquery source (each check is a query).
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "300"))
+SETUP_SCRIPT = DATA_DIR / "setup_bigquery.sh"
+
+# Bumped when the snapshot layout changes, so artifacts in the old layout are rebuilt.
+SNAPSHOT_FORMAT = 2
+_VIEW = re.compile(r'--view "(.*?)"\s*\\\s*"\$\{DATASET_ID\}\.(\w+)"', re.S)
+
+
+def _infer_type(series) -> str:
+    """Mirrors `bq load --autodetect` for the column types present in the CSVs."""
+    import pandas as pd
+
+    if pd.api.types.is_bool_dtype(series):
+        return "BOOL"
+    if pd.api.types.is_integer_dtype(series):
+        return "INT64"
+    if pd.api.types.is_float_dtype(series):
+        return "FLOAT64"
+    sample = series.dropna().astype(str)
+    if not sample.empty and sample.str.fullmatch(r"\d{4}-\d{2}-\d{2}").all():
+        return "DATE"
+    if not sample.empty and sample.str.fullmatch(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}( UTC)?").all():
+        return "TIMESTAMP"
+    return "STRING"
+
+
+def _split_top_level(text: str) -> list:
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _outer_select_list(sql: str) -> str:
+    """The select list of the outermost SELECT (the first one at parenthesis depth 0)."""
+    sql = re.sub(r"--[^\n]*", "", sql)
+    depth, start = 0, None
+    for match in re.finditer(r"\(|\)|\bSELECT\b|\bFROM\b", sql, re.I):
+        token = match.group().upper()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token == "SELECT" and start is None:
+            start = match.end()
+        elif depth == 0 and token == "FROM" and start is not None:
+            return sql[start:match.start()]
+    return ""
+
+
+def view_columns(sql: str, known_types: dict) -> list | None:
+    """
+    Output columns of a view definition as [name, type] pairs.
+
+    Names come from aliases or the referenced column; types are taken from
+    the source table column of the same name when it is a plain reference,
+    and left empty for computed columns. Returns None when the view selects
+    `*`, whose columns cannot be resolved locally.
+    """
+    columns = []
+    for expression in _split_top_level(_outer_select_list(sql)):
+        expression = " ".join(expression.split())
+        if not expression:
+            continue
+        if expression == "*" or expression.endswith(".*"):
+            return None
+        alias = re.search(r"\bAS\s+(\w+)$", expression, re.I)
+        name = alias.group(1) if alias else expression.split(".")[-1]
+        source = re.fullmatch(r"(?:\w+\.)?(\w+)(?:\s+AS\s+\w+)?", expression, re.I)
+        columns.append([name, known_types.get(source.group(1), "") if source else ""])
+    return columns
+
+
+def local_version() -> str:
+    """Version of the local sources: modification times of the CSVs and the setup script."""
+    paths = sorted(DATA_DIR.glob("*.csv")) + [SETUP_SCRIPT]
+    stamp = [SNAPSHOT_FORMAT] + [(path.name, path.stat().st_mtime_ns) for path in paths if path.exists()]
+    return hashlib.sha256(json.dumps(stamp).encode()).hexdigest()[:16]
+
+
+def build_local_snapshot() -> dict:
+    """Schema of the CSV tables plus the views defined in setup_bigquery.sh."""
+    # Imported here: the agent imports this module, and only a rebuild needs pandas.
+    import pandas as pd
+
+    tables, known_types = [], {}
+    for path in sorted(DATA_DIR.glob("*.csv")):
+        frame = pd.read_csv(path, nrows=200)
+        columns = [[column, _infer_type(frame[column])] for column in frame.columns]
+        known_types.update(dict(columns))
+        tables.append({"name": path.stem, "type": "TABLE", "columns": columns})
+
+    if SETUP_SCRIPT.exists():
+        for sql, name in _VIEW.findall(SETUP_SCRIPT.read_text()):
+            tables.append({"name": name, "type": "VIEW", "columns": view_columns(sql, known_types)})
+    return {"source": "local", "version": local_version(), "created_at": time.time(), "tables": tables}
+
+
+def _bigquery_client():
+    from google.cloud import bigquery
+    return bigquery.Client(project=os.getenv("GOOGLE_CLOUD_PROJECT"))
+
+
+def _bigquery_dataset() -> str:
+    return f"{os.getenv('GOOGLE_CLOUD_PROJECT')}.{os.getenv('BIGQUERY_DATASET', 'save_the_chickens')}"
+
+
+def bigquery_version() -> str:
+    """Version of the BigQuery dataset: last-modified time of every table and view."""
+    rows = _bigquery_client().query(
+        f"SELECT table_id, last_modified_time FROM `{_bigquery_dataset()}.__TABLES__` ORDER BY table_id"
+    ).result()
+    stamp = [(row.table_id, row.last_modified_time) for row in rows]
+    return hashlib.sha256(json.dumps(stamp).encode()).hexdigest()[:16]
+
+
+def build_bigquery_snapshot() -> dict:
+    """Schema of all tables and views from INFORMATION_SCHEMA."""
+    dataset = _bigquery_dataset()
+    rows = _bigquery_client().query(f"""
+        SELECT c.table_name, t.table_type, c.column_name, c.data_type
+        FROM `{dataset}.INFORMATION_SCHEMA.COLUMNS` AS c
+        JOIN `{dataset}.INFORMATION_SCHEMA.TABLES` AS t USING (table_name)
+        ORDER BY c.table_name, c.ordinal_position
+    """).result()
+    tables = {}
+    for row in rows:
+        table = tables.setdefault(row.table_name, {"name": row.table_name, "type": row.table_type.replace("BASE ", ""), "columns": []})
+        table["columns"].append([row.column_name, row.data_type])
+    return {"source": "bigquery", "version": bigquery_version(), "created_at": time.time(), "tables": list(tables.values())}
+
+
+SOURCES = {
+    "local": (local_version, build_local_snapshot),
+    "bigquery": (bigquery_version, build_bigquery_snapshot),
+}
+
+_snapshot = None
+_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def _read_artifact(source: str) -> dict | None:
+    try:
+        snapshot = json.loads(SCHEMA_SNAPSHOT_PATH.read_text())
+    except (OSError, ValueError):
+        return None
+    return snapshot if snapshot.get("source") == source else None
+
+
+def _write_artifact(snapshot: dict):
+    try:
+        SCHEMA_SNAPSHOT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = SCHEMA_SNAPSHOT_PATH.with_suffix(".tmp")
+        tmp.write_text(json.dumps(snapshot, indent=2))
+        os.replace(tmp, SCHEMA_SNAPSHOT_PATH)
+    except OSError as e:
+        logger.warning(f"Could not write schema snapshot {SCHEMA_SNAPSHOT_PATH}: {e}")
+
+
+def get_schema_snapshot(source: str = SCHEMA_SOURCE) -> dict:
+    """
+    Returns the dataset schema snapshot, rebuilding it only when the dataset version changes.
+
+    The snapshot is kept in memory and in a JSON artifact (SCHEMA_SNAPSHOT_PATH)
+    so later processes start from it without rebuilding.
+    """
+    global _snapshot, _checked_at
+    version_of, build = SOURCES[source]
+    with _snapshot_lock:
+        interval = SCHEMA_CHECK_INTERVAL if source == "bigquery" else 0.0
+        if _snapshot and _snapshot["source"] == source and time.monotonic() - _checked_at < interval:
+            return _snapshot
+        snapshot = _snapshot if _snapshot and _snapshot["source"] == source else _read_artifact(source)
+        version = version_of()
+        if snapshot is None or snapshot["version"] != version:
+            started = time.perf_counter()
+            snapshot = build()
+            _write_artifact(snapshot)
+            logger.info(f"Schema snapshot {snapshot['version']} built from {source} in {(time.perf_counter() - started) * 1000:.0f}ms")
+        _snapshot, _checked_at = snapshot, time.monotonic()
+        return snapshot
+
+
+def schema_summary(snapshot: dict) -> str:
+    """
+    Compact one-line-per-table rendering, e.g. `StoreStock (TABLE): StockID STRING, Quantity INT64, ...`.
+
+    Tables whose columns are unknown are listed separately, so the agent looks them up with get_table_info.
+    """
+    lines, unresolved = [], []
+    for table in snapshot["tables"]:
+        if table["columns"] is None:
+            unresolved.append(table["name"])
+            continue
+        columns = ", ".join(f"{name} {kind}".strip() for name, kind in table["columns"])
+        lines.append(f"- {table['name']} ({table['type']}): {columns}")
+    if unresolved:
+        lines.append(f"Columns not listed (call get_table_info before querying): {', '.join(unresolved)}")
+    return "\n".join(lines)
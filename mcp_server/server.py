@@ -1,11 +1,22 @@
 import os
-import random
 import uuid
+import asyncio
 import json
 import httpx
 import logging
+import pandas as pd
 from mcp.server.fastmcp import FastMCP
 
+from mcp_server.bom import ingredient_demand
+from mcp_server.data import load_table
+from mcp_server.distances import get_route_matrix, resolve_site, site_directory
+from mcp_server.expiry import LOCATION_COLUMNS, projected_expiry
+from mcp_server.expiry_index import get_expiry_index
+from mcp_server.iot import read_store_temperature
+from mcp_server.queries import QUERY_BACKEND, run_query
+from mcp_server.schema import get_schema_snapshot
+from mcp_server.snapshot import build_store_snapshot
+
 # Initialize FastMCP Server
 # "chickens-local-tools" is the server name
 mcp = FastMCP("chickens-local-tools")
@@ -31,25 +42,7 @@ def get_store_temperature(store_id: str) -> str:
     Returns:
         str: A JSON string containing temperature data for units.
     """
-    units = ["Freezer-1", "Freezer-2", "Fridge-Main", "Display-Case"]
-    data = {"store_id": store_id, "units": []}
-    
-    for unit in units:
-        # 90% chance of good temp, 10% chance of issue
-        if random.random() > 0.1:
-            temp = round(random.uniform(-22.0, -18.0), 1)
-            status = "OK"
-        else:
-            temp = round(random.uniform(-15.0, -5.0), 1)
-            status = "WARNING" if temp < -10 else "CRITICAL"
-            
-        data["units"].append({
-            "unit_id": unit,
-            "temperature_celsius": temp,
-            "status": status
-        })
-        
-    return json.dumps(data, indent=2)
+    return json.dumps(read_store_temperature(store_id), indent=2)
 
 @mcp.tool()
 async def consult_marketing_expert(context: str, goal: str) -> str:
@@ -119,6 +112,339 @@ async def consult_marketing_expert(context: str, goal: str) -> str:
     except Exception as e:
         return f"Error consulting marketing expert: {str(e)}"
 
+@mcp.tool()
+def get_ingredient_demand(
+    start_date: str = "",
+    end_date: str = "",
+    store_id: str = "",
+    product_quantities: dict[str, float] | None = None,
+) -> str:
+    """
+    Explode product sales (or a forecast) into ingredient demand and ingredient expiry risk.
+
+    Uses a precomputed recipe matrix, so no SQL over Recipes/ProductMasterData/product_sales
+    is needed. Quantities are normalised to base units (g, ml, each, ...).
+
+    Args:
+        start_date: First day of the sales window (YYYY-MM-DD). Defaults to 7 days before end_date.
+        end_date: Last day of the sales window (YYYY-MM-DD). Defaults to the latest sale date.
+        store_id: Optional store filter on historical sales (e.g. 'S001'). Empty means all stores.
+        product_quantities: Optional forecast as {ProductNumber: quantity} for the window.
+            When given, it is exploded instead of historical sales and store_id does not apply.
+
+    Returns:
+        str: A JSON string with per-ingredient demand, daily demand and expiry risk.
+    """
+    sales = load_table("product_sales")
+    try:
+        end = pd.Timestamp(end_date) if end_date else sales["SaleDate"].max()
+        start = pd.Timestamp(start_date) if start_date else end - pd.Timedelta(days=6)
+    except ValueError as e:
+        return json.dumps({"error": f"Invalid date (use YYYY-MM-DD): {e}"})
+    window_days = (end - start).days + 1
+
+    if product_quantities:
+        source = "forecast"
+    else:
+        source = "product_sales"
+        # Negative quantities are data-quality issues and excluded from aggregation.
+        mask = sales["SaleDate"].between(start, end) & (sales["SalesQuantity"] > 0)
+        if store_id:
+            mask &= sales["StoreID"] == store_id
+        product_quantities = sales[mask].groupby("ProductNumber")["SalesQuantity"].sum().to_dict()
+
+    demand = ingredient_demand(product_quantities, window_days)
+    data = {
+        "source": source,
+        **({} if source == "forecast" else {"store_id": store_id or "ALL"}),
+        "start_date": start.date().isoformat(),
+        "end_date": end.date().isoformat(),
+        "window_days": window_days,
+        "ingredients": demand.round(2).to_dict(orient="records"),
+    }
+    return json.dumps(data, indent=2)
+
+@mcp.tool()
+def get_projected_expiry(
+    scope: str = "store",
+    location_id: str = "",
+    product_number: str = "",
+    lookback_days: int = 90,
+    daily_demand: dict[str, float] | None = None,
+    limit: int = 50,
+) -> str:
+    """
+    Project how much of the current stock will expire unsold, batch by batch.
+
+    Demand is allocated to batches in first-expired-first-out order per location and
+    product, using historical sales rates or a supplied forecast.
+
+    Args:
+        scope: 'store' for StoreStock or 'distribution' for DistributionStock.
+        location_id: Optional StoreID / FacilityID filter (e.g. 'S001', 'DF001').
+        product_number: Optional ProductNumber filter (e.g. '1001').
+        lookback_days: Days of sales history used to estimate daily demand.
+        daily_demand: Optional forecast of units per day keyed by 'LOCATION:PRODUCT'
+            (e.g. {'S001:1001': 4.5}). Replaces historical rates when given.
+        limit: Maximum number of at-risk batches to return.
+
+    Returns:
+        str: A JSON string with totals and the batches projected to expire unsold,
+            ordered by expiry date.
+    """
+    table = "DistributionStock" if scope == "distribution" else "StoreStock"
+    location = LOCATION_COLUMNS[table]
+
+    forecast = None
+    if daily_demand:
+        keys = [tuple(key.split(":", 1)) for key in daily_demand]
+        forecast = pd.Series(list(daily_demand.values()), index=pd.MultiIndex.from_tuples(keys))
+
+    batches = projected_expiry(table, forecast, lookback_days)
+    if location_id:
+        batches = batches[batches[location] == location_id]
+    if product_number:
+        batches = batches[batches["ProductNumber"] == product_number]
+
+    at_risk = batches[batches["ProjectedUnsold"] > 0].sort_values(["ExpiryDate", "ProjectedUnsold"], ascending=[True, False])
+    at_risk = at_risk.head(limit).assign(ExpiryDate=at_risk["ExpiryDate"].dt.date.astype(str))
+    columns = [location, "ProductNumber", "BatchNumber", "ExpiryDate", "DaysUntilExpiry",
+               "Quantity", "DailyDemand", "ProjectedSold", "ProjectedUnsold"]
+
+    data = {
+        "scope": scope,
+        "demand_source": "forecast" if forecast is not None else f"product_sales (last {lookback_days} days)",
+        "total_units": int(batches["Quantity"].sum()),
+        "projected_unsold_units": round(float(batches["ProjectedUnsold"].sum()), 1),
+        "batches_at_risk": int((batches["ProjectedUnsold"] > 0).sum()),
+        "batches": at_risk[columns].round(2).to_dict(orient="records"),
+    }
+    return json.dumps(data, indent=2)
+
+@mcp.tool()
+def get_expiring_stock(
+    max_days: int = 3,
+    store_id: str = "",
+    city: str = "",
+    category: str = "",
+    scope: str = "",
+    limit: int = 50,
+) -> str:
+    """
+    List store and distribution batches by expiry urgency from the in-memory expiry index.
+
+    Items are ordered soonest-expiring first and tagged EXPIRED (<=0 days), CRITICAL (<=1),
+    URGENT (<=2) or WARNING (<=3).
+
+    Args:
+        max_days: Include batches expiring within this many days. Use -1 for no bound
+            (top-N soonest-expiring batches).
+        store_id: Optional StoreID or FacilityID filter (e.g. 'S001', 'DF001').
+        city: Optional city filter (e.g. 'London').
+        category: Optional ProductCategory filter (e.g. 'Chicken Parts').
+        scope: Optional 'store' or 'distribution' filter. Empty means both.
+        limit: Maximum number of batches to return.
+
+    Returns:
+        str: A JSON string with bucket counts and the matching batches.
+    """
+    index = get_expiry_index()
+    batches = index.query(
+        max_days=None if max_days < 0 else max_days,
+        limit=limit,
+        location_id=store_id,
+        city=city,
+        category=category,
+        source=scope,
+    )
+    for batch in batches:
+        del batch["ExpiryOrdinal"]
+
+    counts = {}
+    for batch in batches:
+        if batch["ExpiryStatus"]:
+            counts[batch["ExpiryStatus"]] = counts.get(batch["ExpiryStatus"], 0) + 1
+
+    data = {
+        "filters": {"max_days": max_days, "store_id": store_id, "city": city, "category": category, "scope": scope},
+        "returned_status_counts": counts,
+        "overall_status_counts": index.bucket_counts(),
+        "batches": batches,
+    }
+    return json.dumps(data, indent=2)
+
+@mcp.tool()
+async def get_store_snapshot(store_id: str) -> str:
+    """
+    Get a one-call overview of a store: stock, items expiring soon, freezer/fridge
+    temperatures, recent sales and customer feedback for the products it stocks.
+
+    The lookups run concurrently, so this replaces separate stock, expiry,
+    temperature and feedback calls when asked "how is store X doing?".
+
+    Args:
+        store_id: The StoreID (e.g. 'S001') or part of the store name (e.g. 'London Central').
+
+    Returns:
+        str: A JSON string with one section per lookup and per-section timings.
+    """
+    return json.dumps(await build_store_snapshot(store_id), indent=2, default=str)
+
+@mcp.tool()
+def get_site_distances(origin: str, destinations: str = "", kind: str = "", limit: int = 5) -> str:
+    """
+    Rank stores and distribution facilities by estimated road distance and drive time from a site.
+
+    Answers "nearest distribution centre", "closest stores to X" and transfer-ranking
+    questions from a precomputed matrix without any Maps call. Distances are
+    approximate (straight-line distance times a calibrated road factor); use Maps
+    only for the final chosen route.
+
+    Args:
+        origin: StoreID or FacilityID (e.g. 'S005', 'DF001'), or part of the site name.
+        destinations: Optional comma-separated site IDs or names to rank. Empty means all sites.
+        kind: Optional 'store' or 'facility' filter on the destinations.
+        limit: Maximum number of sites to return (0 for all).
+
+    Returns:
+        str: A JSON string with the origin, the estimation parameters and the ranked sites
+            (RoadKm, DriveMinutes, StraightKm), nearest first.
+    """
+    kind = kind.lower().strip()
+    if kind not in ("", "store", "facility"):
+        return json.dumps({"error": f"Unknown kind: {kind!r} (use 'store', 'facility' or leave it empty)"})
+    directory = site_directory()
+    origin_id = resolve_site(origin, directory)
+    if origin_id is None:
+        return json.dumps({"error": f"Unknown store or facility: {origin}"})
+    targets = None
+    if destinations.strip():
+        names = [value.strip() for value in destinations.split(",") if value.strip()]
+        targets = [resolve_site(name, directory) for name in names]
+        unknown = [name for name, site in zip(names, targets) if site is None]
+        if unknown:
+            return json.dumps({"error": f"Unknown stores or facilities: {unknown}"})
+
+    matrix = get_route_matrix()
+    sites = matrix.nearest(origin_id, kind=kind, destinations=targets, limit=limit)
+    for site in sites:
+        site.update(directory.get(site["SiteID"], {}))
+    data = {
+        "origin": {"SiteID": origin_id, **directory[origin_id]},
+        "estimate": {"road_factor": round(matrix.road_factor, 3), "speed_kmh": round(matrix.speed_kmh, 1),
+                     "calibrated": bool(matrix.calibration)},
+        "sites": sites,
+    }
+    return json.dumps(data, indent=2)
+
+@mcp.tool()
+async def get_dataset_schema(table: str = "") -> str:
+    """
+    Get the columns and types of the dataset's tables and views from a local snapshot.
+
+    Use this instead of list_table_ids / get_table_info; it answers without a
+    BigQuery round trip and includes the views (store_stock_current, ...).
+    Views whose columns cannot be resolved locally have `columns: null`; look
+    those up with get_table_info.
+
+    Args:
+        table: Optional table or view name (case-insensitive). Empty returns all of them.
+
+    Returns:
+        str: A JSON string with the snapshot version and one entry per table.
+    """
+    # With SCHEMA_SOURCE=bigquery a version check or rebuild queries BigQuery.
+    snapshot = await asyncio.to_thread(get_schema_snapshot)
+    tables = [t for t in snapshot["tables"] if not table or t["name"].lower() == table.lower()]
+    data = {"version": snapshot["version"], "source": snapshot["source"], "tables": tables}
+    if table and not tables:
+        data["error"] = f"No table or view named '{table}'."
+    return json.dumps(data, indent=2)
+
+async def _query_result(name: str, **params) -> str:
+    # BigQuery-backed queries block for the job's duration; keep the server loop free.
+    rows = await asyncio.to_thread(run_query, name, **params)
+    data = {"query": name, "backend": QUERY_BACKEND, "parameters": params, "row_count": len(rows), "rows": rows}
+    return json.dumps(data, indent=2, default=str)
+
+@mcp.tool()
+async def product_catalog(category: str = "", limit: int = 100) -> str:
+    """
+    List the chicken product catalogue (ProductMasterData) without writing SQL.
+
+    Args:
+        category: Optional ProductCategory filter, matched fuzzily (e.g. 'whole bird').
+        limit: Maximum number of products to return.
+
+    Returns:
+        str: A JSON string with ProductNumber, ProductDescription, ProductCategory,
+            ShelfLifeDays and StorageRequirements per product.
+    """
+    return await _query_result("product_catalog", category=category, limit=limit)
+
+@mcp.tool()
+async def stock_for(store: str = "", product: str = "", limit: int = 100) -> str:
+    """
+    Current store stock batches (store_stock_current) for a store and/or product, soonest expiry first.
+
+    Args:
+        store: StoreID (e.g. 'S001') or part of the store name (e.g. 'London Central'). Empty means all stores.
+        product: ProductNumber (e.g. '1001') or part of the description (e.g. 'whole roasted'). Empty means all products.
+        limit: Maximum number of batches to return.
+
+    Returns:
+        str: A JSON string with store, product, quantity, expiry date, days until expiry,
+            batch number and storage location per batch.
+    """
+    return await _query_result("stock_for", store=store, product=product, limit=limit)
+
+@mcp.tool()
+async def expiring_within(days: int = 3, store: str = "", limit: int = 100) -> str:
+    """
+    Store stock batches expiring within `days` days, most urgent first, with ExpiryStatus.
+
+    Args:
+        days: Include batches with DaysUntilExpiry <= days (0 means expired or expiring today).
+        store: Optional StoreID or part of the store name.
+        limit: Maximum number of batches to return.
+
+    Returns:
+        str: A JSON string with batches tagged EXPIRED, CRITICAL, URGENT or WARNING.
+    """
+    return await _query_result("expiring_within", days=days, store=store, limit=limit)
+
+@mcp.tool()
+async def sales_by_product(start_date: str = "", end_date: str = "", store: str = "", limit: int = 100) -> str:
+    """
+    Sales totals per product (product_sales joined with ProductMasterData), highest revenue first.
+
+    Rows with negative SalesQuantity are data-quality issues and are excluded.
+
+    Args:
+        start_date: First day (YYYY-MM-DD). Defaults to 29 days before end_date.
+        end_date: Last day (YYYY-MM-DD). Defaults to the latest sale date.
+        store: Optional StoreID filter (e.g. 'S001').
+        limit: Maximum number of products to return.
+
+    Returns:
+        str: A JSON string with TotalQuantity, TotalRevenue and AveragePrice per product.
+    """
+    return await _query_result("sales_by_product", start_date=start_date, end_date=end_date, store=store, limit=limit)
+
+@mcp.tool()
+async def feedback_for(product: str = "", limit: int = 100) -> str:
+    """
+    Customer feedback linked to products (customer_feedback_with_products), lowest rating first.
+
+    Args:
+        product: ProductNumber (e.g. '1001') or part of the description. Empty means all products.
+        limit: Maximum number of reviews to return.
+
+    Returns:
+        str: A JSON string with ProductNumber, ProductDescription, customer, date, rating and comment.
+    """
+    return await _query_result("feedback_for", product=product, limit=limit)
+
 if __name__ == "__main__":
     # Stdio is the default transport for FastMCP
     mcp.run()
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+
+import pandas as pd
+
+from mcp_server.data import current_stock, load_table
+from mcp_server.expiry_index import get_expiry_index
+from mcp_server.iot import read_store_temperature
+
+logger = logging.getLogger("mcp_server")
+
+
+def find_store(store: str) -> dict | None:
+    """Resolves a StoreID (e.g. 'S001') or a fuzzy store name (e.g. 'london central') to a Stores row."""
+    stores = load_table("Stores")
+    match = stores[stores["StoreID"].str.lower() == store.strip().lower()]
+    if match.empty:
+        match = stores[stores["StoreName"].str.lower().str.contains(store.strip().lower(), regex=False)]
+    if match.empty:
+        return None
+    return match.iloc[0].to_dict()
+
+
+def store_stock_summary(store_id: str) -> dict:
+    """Current stock totals for a store, per product."""
+    stock = current_stock("StoreStock")
+    stock = stock[stock["StoreID"] == store_id]
+    products = load_table("ProductMasterData")[["ProductNumber", "ProductDescription"]]
+    per_product = (
+        stock.groupby("ProductNumber")
+        .agg(Quantity=("Quantity", "sum"), Batches=("BatchNumber", "nunique"), EarliestExpiryDays=("DaysUntilExpiry", "min"))
+        .reset_index()
+        .merge(products, on="ProductNumber")
+    )
+    return {
+        "total_units": int(stock["Quantity"].sum()),
+        "low_stock_products": per_product.loc[per_product["Quantity"] < 10, "ProductDescription"].tolist(),
+        "products": per_product.to_dict(orient="records"),
+    }
+
+
+def store_expiring(store_id: str, max_days: int = 3) -> dict:
+    """Batches in a store expiring within `max_days`, from the expiry index."""
+    batches = get_expiry_index().query(max_days=max_days, location_id=store_id, source="store")
+    counts = {}
+    for batch in batches:
+        counts[batch["ExpiryStatus"]] = counts.get(batch["ExpiryStatus"], 0) + 1
+    return {
+        "status_counts": counts,
+        "batches": [
+            {k: batch[k] for k in ("ProductDescription", "Quantity", "ExpiryDate", "DaysUntilExpiry", "ExpiryStatus", "BatchNumber")}
+            for batch in batches
+        ],
+    }
+
+
+def store_sales_summary(store_id: str, days: int = 30) -> dict:
+    """Sales KPIs for a store over the last `days` days of sales history."""
+    sales = load_table("product_sales")
+    end = sales["SaleDate"].max()
+    start = end - pd.Timedelta(days=days - 1)
+    recent = sales[(sales["StoreID"] == store_id) & sales["SaleDate"].between(start, end) & (sales["SalesQuantity"] > 0)]
+    products = load_table("ProductMasterData")[["ProductNumber", "ProductDescription"]]
+    top = (
+        recent.groupby("ProductNumber")["TotalRevenue"].sum().nlargest(3).reset_index()
+        .merge(products, on="ProductNumber")
+    )
+    return {
+        "start_date": start.date().isoformat(),
+        "end_date": end.date().isoformat(),
+        "total_quantity": int(recent["SalesQuantity"].sum()),
+        "total_revenue": round(float(recent["TotalRevenue"].sum()), 2),
+        "top_products_by_revenue": top.round(2).to_dict(orient="records"),
+    }
+
+
+def product_feedback_summary(product_numbers: list) -> dict:
+    """Ratings for the given products, matching CustomerFeedback.ProductName fuzzily like the feedback view."""
+    feedback = load_table("CustomerFeedback")
+    products = load_table("ProductMasterData")
+    products = products[products["ProductNumber"].isin(product_numbers)]
+
+    rows = []
+    for product in products.itertuples():
+        description = product.ProductDescription.lower()
+        matched = feedback[[name.lower() in description for name in feedback["ProductName"]]]
+        if matched.empty:
+            continue
+        rows.append({
+            "ProductNumber": product.ProductNumber,
+            "ProductDescription": product.ProductDescription,
+            "Reviews": len(matched),
+            "AverageRating": round(float(matched["Rating"].mean()), 2),
+            "NegativeReviews": int((matched["Rating"] <= 2).sum()),
+        })
+    return {"products": sorted(rows, key=lambda row: row["AverageRating"])}
+
+
+async def _timed(name: str, func, *args) -> tuple:
+    # Local engines are synchronous pandas code; run them off the event loop.
+    started = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(func, *args)
+    except Exception as e:
+        logger.error(f"Store snapshot section '{name}' failed: {e}")
+        result = {"error": str(e)}
+    return name, result, round((time.perf_counter() - started) * 1000, 1)
+
+
+async def build_store_snapshot(store: str) -> dict:
+    """
+    Gathers stock, expiring batches, temperatures, sales and feedback for one store concurrently.
+
+    Args:
+        store: StoreID or (partial) store name.
+
+    Returns:
+        dict: One section per lookup plus per-section timings in milliseconds.
+    """
+    row = find_store(store)
+    if row is None:
+        return {"error": f"No store matches '{store}'."}
+    store_id = row["StoreID"]
+    stocked = current_stock("StoreStock")
+    stocked = stocked.loc[stocked["StoreID"] == store_id, "ProductNumber"].unique().tolist()
+
+    started = time.perf_counter()
+    sections = await asyncio.gather(
+        _timed("stock", store_stock_summary, store_id),
+        _timed("expiring_soon", store_expiring, store_id),
+        _timed("temperature", read_store_temperature, store_id),
+        _timed("sales_last_30_days", store_sales_summary, store_id),
+        _timed("feedback", product_feedback_summary, stocked),
+    )
+
+    snapshot = {
+        "store": {k: row[k] for k in ("StoreID", "StoreName", "City", "Postcode")},
+        "as_of": pd.Timestamp.today().date().isoformat(),
+    }
+    timings = {}
+    for name, result, elapsed_ms in sections:
+        snapshot[name] = result
+        timings[name] = elapsed_ms
+    snapshot["timings_ms"] = {**timings, "total": round((time.perf_counter() - started) * 1000, 1)}
+    return snapshot
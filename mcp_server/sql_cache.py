@@ -0,0 +1,425 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Callable, Optional
+
+from mcp_server.toolsets import WrappedTool, WrappingToolset
+
+logger = logging.getLogger("mcp_server")
+
+# BigQuery MCP tools whose results are cached. SQL tools map to the argument holding the query.
+SQL_TOOLS = {"execute_sql": "query"}
+METADATA_TOOLS = {"list_dataset_ids", "get_dataset_info", "list_table_ids", "get_table_info"}
+
+# Version key used for metadata lookups and for tables the version provider does not know.
+DATASET = "*"
+
+_TOKEN = re.compile(
+    r"""(?P<string>'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*"|`[^`]*`)"""
+    r"""|(?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)"""
+    r"""|(?P<space>\s+)"""
+    r"""|(?P<word>\w+)"""
+    r"""|(?P<other>.)""",
+    re.S,
+)
+_KEYWORDS = {
+    "select", "from", "where", "join", "inner", "left", "right", "full", "outer", "cross", "on", "using",
+    "group", "by", "order", "having", "limit", "offset", "as", "and", "or", "not", "in", "is", "null",
+    "like", "between", "case", "when", "then", "else", "end", "distinct", "union", "all", "with", "asc",
+    "desc", "over", "partition", "qualify", "interval", "day", "cast", "true", "false", "exists",
+}
+# Results of these are not reproducible, so queries using them bypass the cache.
+_NONDETERMINISTIC = {"rand", "current_timestamp", "current_time", "now", "generate_uuid", "session_user"}
+_READ_ONLY = {"select", "with"}
+
+
+def _tokens(sql: str):
+    for match in _TOKEN.finditer(sql):
+        yield match.lastgroup, match.group()
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical form of a query for cache keys.
+
+    Comments are dropped, whitespace is collapsed and keywords are upper-cased.
+    String literals and identifiers are kept verbatim (BigQuery table names
+    are case-sensitive).
+    """
+    parts = []
+    for kind, text in _tokens(sql):
+        if kind in ("comment", "space"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        elif kind == "word" and text.lower() in _KEYWORDS:
+            parts.append(text.upper())
+        else:
+            parts.append(text)
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def canonical_args(tool_name: str, args: dict) -> str:
+    """Canonical form of a call's arguments: sorted keys, trimmed strings, normalized SQL."""
+    canonical = {key: value.strip() if isinstance(value, str) else value for key, value in args.items()}
+    if tool_name in SQL_TOOLS and isinstance(canonical.get(SQL_TOOLS[tool_name]), str):
+        canonical[SQL_TOOLS[tool_name]] = normalize_sql(canonical[SQL_TOOLS[tool_name]])
+    return json.dumps(canonical, sort_keys=True, default=str)
+
+
+def referenced_words(sql: str) -> set:
+    """Identifier parts of a query (outside string literals), e.g. 'StoreStock' from `p.d.StoreStock`."""
+    words = set()
+    for kind, text in _tokens(sql):
+        if kind == "word":
+            words.add(text)
+        elif kind == "string" and text.startswith("`"):
+            words.update(re.findall(r"[\w-]+", text))
+    return words
+
+
+def _first_word(sql: str) -> str:
+    for kind, text in _tokens(sql):
+        if kind == "word":
+            return text.lower()
+    return ""
+
+
+def bigquery_table_versions(project_id: str, dataset_id: str) -> Callable[[], dict]:
+    """
+    Returns a version provider reading table last-modified times from `__TABLES__`.
+
+    Views report their definition time, not when their data changed, so they
+    get the dataset version (the newest table change) instead.
+    """
+    query = f"SELECT table_id, last_modified_time, type FROM `{project_id}.{dataset_id}.__TABLES__`"
+    client = None
+
+    def versions() -> dict:
+        nonlocal client
+        if client is None:
+            # Created on first use: building a client resolves credentials.
+            from google.cloud import bigquery
+            client = bigquery.Client(project=project_id)
+        rows = list(client.query(query).result())
+        tables = {row.table_id: row.last_modified_time for row in rows if row.type != 2}
+        dataset_version = max(tables.values(), default=0)
+        result = {row.table_id: tables.get(row.table_id, dataset_version) for row in rows}
+        result[DATASET] = dataset_version
+        return result
+
+    return versions
+
+
+class SqlResultCache:
+    """
+    LRU cache of BigQuery MCP results keyed by normalized SQL and table versions.
+
+    A key combines the normalized query, the last-modified version of every
+    table it references and the current date (the views rebase on
+    CURRENT_DATE). Changed tables therefore miss naturally; `invalidate`
+    drops entries for a table explicitly. Entries evicted from memory are
+    spilled to `spill_dir` when set, and read back on a later miss; the async
+    `lookup` and `store` do that disk IO in a worker thread.
+
+    Table versions come from `version_provider`, polled in the background at
+    most every `version_ttl` seconds so hits never wait on BigQuery. A failed
+    load is retried after `version_ttl`; until then calls key on what is known.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024,
+                 version_provider: Optional[Callable[[], dict]] = None, version_ttl: float = 60.0,
+                 spill_dir: Optional[str] = None, max_spill_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.max_spill_bytes = max_spill_bytes
+        self._version_provider = version_provider
+        self._versions = {}
+        self._versions_at = None
+        self._versions_failed_at = None
+        self._version_refresh: Optional[asyncio.Task] = None
+        self._generations = defaultdict(int)  # table -> explicit invalidation count
+        self._entries = OrderedDict()  # key -> (result, tables, size)
+        self._keys_by_table = defaultdict(set)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+        if self.spill_dir:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+    # --- Versions -------------------------------------------------------
+
+    def _load_versions(self):
+        started = time.perf_counter()
+        try:
+            versions = self._version_provider()
+        except Exception as e:
+            # Retried after version_ttl rather than by every call in the meantime.
+            self._versions_failed_at = time.monotonic()
+            logger.warning(f"SQL cache: could not load table versions: {e}")
+            return
+        with self._lock:
+            for table, version in versions.items():
+                # The dataset version moves with every table; entries keyed on it get new keys anyway.
+                if table != DATASET and table in self._versions and self._versions[table] != version:
+                    self._drop_table(table)
+            self._versions = versions
+            self._versions_at = time.monotonic()
+        logger.info(f"SQL cache: loaded {len(versions)} table versions in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    async def refresh_versions(self):
+        """Ensures table versions are loaded; refreshes stale versions in the background."""
+        if self._version_provider is None:
+            return
+        stale = self._versions_at is None or time.monotonic() - self._versions_at > self.version_ttl
+        if not stale:
+            return
+        if self._versions_failed_at is not None and time.monotonic() - self._versions_failed_at < self.version_ttl:
+            return
+        if self._version_refresh is None or self._version_refresh.done():
+            self._version_refresh = asyncio.create_task(asyncio.to_thread(self._load_versions))
+        if self._versions_at is None:
+            # Nothing to key on yet: wait for the first load.
+            await asyncio.shield(self._version_refresh)
+
+    # --- Keys -----------------------------------------------------------
+
+    def key_for(self, tool_name: str, args: dict) -> Optional[tuple]:
+        """
+        Returns (cache key, referenced tables) for a call, or None if it must not be cached.
+        """
+        if tool_name in SQL_TOOLS:
+            sql = args.get(SQL_TOOLS[tool_name], "")
+            words = referenced_words(sql)
+            if _first_word(sql) not in _READ_ONLY or {w.lower() for w in words} & _NONDETERMINISTIC:
+                return None
+            # Without versions, every identifier is treated as a possible table so
+            # that per-table invalidation still reaches the entry.
+            known = self._versions.keys() - {DATASET} if self._versions else {w for w in words if w.lower() not in _KEYWORDS}
+            tables = sorted(words & known) or [DATASET]
+            statement = normalize_sql(sql)
+            call = {k: v for k, v in args.items() if k != SQL_TOOLS[tool_name]}
+        elif tool_name in METADATA_TOOLS:
+            tables = [args["tableId"]] if args.get("tableId") else [DATASET]
+            statement, call = "", args
+        else:
+            return None
+
+        versions = [
+            (table, self._versions.get(table, self._versions.get(DATASET)), self._generations.get(table, 0))
+            for table in tables
+        ]
+        material = json.dumps(
+            [tool_name, statement, call, versions, self._generations.get(DATASET, 0), datetime.date.today().isoformat()],
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(material.encode()).hexdigest(), tables
+
+    # --- Storage --------------------------------------------------------
+
+    def get(self, key: str):
+        result = self._get_memory(key)
+        return result if result is not None else self._get_spilled(key)
+
+    async def lookup(self, key: str):
+        """`get`, with the spill directory read off the event loop."""
+        result = self._get_memory(key)
+        if result is not None:
+            return result
+        if not self.spill_dir:
+            self.counters["misses"] += 1
+            return None
+        return await asyncio.to_thread(self._get_spilled, key)
+
+    def _get_memory(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            self.counters["memory_hits"] += 1
+            return entry[0]
+
+    def _get_spilled(self, key: str):
+        spilled = self._read_spill(key)
+        if spilled is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        self.counters["disk_hits"] += 1
+        self.put(key, spilled["tables"], spilled["result"])
+        return spilled["result"]
+
+    def put(self, key: str, tables: list, result):
+        for evicted in self._put_memory(key, tables, result):
+            self._write_spill(*evicted)
+
+    async def store(self, key: str, tables: list, result):
+        """`put`, with evicted entries spilled off the event loop."""
+        evicted = self._put_memory(key, tables, result)
+        if evicted and self.spill_dir:
+            await asyncio.to_thread(lambda: [self._write_spill(*entry) for entry in evicted])
+
+    def _put_memory(self, key: str, tables: list, result) -> list:
+        """Stores an entry in memory; returns the evicted entries as (key, tables, result)."""
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, tables, size)
+            self._bytes += size
+            for table in tables:
+                self._keys_by_table[table].add(key)
+            evicted = []
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                old_key, (old_result, old_tables, _) = next(iter(self._entries.items()))
+                self._remove(old_key)
+                self.counters["evictions"] += 1
+                evicted.append((old_key, old_tables, old_result))
+        return evicted
+
+    def _remove(self, key: str):
+        _, tables, size = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            self._keys_by_table[table].discard(key)
+
+    def _drop_table(self, table: str) -> int:
+        # Caller holds self._lock.
+        keys = list(self._keys_by_table.pop(table, ()))
+        if table == DATASET:
+            keys = list(self._entries)
+        for key in keys:
+            if key in self._entries:
+                self._remove(key)
+        return len(keys)
+
+    def invalidate(self, table: Optional[str] = None) -> int:
+        """
+        Drops cached results that depend on `table` (all results when None).
+
+        Spilled entries become unreachable because the table's generation is
+        part of the key.
+
+        Returns:
+            int: Number of in-memory entries dropped.
+        """
+        table = table or DATASET
+        with self._lock:
+            self._generations[table] += 1
+            dropped = self._drop_table(table)
+        self.counters["invalidations"] += 1
+        logger.info(f"SQL cache: invalidated {table} ({dropped} entries)")
+        return dropped
+
+    def invalidate_written(self, tool_name: str, args: dict):
+        """Drops cached results for the tables a DML/DDL call may have changed."""
+        if tool_name not in SQL_TOOLS:
+            return
+        sql = args.get(SQL_TOOLS[tool_name], "")
+        if _first_word(sql) not in _READ_ONLY:
+            for table in referenced_words(sql) & self.tables():
+                self.invalidate(table)
+
+    def _spill_path(self, key: str) -> Path:
+        return self.spill_dir / f"{key}.json"
+
+    def _write_spill(self, key: str, tables: list, result):
+        if not self.spill_dir:
+            return
+        try:
+            path = self._spill_path(key)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"tables": tables, "result": result}, default=str))
+            os.replace(tmp, path)
+            self.counters["spills"] += 1
+            self._prune_spill()
+        except OSError as e:
+            logger.warning(f"SQL cache: could not spill entry to disk: {e}")
+
+    def _read_spill(self, key: str):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        path.unlink(missing_ok=True)
+        return data
+
+    def _prune_spill(self):
+        files = sorted(self.spill_dir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        for path in files:
+            if total <= self.max_spill_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+    def tables(self) -> set:
+        """Table names the cache currently holds entries or versions for."""
+        with self._lock:
+            return ({t for t, keys in self._keys_by_table.items() if keys} | self._versions.keys()) - {DATASET}
+
+    def stats(self) -> dict:
+        """Hit-rate metrics and current size."""
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "tables_versioned": len(self._versions),
+        }
+
+
+class CachedTool(WrappedTool):
+    """Serves repeated BigQuery MCP calls from a `SqlResultCache`."""
+
+    def __init__(self, tool, cache: SqlResultCache):
+        super().__init__(tool)
+        self.cache = cache
+
+    async def run_async(self, *, args: dict, tool_context):
+        await self.cache.refresh_versions()
+        keyed = self.cache.key_for(self.name, args)
+        if keyed is None:
+            self.cache.counters["bypassed"] += 1
+            result = await self.tool.run_async(args=args, tool_context=tool_context)
+            self.cache.invalidate_written(self.name, args)
+            return result
+
+        key, tables = keyed
+        result = await self.cache.lookup(key)
+        if result is not None:
+            return result
+        result = await self.tool.run_async(args=args, tool_context=tool_context)
+        if isinstance(result, dict) and not result.get("isError") and "error" not in result:
+            await self.cache.store(key, tables, result)
+        return result
+
+
+class SqlCachingToolset(WrappingToolset):
+    """Wraps the BigQuery MCP toolset so SQL and metadata calls go through a result cache."""
+
+    def __init__(self, toolset, cache: SqlResultCache):
+        super().__init__(toolset)
+        self.cache = cache
+
+    def wrap_tool(self, tool):
+        if tool.name in SQL_TOOLS or tool.name in METADATA_TOOLS:
+            return CachedTool(tool, self.cache)
+        return tool
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import List, Optional
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.mcp_tool.mcp_session_manager import retry_on_closed_resource
+from google.adk.tools.mcp_tool.mcp_tool import MCPTool
+from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
+from mcp import types
+
+logger = logging.getLogger("mcp_server")
+
+PROJECT_ROOT = Path(__file__).parent.parent
+TOOL_SCHEMA_CACHE_PATH = os.getenv("TOOL_SCHEMA_CACHE_PATH", str(PROJECT_ROOT / ".cache" / "tool_schemas.json"))
+# Seconds after which cached tool schemas are revalidated against the server (in the background).
+TOOL_SCHEMA_TTL = float(os.getenv("TOOL_SCHEMA_TTL", "3600"))
+
+# Server capability -> ClientSession method listing it.
+LISTINGS = {"tools": "list_tools", "resources": "list_resources", "prompts": "list_prompts"}
+
+
+def server_key(connection_params) -> str:
+    """Identifies an MCP server: its URL, or the command line of a stdio server."""
+    url = getattr(connection_params, "url", None)
+    if url:
+        return url
+    server_params = getattr(connection_params, "server_params", connection_params)
+    return "stdio:" + " ".join([server_params.command, *server_params.args])
+
+
+def supports(capabilities: Optional[types.ServerCapabilities], capability: str) -> bool:
+    """Whether the server advertised `capability` during initialization."""
+    return capabilities is not None and getattr(capabilities, capability, None) is not None
+
+
+async def list_supported(session, capability: str, timeout: Optional[float] = None) -> list:
+    """
+    Lists a server's tools, resources or prompts, following pagination.
+
+    MCP clients must only use features the server advertised when the session
+    was initialized. Servers that do not advertise `capability` get no request
+    (some, like the BigQuery MCP server, answer unsupported list methods with
+    400 Bad Request) and an empty list is returned.
+    """
+    if not supports(session.get_server_capabilities(), capability):
+        return []
+    method = getattr(session, LISTINGS[capability])
+    items, cursor = [], None
+    while True:
+        params = types.PaginatedRequestParams(cursor=cursor) if cursor else None
+        result = await asyncio.wait_for(method(params=params), timeout=timeout)
+        items.extend(getattr(result, capability))
+        cursor = result.nextCursor
+        if not cursor:
+            return items
+
+
+def _fingerprint(capabilities: dict, tools: list) -> str:
+    text = json.dumps([capabilities, tools], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class ToolSchemaCache:
+    """
+    On-disk cache of MCP tool schemas, keyed by server.
+
+    Each entry holds the server's advertised capabilities, its tool
+    definitions, a fingerprint of both and when they were last validated.
+    The file is rewritten atomically on every change.
+    """
+
+    def __init__(self, path: Optional[str] = TOOL_SCHEMA_CACHE_PATH):
+        self.path = Path(path) if path else None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+        if self.path and self.path.exists():
+            try:
+                self._entries = json.loads(self.path.read_text())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable tool schema cache {self.path}: {e}")
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            self.counters["hits" if entry else "misses"] += 1
+            return entry
+
+    def put(self, key: str, capabilities: dict, tools: list) -> bool:
+        """Stores a server's schemas. Returns True if they differ from the cached ones."""
+        fingerprint = _fingerprint(capabilities, tools)
+        with self._lock:
+            previous = self._entries.get(key)
+            changed = previous is None or previous["fingerprint"] != fingerprint
+            self._entries[key] = {
+                "fingerprint": fingerprint,
+                "capabilities": capabilities,
+                "tools": tools,
+                "validated_at": time.time(),
+            }
+            self.counters["changes" if changed else "revalidated"] += 1
+            self._save()
+        return changed
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._entries, indent=1))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write tool schema cache {self.path}: {e}")
+
+    def stats(self) -> dict:
+        return {**self.counters, "servers": len(self._entries)}
+
+
+tool_schema_cache = ToolSchemaCache()
+
+
+class CachedSchemaMcpToolset(McpToolset):
+    """
+    An MCP toolset whose tool list comes from the schema cache.
+
+    `McpToolset.get_tools` opens a session and sends `tools/list` on every
+    call, i.e. before every model request. Here the schemas are served from
+    memory (loaded from the on-disk cache at first use), so the first turn
+    starts without the initialize/list handshake and later model requests
+    without any list round trip. Sessions are still opened lazily by the
+    first tool call.
+
+    The cached schemas are revalidated in the background on first use and
+    then every `ttl` seconds: the session is initialized, the negotiated
+    capabilities are recorded, and tools are listed only if the server
+    advertises them. Changed schemas replace the served ones and the cache
+    entry. Without a cache entry the first `get_tools` waits for this.
+
+    Args:
+        cache: The schema cache. Defaults to the shared on-disk cache.
+        ttl: Seconds before cached schemas are revalidated.
+        **kwargs: Passed to `McpToolset`.
+    """
+
+    def __init__(self, *, cache: Optional[ToolSchemaCache] = None, ttl: float = TOOL_SCHEMA_TTL, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache or tool_schema_cache
+        self.ttl = ttl
+        self.server_key = server_key(self._connection_params)
+        self.capabilities: Optional[types.ServerCapabilities] = None
+        self._tools: Optional[List[types.Tool]] = None
+        self._validated_at: Optional[float] = None  # monotonic time; None until validated in this process
+        self._revalidation: Optional[asyncio.Task] = None
+        self._loaded = False
+
+    def _load_cached(self):
+        self._loaded = True
+        entry = self.cache.get(self.server_key)
+        if entry is None:
+            return
+        self.capabilities = types.ServerCapabilities.model_validate(entry["capabilities"])
+        self._tools = [types.Tool.model_validate(tool) for tool in entry["tools"]]
+
+    def _headers(self, readonly_context: Optional[ReadonlyContext]):
+        return self._header_provider(readonly_context) if self._header_provider and readonly_context else None
+
+    async def revalidate(self, readonly_context: Optional[ReadonlyContext] = None) -> bool:
+        """Negotiates with the server and refreshes the schemas. Returns True if they changed."""
+        session = await self._mcp_session_manager.create_session(headers=self._headers(readonly_context))
+        timeout = getattr(self._connection_params, "timeout", None)
+        try:
+            tools = await list_supported(session, "tools", timeout=timeout)
+        except Exception as e:
+            raise ConnectionError("Failed to get tools from MCP server.") from e
+        self.capabilities = session.get_server_capabilities()
+        changed = self.cache.put(
+            self.server_key,
+            self.capabilities.model_dump(mode="json", exclude_none=True) if self.capabilities else {},
+            [tool.model_dump(mode="json", exclude_none=True) for tool in tools],
+        )
+        if changed and self._tools is not None:
+            logger.info(f"Tool schemas of {self.server_key} changed; serving the new ones.")
+        self._tools = tools
+        self._validated_at = time.monotonic()
+        return changed
+
+    async def _revalidate_in_background(self, readonly_context: Optional[ReadonlyContext]):
+        try:
+            await self.revalidate(readonly_context)
+        except Exception as e:
+            # Keep serving the cached schemas; retry on the next get_tools.
+            logger.warning(f"Could not revalidate tool schemas of {self.server_key}: {e}")
+
+    def _revalidating(self, readonly_context: Optional[ReadonlyContext]) -> asyncio.Task:
+        # Concurrent callers share one revalidation; tasks are bound to their loop.
+        task = self._revalidation
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._revalidation = asyncio.ensure_future(self._revalidate_in_background(readonly_context))
+        return task
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        if not self._loaded:
+            self._load_cached()
+        if self._tools is None:
+            await asyncio.shield(self._revalidating(readonly_context))
+            if self._tools is None:
+                raise ConnectionError(f"Failed to get tools from MCP server {self.server_key}.")
+        elif self._validated_at is None or time.monotonic() - self._validated_at > self.ttl:
+            self._revalidating(readonly_context)
+
+        tools = []
+        for tool in self._tools:
+            mcp_tool = MCPTool(
+                mcp_tool=tool,
+                mcp_session_manager=self._mcp_session_manager,
+                auth_scheme=self._auth_scheme,
+                auth_credential=self._auth_credential,
+                require_confirmation=self._require_confirmation,
+                header_provider=self._header_provider,
+            )
+            if self._is_tool_selected(mcp_tool, readonly_context):
+                tools.append(mcp_tool)
+        return tools
+
+    @retry_on_closed_resource
+    async def call_tool(self, name: str, arguments: dict) -> types.CallToolResult:
+        """
+        Calls a tool outside an agent invocation (e.g. from the MCP gateway).
+
+        Headers come from the header provider when there is one, so the pooled
+        session is re-authenticated when the token rotates.
+        """
+        headers = self._header_provider(None) if self._header_provider else None
+        session = await self._mcp_session_manager.create_session(headers=headers)
+        return await session.call_tool(name, arguments=arguments)
+
+    async def list_resources(self, readonly_context: Optional[ReadonlyContext] = None) -> list:
+        """The server's resources, or [] if it does not advertise the capability."""
+        session = await self._mcp_session_manager.create_session(headers=self._headers(readonly_context))
+        return await list_supported(session, "resources")
+
+    async def list_prompts(self, readonly_context: Optional[ReadonlyContext] = None) -> list:
+        """The server's prompts, or [] if it does not advertise the capability."""
+        session = await self._mcp_session_manager.create_session(headers=self._headers(readonly_context))
+        return await list_supported(session, "prompts")
+
+    async def close(self) -> None:
+        if self._revalidation is not None and not self._revalidation.done():
+            self._revalidation.cancel()
+        await super().close()
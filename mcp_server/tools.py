@@ -3,12 +3,12 @@ import random
 import uuid
 import json
 import httpx
-import google.auth
-import google.auth.transport.requests
-from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
 from google.adk.tools.mcp_tool.mcp_session_manager import StreamableHTTPConnectionParams 
 import logging
 
+from mcp_server.auth import get_bigquery_auth
+from mcp_server.tool_cache import CachedSchemaMcpToolset
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mcp_server")
@@ -25,10 +25,10 @@ def get_maps_mcp_toolset():
     including place search, directions, and distance calculations.
     
     Returns:
-        MCPToolset: A configured toolset instance for Maps.
+        CachedSchemaMcpToolset: A configured toolset instance for Maps.
     """
     logger.info("Configuring Maps MCP Toolset...")
-    tools = MCPToolset(
+    tools = CachedSchemaMcpToolset(
         connection_params=StreamableHTTPConnectionParams(
             url=MAPS_MCP_URL,
             headers={    
@@ -46,44 +46,60 @@ def get_bigquery_mcp_toolset():
     
     This toolset provides access to BigQuery datasets, tables, and query execution
     capabilities via MCP. It automatically handles OAuth2 authentication using
-    the environment's default credentials.
+    the environment's default credentials, refreshing the token before it expires.
     
     Returns:
-        MCPToolset: A configured toolset instance for BigQuery.
+        CachedSchemaMcpToolset: A configured toolset instance for BigQuery.
     """
     logger.info("Configuring BigQuery MCP Toolset...")
     
-    # 1. Get default credentials (ADC)
-    # This automatically finds credentials from `gcloud auth application-default login`
-    # or the service account attached to the compute instance.
-    credentials, project_id = google.auth.default(
-            scopes=["https://www.googleapis.com/auth/bigquery"]
-    )
+    # 1. Get a shared, auto-refreshing header provider backed by ADC.
+    # Tokens are refreshed in the background before they expire, so the
+    # toolset keeps working in long-running servers without a restart.
+    auth = get_bigquery_auth()
 
-    # 2. Refresh credentials to get a valid access token
-    # We need the raw token to pass it in the Authorization header.
-    credentials.refresh(google.auth.transport.requests.Request())
-    oauth_token = credentials.token
-        
-    # 3. Construct Headers
-    # - Authorization: Bearer token for authentication
-    # - x-goog-user-project: Required for billing/quota attribution
-    HEADERS_WITH_OAUTH = {
-        "Authorization": f"Bearer {oauth_token}",
-        "x-goog-user-project": project_id
-    }
+    # 2. Fetch the first token now
+    # The static headers are only used by calls without an invocation context
+    # (e.g. startup warm-up); agent calls get fresh headers from the provider.
+    # Both yield the same headers until the token rotates, so the warm
+    # session is reused by the first turn.
+    HEADERS_WITH_OAUTH = auth.headers()
+    auth.start()
 
-    # 4. Initialize Toolset
+    # 3. Initialize Toolset
     # We use StreamableHTTPConnectionParams to connect to the remote MCP server.
-    tools = MCPToolset(
+    tools = CachedSchemaMcpToolset(
         connection_params=StreamableHTTPConnectionParams(
             url=BIGQUERY_MCP_URL,
             headers=HEADERS_WITH_OAUTH
-        )
+        ),
+        header_provider=auth
     )
     logger.info("BigQuery MCP Toolset configured.")
     return tools
 
+MCP_GATEWAY_URL = os.getenv("MCP_GATEWAY_URL", "")
+
+def get_gateway_mcp_toolset():
+    """
+    Configures and returns the toolset of the local MCP gateway (`mcp_server.gateway`).
+
+    The gateway fronts the Maps, BigQuery and local servers, so this one
+    connection replaces the three toolsets above. Upstream auth is held by the gateway.
+
+    Returns:
+        CachedSchemaMcpToolset: A configured toolset instance for the gateway.
+    """
+    logger.info(f"Configuring MCP Gateway Toolset ({MCP_GATEWAY_URL})...")
+    tools = CachedSchemaMcpToolset(
+        connection_params=StreamableHTTPConnectionParams(
+            url=MCP_GATEWAY_URL,
+            timeout=300.0 # A2A calls through the local server can take minutes
+        )
+    )
+    logger.info("MCP Gateway Toolset configured.")
+    return tools
+
 from mcp import StdioServerParameters
 from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
 
@@ -108,7 +124,7 @@ def get_local_mcp_toolset():
         timeout=300.0 # 5 minutes timeout for A2A LLM calls
     )
     
-    tools = MCPToolset(
+    tools = CachedSchemaMcpToolset(
         connection_params=connection_params
     )
     logger.info("Local MCP Toolset configured.")
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+
+logger = logging.getLogger("mcp_server")
+
+
+class LazyToolset(BaseToolset):
+    """
+    Defers building a toolset until it is first needed.
+
+    Toolset factories can do blocking work (e.g. fetching Google credentials),
+    so the factory runs on first use - or ahead of time, concurrently with the
+    other toolsets, via `warm_up_toolsets`. Readiness is tracked per toolset.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], BaseToolset]):
+        super().__init__()
+        self.name = name
+        self._factory = factory
+        self._toolset: Optional[BaseToolset] = None
+        self._lock = threading.Lock()
+        self.status = "pending"  # pending -> building -> ready | failed
+        self.error: Optional[str] = None
+        self.build_seconds: Optional[float] = None
+        self.connect_seconds: Optional[float] = None
+
+    def resolve(self) -> BaseToolset:
+        """Builds the underlying toolset once (thread-safe) and returns it."""
+        if self._toolset is not None:
+            return self._toolset
+        with self._lock:
+            if self._toolset is None:
+                self.status = "building"
+                started = time.perf_counter()
+                try:
+                    self._toolset = self._factory()
+                except Exception as e:
+                    self.status, self.error = "failed", str(e)
+                    raise
+                finally:
+                    self.build_seconds = time.perf_counter() - started
+                self.status, self.error = "ready", None
+        return self._toolset
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        toolset = self._toolset or await asyncio.to_thread(self.resolve)
+        return await toolset.get_tools_with_prefix(readonly_context)
+
+    async def process_llm_request(self, *, tool_context, llm_request) -> None:
+        if self._toolset is not None:
+            await self._toolset.process_llm_request(tool_context=tool_context, llm_request=llm_request)
+
+    async def close(self) -> None:
+        if self._toolset is not None:
+            await self._toolset.close()
+
+    def readiness(self) -> dict:
+        return {
+            "status": self.status,
+            "build_ms": None if self.build_seconds is None else round(self.build_seconds * 1000, 1),
+            "connect_ms": None if self.connect_seconds is None else round(self.connect_seconds * 1000, 1),
+            "error": self.error,
+        }
+
+
+async def _warm_up_one(toolset: LazyToolset, connect: bool):
+    try:
+        await asyncio.to_thread(toolset.resolve)
+        if connect:
+            # Opens the MCP session and lists tools so the first turn finds a warm connection.
+            started = time.perf_counter()
+            await toolset.get_tools()
+            toolset.connect_seconds = time.perf_counter() - started
+    except Exception as e:
+        toolset.status, toolset.error = "failed", str(e)
+        logger.warning(f"Toolset '{toolset.name}' failed to warm up: {e}")
+
+
+async def warm_up_toolsets(toolsets: List[LazyToolset], connect: bool = False) -> dict:
+    """
+    Builds (and optionally connects) all toolsets concurrently.
+
+    Failures are recorded in the readiness report instead of raised, so one
+    unavailable upstream does not block the others.
+
+    Args:
+        toolsets: The lazy toolsets to initialise.
+        connect: Also open the MCP sessions and list tools.
+
+    Returns:
+        dict: Readiness per toolset name.
+    """
+    await asyncio.gather(*(_warm_up_one(toolset, connect) for toolset in toolsets))
+    return toolset_readiness(toolsets)
+
+
+def toolset_readiness(toolsets: List[LazyToolset]) -> dict:
+    """Returns status and timings for each toolset."""
+    return {toolset.name: toolset.readiness() for toolset in toolsets}
+
+
+class WrappedTool(BaseTool):
+    """
+    A tool that delegates to another tool.
+
+    Subclasses override `run_async` to add behaviour (caching, limits, ...)
+    around `self.tool`; the declaration the model sees is unchanged.
+    """
+
+    def __init__(self, tool: BaseTool):
+        super().__init__(
+            name=tool.name,
+            description=tool.description,
+            is_long_running=tool.is_long_running,
+            custom_metadata=tool.custom_metadata,
+        )
+        self.tool = tool
+
+    def _get_declaration(self):
+        return self.tool._get_declaration()
+
+    # process_llm_request is deliberately not delegated: the default registers
+    # `self` in the request's tools_dict, so function calls reach the wrapper.
+
+    async def run_async(self, *, args: dict, tool_context):
+        return await self.tool.run_async(args=args, tool_context=tool_context)
+
+
+class WrappingToolset(BaseToolset):
+    """Exposes the tools of an inner toolset, each wrapped by `wrap_tool`."""
+
+    def __init__(self, toolset: BaseToolset):
+        super().__init__()
+        self.toolset = toolset
+
+    def wrap_tool(self, tool: BaseTool) -> BaseTool:
+        return tool
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        tools = await self.toolset.get_tools_with_prefix(readonly_context)
+        return [self.wrap_tool(tool) for tool in tools]
+
+    async def process_llm_request(self, *, tool_context, llm_request) -> None:
+        await self.toolset.process_llm_request(tool_context=tool_context, llm_request=llm_request)
+
+    async def close(self) -> None:
+        await self.toolset.close()
+
+
+class LimitedTool(WrappedTool):
+    """A tool that takes a slot of its toolset's concurrency limit while it runs."""
+
+    def __init__(self, tool: BaseTool, limiter: "ConcurrencyLimitedToolset"):
+        super().__init__(tool)
+        self.limiter = limiter
+
+    async def run_async(self, *, args: dict, tool_context):
+        queued = time.perf_counter()
+        ok = False
+        async with self.limiter.semaphore():
+            started = time.perf_counter()
+            try:
+                result = await self.tool.run_async(args=args, tool_context=tool_context)
+                ok = not (isinstance(result, dict) and result.get("isError"))
+                return result
+            finally:
+                self.limiter.record({
+                    "toolset": self.limiter.name,
+                    "tool": self.name,
+                    "function_call_id": getattr(tool_context, "function_call_id", None),
+                    "queued_ms": round((started - queued) * 1000, 2),
+                    "run_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "ok": ok,
+                    "finished_at": time.time(),
+                })
+
+
+class ConcurrencyLimitedToolset(WrappingToolset):
+    """
+    Caps how many calls into one toolset run at the same time and times each call.
+
+    ADK already runs the function calls of one model response concurrently
+    (and returns the responses in request order); this bounds the fan-out per
+    upstream so a burst of parallel calls cannot overrun an MCP endpoint, and
+    records how long each call queued and ran.
+
+    Args:
+        toolset: The toolset to limit.
+        max_concurrency: Calls allowed in flight at once.
+        name: Label used in timings (defaults to the inner toolset's name).
+        history: Number of recent call timings kept in `timings`.
+    """
+
+    def __init__(self, toolset: BaseToolset, max_concurrency: int, name: Optional[str] = None, history: int = 1000):
+        super().__init__(toolset)
+        self.name = name or getattr(toolset, "name", type(toolset).__name__)
+        self.max_concurrency = max(1, max_concurrency)
+        self.timings = deque(maxlen=history)
+        self.listeners: List[Callable[[dict], None]] = []
+        self._semaphores = {}  # event loop -> asyncio.Semaphore
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # Semaphores bind to the loop they are first used on; keep one per loop.
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self._semaphores = {l: s for l, s in self._semaphores.items() if not l.is_closed()}
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def wrap_tool(self, tool: BaseTool) -> BaseTool:
+        return LimitedTool(tool, self)
+
+    def record(self, timing: dict):
+        self.timings.append(timing)
+        logger.debug(f"Tool call timing: {timing}")
+        for listener in self.listeners:
+            try:
+                listener(timing)
+            except Exception as e:
+                logger.warning(f"Tool timing listener failed: {e}")
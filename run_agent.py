@@ -1,65 +1,15 @@
-from chickens_app.agent import get_chickens_agent, bq_logging_plugin
-from google.adk.sessions import InMemorySessionService
-from google.adk.runners import Runner
-from google.genai import types
-import uuid
+from chickens_app.service import get_conversation_service
 
-APP_NAME = "chickens_app"
-USER_ID = "chickens_user_101"
 
+async def run_conversation(prompt: str, session_id: str | None = None):
+   """Runs a conversation with the chickens agent.
 
-async def run_conversation(prompt: str):
-   """Runs a conversation with the chickens agent using the ADK Runner."""
+   Uses the process-wide ConversationService, so the Runner, the session service
+   and the MCP connections are set up once and reused by every prompt.
+   Pass the returned `session_id` to continue the same conversation.
+   """
+   return await get_conversation_service().converse(prompt, session_id=session_id)
 
-   session_service = InMemorySessionService()
-   session_id = f"{APP_NAME}-{uuid.uuid4().hex[:8]}"
-   # get_chickens_agent now returns an App object with plugins configured
-   app = get_chickens_agent()
-
-   runner = Runner(
-       app=app, session_service=session_service
-   )
-   session = await session_service.create_session(
-       app_name=APP_NAME, user_id=USER_ID, session_id=session_id
-   )
-   final_response_text = "Unable to retrieve final response."
-   tool_calls = []
-
-   try:
-       # Run the agent and process the events as they are generated
-       async for event in runner.run_async(
-           user_id=USER_ID,
-           session_id=session_id,
-           new_message=types.Content(role="user", parts=[types.Part(text=prompt)]),
-       ):
-
-           if (
-               event.content
-               and event.content.parts
-               and event.content.parts[0].function_call
-           ):
-
-               func_call = event.content.parts[0].function_call
-
-               tool_call = {
-                   "tool_name": func_call.name,
-                   "tool_input": dict(func_call.args),
-               }
-               tool_calls.append(tool_call)
-
-           if event.is_final_response():
-               if event.content and event.content.parts:
-                   final_response_text = event.content.parts[0].text
-               break
-
-   except Exception as e:
-       print(f"Error in run_conversation: {e}")
-       final_response_text = f"An error occurred during the conversation: {e}"
-
-   return {
-       "response": final_response_text,
-       "predicted_trajectory": tool_calls
-   }
 
 if __name__ == "__main__":
     import asyncio
@@ -75,5 +25,6 @@ if __name__ == "__main__":
         print("\n--- Result ---")
         print(f"Response: {result['response']}")
         print(f"Tool Calls: {result['predicted_trajectory']}")
+        print(f"Latency: {result['latency']}")
 
     asyncio.run(main())
\ No newline at end of file
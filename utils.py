@@ -1,21 +1,125 @@
+import asyncio
 import json
 import os
-import asyncio
-import run_agent
+import random
+import time
+from chickens_app.service import get_conversation_service
 import numbers
 import math
 
+# Agent responses generated at once by the evaluation runner.
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "8"))
+# Conversations started per minute (0 = unlimited), to stay under model quotas.
+EVAL_RATE_PER_MINUTE = float(os.getenv("EVAL_RATE_PER_MINUTE", "0"))
+# Retries per prompt on transient failures (quota, unavailable, timeouts).
+EVAL_MAX_RETRIES = int(os.getenv("EVAL_MAX_RETRIES", "3"))
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+TRANSIENT_ERROR_NAMES = {"ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "ServerError"}
+
 
 def get_agent_response(prompt: str) -> dict:
    """Invokes the agent with a prompt and returns its response."""
 
    try:
-       response = asyncio.run(run_agent.run_conversation(prompt))  # Invoke the agent
+       # The shared service keeps its Runner and MCP sessions alive between prompts.
+       response = get_conversation_service().converse_sync(prompt)  # Invoke the agent
        return response
    except Exception as e:
        return {"response": "Error: Agent failed to produce a response."}
 
 
+def is_transient_error(error: Exception) -> bool:
+   """Whether an agent failure is worth retrying (quota, overload, timeouts, dropped connections)."""
+   if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+       return True
+   code = getattr(error, "code", None) or getattr(error, "status_code", None)
+   return code in TRANSIENT_STATUS_CODES or type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+
+class RateLimiter:
+   """Spaces out acquisitions so at most `rate_per_minute` happen per minute (0 = unlimited)."""
+
+   def __init__(self, rate_per_minute: float = EVAL_RATE_PER_MINUTE):
+       self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+       self._next = 0.0
+       self._lock = asyncio.Lock()
+
+   async def acquire(self):
+       if not self.interval:
+           return
+       async with self._lock:
+           now = time.monotonic()
+           wait = self._next - now
+           self._next = max(now, self._next) + self.interval
+       if wait > 0:
+           await asyncio.sleep(wait)
+
+
+async def generate_responses(
+   prompts: list,
+   concurrency: int = EVAL_CONCURRENCY,
+   rate_per_minute: float = EVAL_RATE_PER_MINUTE,
+   max_retries: int = EVAL_MAX_RETRIES,
+   service=None,
+) -> list:
+   """
+   Generates agent responses for all prompts concurrently, in prompt order.
+
+   All conversations run on the conversation service's event loop, at most
+   `concurrency` at a time and started at most `rate_per_minute` per minute.
+   Transient failures are retried with exponential backoff and jitter; a
+   prompt that still fails gets the same error response as `get_agent_response`.
+
+   Returns:
+       list: One dict per prompt with `response`, `predicted_trajectory`,
+           `latency`, `attempts` and `error` (None on success).
+   """
+   service = service or get_conversation_service()
+   await service.start()
+   semaphore = asyncio.Semaphore(max(concurrency, 1))
+   limiter = RateLimiter(rate_per_minute)
+   results = [None] * len(prompts)
+   done = 0
+   started = time.perf_counter()
+
+   async def generate(index: int, prompt: str):
+       nonlocal done
+       async with semaphore:
+           prompt_started = time.perf_counter()
+           for attempt in range(1, max_retries + 2):
+               await limiter.acquire()
+               try:
+                   result = await service.converse(prompt, raise_errors=True)
+                   result.update(attempts=attempt, error=None)
+                   break
+               except Exception as e:
+                   if attempt > max_retries or not is_transient_error(e):
+                       result = {
+                           "response": "Error: Agent failed to produce a response.",
+                           "predicted_trajectory": [],
+                           "latency": None,
+                           "attempts": attempt,
+                           "error": f"{type(e).__name__}: {e}",
+                       }
+                       break
+                   backoff = min(2 ** attempt, 30) * (0.5 + random.random())
+                   print(f"   ⏳ Prompt {index + 1} failed ({type(e).__name__}), retrying in {backoff:.1f}s")
+                   await asyncio.sleep(backoff)
+           result["wall_time"] = round(time.perf_counter() - prompt_started, 2)
+       results[index] = result
+       done += 1
+       status = "❌" if result["error"] else "✅"
+       print(f"   {status} [{done}/{len(prompts)}] {result['wall_time']:.1f}s  {prompt[:60]}")
+
+   await asyncio.gather(*(generate(index, prompt) for index, prompt in enumerate(prompts)))
+   failed = sum(1 for result in results if result["error"])
+   retried = sum(result["attempts"] - 1 for result in results)
+   print(f"⏱️  Generated {len(prompts)} responses in {time.perf_counter() - started:.1f}s "
+         f"(concurrency {concurrency}, {retried} retries, {failed} failed)")
+   return results
+
+
 def save_evaluation_results(eval_result, experiment_run):
    """Processes, saves, and prints the evaluation results for a single run."""
 